@@ -0,0 +1,157 @@
+"""One-time access codes for viewing the anonymous logs"""
+import asyncio
+import datetime
+import hashlib
+import heapq
+import hmac
+import secrets
+import time
+from typing import Callable, List, Optional, Tuple
+
+from storage import GuildStore, LazyGuildStore
+
+
+class AccessCodeRegistry:
+    """Live access codes per server, each expiring ``ttl`` seconds after it was issued.
+
+    Kept in a ``GuildStore`` as ``{guild_id: {"issued": N, "codes": {code ID: {...}}}}``.
+    Codes themselves are never stored: each is filed under an ID derived from
+    it with SHA-256 and kept as a salted hash that is checked in constant
+    time, so a leaked file can't be used to open the logs.
+    Only codes that can still be used are kept: a code is dropped as soon as it
+    is redeemed (the ``moderator_access`` log is the audit trail) and the
+    sweeper removes expired ones, so the store stays small however long the
+    bot runs. Lookups are a dict hit; expiry uses a heap ordered by expiry
+    time, so a sweep only touches the codes that actually expired.
+
+    With a ``LazyGuildStore`` a server's codes are upgraded, swept and added
+    to the heap when its document is first loaded.
+    """
+
+    def __init__(self, store: GuildStore, ttl: float = 3600.0):
+        self.store = store
+        self.ttl = ttl
+        self._expiry: List[Tuple[float, str, str]] = []  # (expires_at, guild ID, code ID)
+        self._task: Optional[asyncio.Task] = None
+        store.on_load = self.load
+        if not isinstance(store, LazyGuildStore):
+            for guild_id, doc in store.data.items():
+                self.load(guild_id, doc)
+
+    @staticmethod
+    def code_id(code: str) -> str:
+        """Lookup ID for a code; safe to store and log"""
+        return hashlib.sha256(b"access code id\0" + code.encode()).hexdigest()[:32]
+
+    @staticmethod
+    def _hash(salt: str, code: str) -> str:
+        return hashlib.sha256(bytes.fromhex(salt) + code.encode()).hexdigest()
+
+    def _record(self, code: str, created: Optional[str], expires_at: float) -> dict:
+        salt = secrets.token_hex(16)
+        return {"salt": salt, "hash": self._hash(salt, code), "created": created, "expires_at": expires_at}
+
+    def load(self, guild_id: str, doc: dict):
+        """Bring a server's codes up to date as they are loaded and queue them for expiry"""
+        changed = self.migrate(doc)
+        now = time.time()
+        for code_id, info in list(doc["codes"].items()):
+            if info["expires_at"] <= now:
+                del doc["codes"][code_id]
+                changed = True
+            else:
+                heapq.heappush(self._expiry, (info["expires_at"], guild_id, code_id))
+        if changed:
+            self.store.mark_dirty(guild_id)
+
+    def migrate(self, doc: dict) -> bool:
+        """Convert older formats in place: plain ``{code: {"created", "used", ...}}`` and unhashed codes"""
+        changed = False
+        if "codes" not in doc:
+            codes = {}
+            for code, info in doc.items():
+                if info.get("used"):
+                    continue
+                try:
+                    created = datetime.datetime.fromisoformat(info["created"]).timestamp()
+                except (KeyError, TypeError, ValueError):
+                    created = time.time()
+                codes[code] = {"created": info.get("created"), "expires_at": created + self.ttl}
+            issued = len(doc)
+            doc.clear()
+            doc.update({"issued": issued, "codes": codes})
+            changed = True
+
+        plaintext = [code for code, info in doc["codes"].items() if "hash" not in info]
+        for code in plaintext:
+            info = doc["codes"].pop(code)
+            doc["codes"][self.code_id(code)] = self._record(code, info.get("created"), info["expires_at"])
+        return changed or bool(plaintext)
+
+    def _doc(self, guild_id: str) -> dict:
+        return self.store.data.setdefault(str(guild_id), {"issued": 0, "codes": {}})
+
+    def issue(self, guild_id: str) -> str:
+        """Create a new one-time code for a server"""
+        guild_id = str(guild_id)
+        code = secrets.token_hex(16)
+        expires_at = time.time() + self.ttl
+        doc = self._doc(guild_id)
+        code_id = self.code_id(code)
+        doc["codes"][code_id] = self._record(code, datetime.datetime.now().isoformat(), expires_at)
+        doc["issued"] += 1
+        heapq.heappush(self._expiry, (expires_at, guild_id, code_id))
+        self.store.mark_dirty(guild_id)
+        return code
+
+    def redeem(self, guild_id: str, code: str) -> bool:
+        """Use up a code; returns False if it doesn't exist, was used already or has expired"""
+        guild_id = str(guild_id)
+        doc = self.store.data.get(guild_id)
+        if doc is None:
+            return False
+        code_id = self.code_id(code)
+        info = doc["codes"].get(code_id)
+        if info is None or not hmac.compare_digest(info["hash"], self._hash(info["salt"], code)):
+            return False
+        # Its heap entry is skipped by the next sweep
+        del doc["codes"][code_id]
+        self.store.mark_dirty(guild_id)
+        return info["expires_at"] > time.time()
+
+    def issued(self, guild_id: str) -> int:
+        """How many codes a server has ever generated"""
+        doc = self.store.data.get(str(guild_id))
+        return doc["issued"] if doc else 0
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Drop expired codes and return how many were removed"""
+        now = time.time() if now is None else now
+        removed = 0
+        while self._expiry and self._expiry[0][0] <= now:
+            _, guild_id, code_id = heapq.heappop(self._expiry)
+            doc = self.store.data.get(guild_id)
+            # Redeemed codes are already gone
+            if doc is not None and doc["codes"].pop(code_id, None) is not None:
+                self.store.mark_dirty(guild_id)
+                removed += 1
+        return removed
+
+    def start(self, on_change: Callable[[], None], interval: float = 60.0):
+        """Sweep every ``interval`` seconds, calling ``on_change`` when something was removed"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(on_change, interval))
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self, on_change: Callable[[], None], interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if self.sweep():
+                    on_change()
+            except Exception as e:
+                print(f"Error sweeping access codes: {e}")
@@ -0,0 +1,251 @@
+"""Mood and activity analytics for the statistics commands"""
+import array
+import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from storage import GuildStore
+
+
+def normalize_emoji(emoji: str) -> str:
+    # Discord may or may not include the emoji variation selector (U+FE0F)
+    return emoji.replace("\ufe0f", "")
+
+
+class MoodAnalytics:
+    """Per-server mood counts, one small counter list per check-in day.
+
+    Stored as ``{guild_id: {"YYYY-MM-DD": [count per mood emoji]}}`` in a
+    ``GuildStore``; clicks only bump in-memory counters and mark the server
+    dirty, so the background flusher writes a reaction storm out in one go.
+    The menu picks on the live check-in are kept in the same document under
+    ``"picks"`` (``{"message": message ID, "users": {user ID: position}}``),
+    so changing a pick after a restart still moves the earlier one.
+    """
+
+    def __init__(self, store: GuildStore, emojis: List[str]):
+        self.store = store
+        self.emojis = emojis
+        self._positions = {normalize_emoji(emoji): i for i, emoji in enumerate(emojis)}
+        # Check-in message ID -> (guild ID, check-in date), so raw events need no message cache
+        self.checkins: Dict[int, Tuple[str, str]] = {}
+        self._live_checkin: Dict[str, int] = {}
+
+    def track_checkin(self, guild_id: str, message_id: int, date: str):
+        """Start counting reactions on a server's new check-in message"""
+        guild_id = str(guild_id)
+        # Only the newest check-in per server is live; the previous one gets deleted
+        old_id = self._live_checkin.pop(guild_id, None)
+        if old_id is not None:
+            self.checkins.pop(old_id, None)
+        self.checkins[int(message_id)] = (guild_id, date)
+        self._live_checkin[guild_id] = int(message_id)
+
+    def record(self, guild_id: str, date: str, position: int, delta: int = 1):
+        """Add ``delta`` to one mood's count for a server's check-in day"""
+        days = self.store.data.setdefault(str(guild_id), {})
+        counts = days.get(date)
+        if counts is None:
+            counts = days[date] = [0] * len(self.emojis)
+            counts[position] = max(0, delta)
+            self.store.mark_dirty(guild_id, [([date], counts)])
+            return
+        counts[position] = max(0, counts[position] + delta)
+        self.store.mark_dirty(guild_id, [([date, position], counts[position])])
+
+    def record_reaction(self, message_id: int, emoji: str, delta: int) -> bool:
+        """Count a reaction add (+1) or removal (-1); returns False if it wasn't a mood on a check-in"""
+        checkin = self.checkins.get(message_id)
+        position = self._positions.get(normalize_emoji(emoji))
+        if checkin is None or position is None:
+            return False
+        guild_id, date = checkin
+        self.record(guild_id, date, position, delta)
+        return True
+
+    def record_choice(self, message_id: int, user_id: int, position: int) -> bool:
+        """Count a mood picked from a check-in's menu; picking again changes the earlier pick.
+
+        Returns False if the message isn't a live check-in.
+        """
+        checkin = self.checkins.get(message_id)
+        if checkin is None:
+            return False
+        guild_id, date = checkin
+        doc = self.store.data.setdefault(guild_id, {})
+        picks = doc.get("picks")
+        if picks is None or picks["message"] != message_id:
+            # The first pick on a new check-in replaces the previous one's
+            picks = doc["picks"] = {"message": message_id, "users": {}}
+            self.store.mark_dirty(guild_id, [(["picks"], picks)])
+        previous = picks["users"].get(str(user_id))
+        if previous == position:
+            return True
+        if previous is not None:
+            self.record(guild_id, date, previous, -1)
+        picks["users"][str(user_id)] = position
+        self.store.mark_dirty(guild_id, [(["picks", "users", str(user_id)], position)])
+        self.record(guild_id, date, position, 1)
+        return True
+
+    def totals(self, guild_id: str, dates: List[str]) -> List[int]:
+        """Sum the mood counts of a server over the given days"""
+        days = self.store.data.get(str(guild_id), {})
+        totals = [0] * len(self.emojis)
+        for date in dates:
+            for i, count in enumerate(days.get(date, ())):
+                totals[i] += count
+        return totals
+
+    @staticmethod
+    def last_days(today: datetime.date, days: int) -> List[str]:
+        return [(today - datetime.timedelta(days=i)).strftime('%Y-%m-%d') for i in range(days)]
+
+    def format_distribution(self, totals: List[int]) -> str:
+        """Render counts as one bar per mood, e.g. ``❤️ ████░░░░░░ 40% (4)``"""
+        total = sum(totals)
+        if not total:
+            return "No check-in reactions yet"
+        lines = []
+        for i, count in enumerate(totals):
+            filled = round(10 * count / total)
+            lines.append(f"{self.emojis[i]} {'█' * filled}{'░' * (10 - filled)} {round(100 * count / total)}% ({count})")
+        return "\n".join(lines)
+
+
+# Days of per-day history kept per server; older days only count towards the totals
+ROLLUP_DAYS = 366
+
+
+class ActivityRollup:
+    """Rolling per-server counters for one kind of event (vents, log views).
+
+    Each server keeps a ring of ``ROLLUP_DAYS`` daily counters plus 24
+    hour-of-day counters in ``array`` buffers, updated as events happen, so
+    7/30/90-day totals and the hourly heatmap are a couple of slice sums no
+    matter how much history a server has. Counters are bucketed in the
+    server's own timezone (``tz_for(guild_id)``).
+
+    A server without counters yet is rebuilt once from the indexed timestamps
+    of ``log_store`` in a single pass.
+    """
+
+    def __init__(self, store: GuildStore, name: str, log_store, tz_for: Callable[[str], datetime.tzinfo]):
+        self.store = store
+        self.name = name
+        self.log_store = log_store
+        self.tz_for = tz_for
+
+    @staticmethod
+    def _blank() -> dict:
+        return {
+            "last_day": 0,
+            "total": 0,
+            "days": array.array('I', bytes(4 * ROLLUP_DAYS)),
+            "hours": array.array('I', bytes(4 * 24)),
+        }
+
+    def counters(self, guild_id: str) -> dict:
+        """A server's counters, loaded or rebuilt on first use"""
+        guild_id = str(guild_id)
+        rollups = self.store.data.setdefault(guild_id, {})
+        counters = rollups.get(self.name)
+        if counters is None:
+            counters = rollups[self.name] = self.rebuild(guild_id)
+            self.store.mark_dirty(guild_id)
+        elif not isinstance(counters["days"], array.array):
+            # Saved as JSON lists; switch to compact arrays in memory
+            counters["days"] = array.array('I', counters["days"])
+            counters["hours"] = array.array('I', counters["hours"])
+        return counters
+
+    def rebuild(self, guild_id: str) -> dict:
+        """Recount a server's events from its log's index in one pass"""
+        counters = self._blank()
+        tz = self.tz_for(guild_id)
+        for timestamp in self.log_store.iter_timestamps(guild_id):
+            if timestamp:
+                self._add(counters, datetime.datetime.fromtimestamp(timestamp, tz))
+        return counters
+
+    @staticmethod
+    def _advance(counters: dict, day: int):
+        """Move the ring forward to ``day``, clearing the days that were skipped"""
+        last = counters["last_day"]
+        if day <= last:
+            return
+        days = counters["days"]
+        if day - last >= ROLLUP_DAYS:
+            days[:] = array.array('I', bytes(4 * ROLLUP_DAYS))
+        else:
+            for skipped in range(last + 1, day + 1):
+                days[skipped % ROLLUP_DAYS] = 0
+        counters["last_day"] = day
+
+    def _add(self, counters: dict, when: datetime.datetime):
+        day = when.toordinal()
+        self._advance(counters, day)
+        if counters["last_day"] - day < ROLLUP_DAYS:
+            counters["days"][day % ROLLUP_DAYS] += 1
+        counters["hours"][when.hour] += 1
+        counters["total"] += 1
+
+    def record(self, guild_id: str, when: Optional[datetime.datetime] = None):
+        """Count one event for a server (now, unless ``when`` is given)"""
+        guild_id = str(guild_id)
+        counters = self.counters(guild_id)
+        when = (when or datetime.datetime.now(datetime.timezone.utc)).astimezone(self.tz_for(guild_id))
+        day = when.toordinal()
+        if day > counters["last_day"]:
+            # Moving the ring on clears days, so the journal takes the whole document
+            self._add(counters, when)
+            self.store.mark_dirty(guild_id)
+            return
+        self._add(counters, when)
+        changes = [([self.name, "hours", when.hour], counters["hours"][when.hour]), ([self.name, "total"], counters["total"])]
+        if counters["last_day"] - day < ROLLUP_DAYS:
+            changes.append(([self.name, "days", day % ROLLUP_DAYS], counters["days"][day % ROLLUP_DAYS]))
+        self.store.mark_dirty(guild_id, changes)
+
+    def today(self, guild_id: str) -> int:
+        return datetime.datetime.now(self.tz_for(guild_id)).toordinal()
+
+    def window(self, guild_id: str, days: int) -> int:
+        """Events in the last ``days`` days, today included (``days`` up to ``ROLLUP_DAYS``)"""
+        counters = self.counters(guild_id)
+        today = self.today(guild_id)
+        last = counters["last_day"]
+        if today - last >= days:
+            return 0
+        # Days after ``last`` had no events, so the window ends at ``last``
+        start = (today - days + 1) % ROLLUP_DAYS
+        end = last % ROLLUP_DAYS
+        ring = counters["days"]
+        if start <= end:
+            return sum(ring[start:end + 1])
+        return sum(ring[start:]) + sum(ring[:end + 1])
+
+    def daily(self, guild_id: str, days: int) -> List[int]:
+        """Per-day counts for the last ``days`` days, oldest first"""
+        counters = self.counters(guild_id)
+        today = self.today(guild_id)
+        last = counters["last_day"]
+        ring = counters["days"]
+        return [
+            ring[day % ROLLUP_DAYS] if day <= last and last - day < ROLLUP_DAYS else 0
+            for day in range(today - days + 1, today + 1)
+        ]
+
+    def hours(self, guild_id: str) -> array.array:
+        """All-time counts per hour of the day (0-23)"""
+        return self.counters(guild_id)["hours"]
+
+
+SPARK_BLOCKS = "▁▂▃▄▅▆▇█"
+
+
+def sparkline(values: List[int]) -> str:
+    """Draw counts as a row of block characters scaled to the largest one"""
+    peak = max(values, default=0)
+    if not peak:
+        return SPARK_BLOCKS[0] * len(values)
+    return "".join(SPARK_BLOCKS[min(len(SPARK_BLOCKS) - 1, value * len(SPARK_BLOCKS) // (peak + 1))] for value in values)
@@ -0,0 +1,234 @@
+"""Synthetic data sets of any size for the storage benchmarks.
+
+    python -m benchmarks.dataset --out /tmp/bench --guilds 100 --entries 100000
+    python -m benchmarks.dataset --out /tmp/bench --backend sqlite --entries 1000000
+    python -m benchmarks.dataset --out /tmp/old --entries 100000 --legacy
+
+Servers get realistic settings, check-in and sticky messages, live access
+codes, an anonymous log and a moderator access log. Log sizes follow a
+Zipf-like curve (one big server, a long tail of small ones), entries are
+spread over the last ``--days`` days and written in the bot's own format:
+sealed with ``ANON_LOG_KEY`` (default ``benchmark-key``) through the normal
+stores. ``--legacy`` writes the old single-file ``settings.json``,
+``anon_logs.json``, ``access_codes.json`` and ``moderator_access.json``
+instead, which the bot imports on its first start.
+
+The same ``--seed`` always gives the same servers, users and messages.
+"""
+import argparse
+import base64
+import datetime
+import hashlib
+import itertools
+import json
+import os
+import random
+import time
+from typing import Dict, Iterator, List
+
+from access_codes import AccessCodeRegistry
+from logcrypto import LogCipher
+from storage import JsonBackend, SqliteBackend
+
+# Discord snowflakes count milliseconds from 2015-01-01
+DISCORD_EPOCH = 1420070400000
+
+TIMEZONES = ["UTC", "US/Eastern", "US/Pacific", "Europe/London", "Europe/Paris", "Asia/Kolkata", "Asia/Tokyo", "Australia/Sydney"]
+WORDS = (
+    "today feel tired anxious better hard week work school family sleep again really just "
+    "nobody talk about it friends trying help thanks everyone here lonely tomorrow hope "
+    "stressed exams breathing okay not sure why keep going small win proud of myself"
+).split()
+
+MODERATOR_VIEWS_PER_ENTRY = 1 / 50
+ACCESS_CODES_PER_GUILD = 3
+
+
+class DatasetGenerator:
+    """Deterministic servers, users and log entries for ``guilds`` servers and ``entries`` log entries"""
+
+    def __init__(self, guilds: int, entries: int, seed: int = 0, days: int = 365,
+                 key: bytes = b"benchmark-key"):
+        self.random = random.Random(seed)
+        self.days = days
+        self.cipher = LogCipher(key)
+        self.now = time.time()
+        self.guild_ids = [str(self.snowflake(self.now - self.random.uniform(365, 2000) * 86400)) for _ in range(guilds)]
+        # Zipf-like server sizes: the n-th biggest server gets a share proportional to 1/n
+        weights = [1 / (rank + 1) for rank in range(guilds)]
+        total = sum(weights)
+        self.sizes = {guild_id: int(entries * weight / total) for guild_id, weight in zip(self.guild_ids, weights)}
+        self.sizes[self.guild_ids[0]] += entries - sum(self.sizes.values())
+        self.users: Dict[str, List[str]] = {
+            guild_id: [str(self.snowflake(self.now - self.random.uniform(30, 2000) * 86400))
+                       for _ in range(max(5, min(2000, size // 20)))]
+            for guild_id, size in self.sizes.items()
+        }
+
+    def snowflake(self, when: float) -> int:
+        return ((int(when * 1000) - DISCORD_EPOCH) << 22) | self.random.getrandbits(22)
+
+    def code(self) -> str:
+        return f"{self.random.getrandbits(128):032x}"
+
+    @property
+    def biggest_guild(self) -> str:
+        return self.guild_ids[0]
+
+    def settings(self, guild_id: str) -> dict:
+        settings = {
+            "post_channel": self.snowflake(self.now - 400 * 86400),
+            "support_channel": self.snowflake(self.now - 400 * 86400),
+            "vent_channel": self.snowflake(self.now - 400 * 86400),
+            "ping": self.random.choice(["@everyone", "@here", "none"]),
+            "timezone": self.random.choice(TIMEZONES),
+            "time": f"{self.random.randint(0, 23):02d}:{self.random.choice([0, 15, 30, 45]):02d}",
+        }
+        if self.random.random() < 0.3:
+            settings["checkin_layout"] = "menu"
+        if self.random.random() < 0.2:
+            settings["retention"] = {"max_age_days": self.random.choice([30, 90, 365]), "max_count": None}
+        return settings
+
+    def last_messages(self, guild_id: str) -> dict:
+        today = datetime.date.today().strftime('%Y-%m-%d')
+        return {"daily_checkin": str(self.snowflake(self.now - 3600)), "daily_checkin_date": today, "last_checkin_date": today}
+
+    def message(self) -> str:
+        # Mostly short messages with the odd long one, up to the modal's 2000 characters
+        words = min(300, int(self.random.paretovariate(1.5) * 8))
+        return " ".join(self.random.choice(WORDS) for _ in range(words)).capitalize()
+
+    def timestamps(self, count: int) -> List[str]:
+        """``count`` ISO timestamps over the last ``days`` days, oldest first"""
+        start = self.now - self.days * 86400
+        moments = sorted(self.random.uniform(start, self.now) for _ in range(count))
+        return [datetime.datetime.fromtimestamp(moment).isoformat() for moment in moments]
+
+    def anon_entries(self, guild_id: str, legacy: bool = False) -> Iterator[dict]:
+        """A server's anonymous log as main.log_anonymous_message writes it (or the old base64 format)"""
+        users = self.users[guild_id]
+        # A few regulars write most of the messages
+        activity = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(users))))
+        channel_id = str(self.snowflake(self.now - 400 * 86400))
+        for timestamp in self.timestamps(self.sizes[guild_id]):
+            user_id = self.random.choices(users, cum_weights=activity)[0]
+            username = f"user{user_id[-6:]}"
+            content = self.message()
+            if legacy:
+                yield {
+                    "timestamp": timestamp, "guild_id": guild_id, "channel_id": channel_id, "user_id": user_id,
+                    "encoded_username": base64.b64encode(username.encode()).decode(),
+                    "encoded_display_name": base64.b64encode(username.encode()).decode(),
+                    "message_hash": hashlib.sha256(content.encode()).hexdigest()[:16],
+                    "encoded_content": base64.b64encode(content.encode()).decode(),
+                }
+                continue
+            yield {
+                "timestamp": timestamp, "guild_id": guild_id, "channel_id": channel_id, "user_id": user_id,
+                "message_hash": self.cipher.fingerprint(guild_id, content),
+                "sealed": self.cipher.seal(guild_id, {"username": username, "display_name": username, "content": content},
+                                           associated=f"{timestamp}|{user_id}"),
+            }
+
+    def moderator_entries(self, guild_id: str, legacy: bool = False) -> Iterator[dict]:
+        """A server's moderator access log: about one log view per fifty messages"""
+        moderator = self.users[guild_id][0]
+        for timestamp in self.timestamps(int(self.sizes[guild_id] * MODERATOR_VIEWS_PER_ENTRY)):
+            code = self.code()
+            if legacy:
+                yield {"user_id": moderator, "accessed_at": timestamp, "access_code": code}
+            else:
+                yield {"user_id": moderator, "accessed_at": timestamp, "access_code_id": AccessCodeRegistry.code_id(code)}
+
+    def write(self, backend) -> Dict[str, int]:
+        """Fill ``backend`` (a ``JsonBackend`` or ``SqliteBackend``) and return what was written"""
+        for name, make in (("settings", self.settings), ("last_messages", self.last_messages)):
+            store = backend.document_store(name)
+            for guild_id in self.guild_ids:
+                store.data[guild_id] = make(guild_id)
+                store.mark_dirty(guild_id)
+            store.flush()
+
+        settings = backend.document_store("settings").data
+        sticky = backend.document_store("sticky_messages")
+        for guild_id in self.guild_ids:
+            sticky.data[guild_id] = {"message_id": str(self.snowflake(self.now - 60)), "channel_id": str(settings[guild_id]["vent_channel"])}
+            sticky.mark_dirty(guild_id)
+        sticky.flush()
+
+        codes = backend.document_store("access_codes")
+        registry = AccessCodeRegistry(codes)
+        for guild_id in self.guild_ids:
+            for _ in range(ACCESS_CODES_PER_GUILD):
+                registry.issue(guild_id)
+        codes.flush()
+
+        counts = {"guilds": len(self.guild_ids), "anon_logs": 0, "moderator_access": 0}
+        for name, time_field, entries in (("anon_logs", "timestamp", self.anon_entries),
+                                          ("moderator_access", "accessed_at", self.moderator_entries)):
+            log_store = backend.log_store(name, time_field)
+            with backend.transaction():
+                for guild_id in self.guild_ids:
+                    log_store.rewrite(guild_id, entries(guild_id))
+                    counts[name] += log_store.count(guild_id)
+        return counts
+
+    def write_legacy(self, legacy_dir: str) -> Dict[str, int]:
+        """Write the old one-file-per-kind format the bot imports on first start"""
+        os.makedirs(legacy_dir, exist_ok=True)
+        created = datetime.datetime.now().isoformat()
+        documents = {
+            "settings": {guild_id: self.settings(guild_id) for guild_id in self.guild_ids},
+            "last_messages": {guild_id: self.last_messages(guild_id) for guild_id in self.guild_ids},
+            # Very old versions kept the sticky as a bare message ID
+            "sticky_messages": {guild_id: str(self.snowflake(self.now - 60)) for guild_id in self.guild_ids},
+            "access_codes": {
+                guild_id: {self.code(): {"created": created, "used": False} for _ in range(ACCESS_CODES_PER_GUILD)}
+                for guild_id in self.guild_ids
+            },
+            "anon_logs": {guild_id: list(self.anon_entries(guild_id, legacy=True)) for guild_id in self.guild_ids},
+            "moderator_access": {guild_id: list(self.moderator_entries(guild_id, legacy=True)) for guild_id in self.guild_ids},
+        }
+        for name, data in documents.items():
+            with open(os.path.join(legacy_dir, f"{name}.json"), "w") as f:
+                json.dump(data, f, indent=2)
+        return {
+            "guilds": len(self.guild_ids),
+            "anon_logs": sum(map(len, documents["anon_logs"].values())),
+            "moderator_access": sum(map(len, documents["moderator_access"].values())),
+        }
+
+
+def open_backend_at(kind: str, data_dir: str):
+    """The bot's storage backend of the given kind (``json`` or ``sqlite``) inside ``data_dir``"""
+    if kind == "sqlite":
+        os.makedirs(data_dir, exist_ok=True)
+        return SqliteBackend(os.path.join(data_dir, "bot.db"))
+    return JsonBackend(data_dir, legacy_dir=data_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic data set for the bot")
+    parser.add_argument("--out", required=True, help="folder to write the data to (BOT_DATA_DIR)")
+    parser.add_argument("--guilds", type=int, default=100, help="number of servers (default: %(default)s)")
+    parser.add_argument("--entries", type=int, default=100000, help="anonymous log entries in total (default: %(default)s)")
+    parser.add_argument("--days", type=int, default=365, help="days of history (default: %(default)s)")
+    parser.add_argument("--backend", choices=["json", "sqlite"], default="json")
+    parser.add_argument("--legacy", action="store_true", help="write the old single-file JSON format instead")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    generator = DatasetGenerator(args.guilds, args.entries, args.seed, args.days,
+                                 key=os.getenv("ANON_LOG_KEY", "benchmark-key").encode())
+    if args.legacy:
+        counts = generator.write_legacy(args.out)
+    else:
+        backend = open_backend_at(args.backend, args.out)
+        try:
+            counts = generator.write(backend)
+        finally:
+            backend.close()
+    print(f"✅ Wrote {counts['guilds']} servers, {counts['anon_logs']} log entries and "
+          f"{counts['moderator_access']} log views to {args.out} in {time.perf_counter() - started:.1f}s")
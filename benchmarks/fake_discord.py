@@ -0,0 +1,226 @@
+"""In-process stand-in for Discord's REST API and gateway, for offline benchmarks"""
+import asyncio
+import datetime
+import itertools
+import json
+import random
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+import discord
+from aiohttp import web
+
+from metrics import route_of
+
+# Snowflakes handed out by the fake API start here (they only need to be unique and look real)
+FIRST_ID = 1_100_000_000_000_000_000
+BOT_USER_ID = FIRST_ID - 1
+APPLICATION_ID = FIRST_ID - 2
+
+
+def user_payload(user_id: int, name: str, bot: bool = False) -> dict:
+    return {"id": str(user_id), "username": name, "discriminator": "0", "global_name": None, "avatar": None, "bot": bot}
+
+
+def member_payload(user: Optional[dict] = None) -> dict:
+    member = {"roles": [], "joined_at": "2024-01-01T00:00:00+00:00", "deaf": False, "mute": False, "flags": 0}
+    if user is not None:
+        member["user"] = user
+    return member
+
+
+class FakeDiscord:
+    """Serves the Discord REST routes the bot uses from a local aiohttp app.
+
+    Every request waits ``latency`` seconds (plus up to ``jitter`` more) and
+    a ``rate_limit`` fraction of them is answered with a 429 asking to retry
+    after ``retry_after`` seconds, so discord.py's own retry handling runs
+    exactly as it would against Discord. ``start()`` points discord.py at
+    the fake API; requests and 429s are counted per route.
+
+    The gateway side builds the payloads Discord would send (guilds,
+    messages, interactions) so the real handlers can be driven with real
+    discord.py models.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, rate_limit: float = 0.0,
+                 retry_after: float = 0.25, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.requests: Counter = Counter()  # (method, route) -> requests
+        self.rate_limited: Counter = Counter()  # (method, route) -> 429 responses
+        self._random = random.Random(seed)
+        self._ids = itertools.count(FIRST_ID)
+        self._runner: Optional[web.AppRunner] = None
+        self._original_base = discord.http.Route.BASE
+        self.bot_user = user_payload(BOT_USER_ID, "MentalHealthBot", bot=True)
+
+    def next_id(self) -> int:
+        return next(self._ids)
+
+    async def start(self):
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_route("*", "/api/v10/{path:.*}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        discord.http.Route.BASE = f"http://127.0.0.1:{port}/api/v10"
+
+    async def stop(self):
+        discord.http.Route.BASE = self._original_base
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def totals(self) -> Tuple[int, int]:
+        """Requests and 429s so far, for per-scenario differences"""
+        return sum(self.requests.values()), sum(self.rate_limited.values())
+
+    # REST
+
+    @staticmethod
+    def _json(data: Any, status: int = 200, headers: Optional[Dict[str, str]] = None) -> web.Response:
+        # discord.py only parses bodies whose content type is exactly application/json
+        return web.Response(status=status, body=json.dumps(data).encode(),
+                            headers={"Content-Type": "application/json", **(headers or {})})
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        key = (request.method, route_of("/" + request.match_info["path"]))
+        self.requests[key] += 1
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.rate_limit and self._random.random() < self.rate_limit:
+            self.rate_limited[key] += 1
+            return self._json(
+                {"message": "You are being rate limited.", "retry_after": self.retry_after, "global": False},
+                status=429, headers={"Via": "1.1 google", "Retry-After": str(self.retry_after)},
+            )
+
+        body = await request.json() if request.can_read_body else {}
+        parts = request.match_info["path"].split("/")
+        method = request.method
+        if method == "GET" and parts == ["users", "@me"]:
+            return self._json(self.bot_user)
+        if method == "GET" and parts == ["oauth2", "applications", "@me"]:
+            return self._json({
+                "id": str(APPLICATION_ID), "name": self.bot_user["username"], "description": "", "icon": None,
+                "bot_public": False, "bot_require_code_grant": False, "owner": self.bot_user, "verify_key": "",
+                "flags": 0,
+            })
+        if method == "POST" and parts == ["users", "@me", "channels"]:
+            recipient = user_payload(int(body["recipient_id"]), "member")
+            return self._json({"id": str(self.next_id()), "type": 1, "recipients": [recipient], "last_message_id": None})
+        if parts[0] == "channels" and len(parts) >= 3 and parts[2] == "messages":
+            if method == "POST" and len(parts) == 3:
+                return self._json(self.message_payload(int(parts[1]), self.bot_user, body))
+            if method in ("DELETE", "PUT"):
+                return web.Response(status=204)
+        if method == "POST" and parts[0] == "interactions" and parts[-1] == "callback":
+            return self._json(self._callback_payload(int(parts[1]), body))
+        return self._json({"message": "Unknown route (fake Discord)", "code": 0}, status=404)
+
+    def message_payload(self, channel_id: int, author: dict, body: dict, guild_id: Optional[int] = None) -> dict:
+        """A message as Discord returns or dispatches it"""
+        message = {
+            "id": str(self.next_id()),
+            "channel_id": str(channel_id),
+            "type": 0,
+            "content": body.get("content") or "",
+            "author": author,
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "edited_timestamp": None,
+            "tts": False,
+            "mention_everyone": False,
+            "mentions": [],
+            "mention_roles": [],
+            "attachments": [],
+            "embeds": body.get("embeds") or [],
+            "components": body.get("components") or [],
+            "pinned": False,
+            "flags": body.get("flags", 0),
+        }
+        if guild_id is not None:
+            message["guild_id"] = str(guild_id)
+            message["member"] = member_payload()
+        return message
+
+    def _callback_payload(self, interaction_id: int, body: dict) -> dict:
+        data = body.get("data") or {}
+        message = self.message_payload(0, self.bot_user, data)
+        return {
+            "interaction": {
+                "id": str(interaction_id),
+                "type": body.get("type"),
+                "response_message_id": message["id"],
+                "response_message_loading": False,
+                "response_message_ephemeral": bool(data.get("flags", 0) & 64),
+            },
+            "resource": {"type": body.get("type"), "message": message},
+        }
+
+    # Gateway
+
+    def guild_payload(self, guild_id: int, owner: dict, channel_ids: List[int], members: List[dict]) -> dict:
+        """GUILD_CREATE data for a server with text channels and members"""
+        return {
+            "id": str(guild_id),
+            "name": f"Guild {guild_id}",
+            "owner_id": owner["id"],
+            "roles": [{
+                "id": str(guild_id), "name": "@everyone", "permissions": "0", "position": 0, "color": 0,
+                "hoist": False, "managed": False, "mentionable": False, "flags": 0,
+            }],
+            "channels": [
+                {"id": str(channel_id), "type": 0, "name": f"channel-{i}", "position": i, "permission_overwrites": []}
+                for i, channel_id in enumerate(channel_ids)
+            ],
+            "members": [member_payload(user) for user in [owner, self.bot_user, *members]],
+            "member_count": len(members) + 2,
+            "emojis": [],
+            "stickers": [],
+            "features": [],
+            "unavailable": False,
+        }
+
+    def add_guild(self, state, owner: dict, channels: int = 3, members: int = 0) -> discord.Guild:
+        """Register a new server with the bot as a GUILD_CREATE would"""
+        guild_id = self.next_id()
+        channel_ids = [self.next_id() for _ in range(channels)]
+        member_users = [user_payload(self.next_id(), f"member-{i}") for i in range(members)]
+        return state._add_guild_from_data(self.guild_payload(guild_id, owner, channel_ids, member_users))
+
+    def user_message(self, state, channel: discord.TextChannel, author: dict, content: str) -> discord.Message:
+        """A MESSAGE_CREATE from a member, as the bot would receive it"""
+        data = self.message_payload(channel.id, author, {"content": content}, guild_id=channel.guild.id)
+        return discord.Message(state=state, channel=channel, data=data)
+
+    def modal_interaction(self, state, channel: discord.TextChannel, user: dict, custom_id: str,
+                          values: Dict[str, str]) -> discord.Interaction:
+        """A modal submit interaction carrying the given text input values"""
+        data = {
+            "id": str(self.next_id()),
+            "application_id": str(APPLICATION_ID),
+            "type": 5,
+            "token": f"token-{self.next_id()}",
+            "version": 1,
+            "guild_id": str(channel.guild.id),
+            "channel_id": str(channel.id),
+            "channel": {"id": str(channel.id), "type": 0},
+            "member": {**member_payload(user), "permissions": "0"},
+            "app_permissions": "0",
+            "attachment_size_limit": 8 * 1024 * 1024,
+            "locale": "en-US",
+            "data": {
+                "custom_id": custom_id,
+                "components": [
+                    {"type": 1, "components": [{"type": 4, "custom_id": input_id, "value": value}]}
+                    for input_id, value in values.items()
+                ],
+            },
+        }
+        return discord.Interaction(data=data, state=state)
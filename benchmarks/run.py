@@ -0,0 +1,323 @@
+"""Offline benchmarks of the bot's handlers against a fake Discord.
+
+    python -m benchmarks.run                                  # every scenario
+    python -m benchmarks.run checkin_burst --guilds 1000 --latency 0.05 --rate-limit 0.02
+    python -m benchmarks.run vent_channel --rate 50 --duration 10
+
+main.py's real handlers run with real discord.py models and rate limit
+handling; only the network is replaced (see fake_discord.py). The bot runs
+in a throwaway folder with its data, database and journal inside it
+(``--storage sqlite`` for the SQLite backend), whatever .env says. For each
+scenario the throughput, p50/p99/max latency per operation and Discord REST
+requests per operation are reported, background work (reactions, sticky
+reposts) included. The bot's own rate limits are
+off unless ``--rate-limits`` is given, since the scenarios send far more
+from a few users than the limits allow.
+"""
+import argparse
+import asyncio
+import contextlib
+import datetime
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Awaitable, Callable, Dict, List
+
+from benchmarks.fake_discord import FakeDiscord, user_payload
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(ordered: List[float], pct: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class Result:
+    """Timings and REST usage of one scenario run"""
+
+    def __init__(self, name: str, latencies: List[float], seconds: float, routes: Counter, rate_limited: int):
+        self.name = name
+        self.latencies = sorted(latencies)
+        self.seconds = seconds
+        self.routes = routes  # (method, route) -> requests
+        self.requests = sum(routes.values())
+        self.rate_limited = rate_limited
+
+    def row(self) -> str:
+        ops = len(self.latencies)
+        ms = lambda seconds: f"{seconds * 1000:.1f}ms"
+        return (
+            f"{self.name:<15} {ops:>6} {ops / self.seconds if self.seconds else 0:>9.1f} "
+            f"{ms(percentile(self.latencies, 50)):>9} {ms(percentile(self.latencies, 99)):>9} "
+            f"{ms(self.latencies[-1] if self.latencies else 0):>9} "
+            f"{self.requests / ops if ops else 0:>8.3f} {self.rate_limited:>6}"
+        )
+
+    def route_rows(self) -> List[str]:
+        ops = len(self.latencies) or 1
+        return [f"    {count / ops:>8.2f}/op  {method} {route}" for (method, route), count in self.routes.most_common()]
+
+
+HEADER = f"{'scenario':<15} {'ops':>6} {'ops/s':>9} {'p50':>9} {'p99':>9} {'max':>9} {'REST/op':>8} {'429s':>6}"
+
+
+class Harness:
+    """The bot from main.py logged in to a fake Discord, plus helpers to set servers up"""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.data_dir = tempfile.mkdtemp(prefix="mhb-bench-")
+        self.fake = FakeDiscord(args.latency, args.jitter, args.rate_limit, args.retry_after, args.seed)
+        self.random = random.Random(args.seed)
+        self.owner = user_payload(self.fake.next_id(), "owner")
+        self.main = None
+
+    async def start(self):
+        # Run from the scratch folder so legacy ./*.json files in the caller's folder aren't imported,
+        # and set every storage path so nothing from .env can point the bot at real data
+        self.cwd = os.getcwd()
+        os.chdir(self.data_dir)
+        if REPO_ROOT not in sys.path:
+            sys.path.insert(0, REPO_ROOT)
+        os.environ.update(
+            BOT_DATA_DIR=os.path.join(self.data_dir, "data"),
+            STORAGE_BACKEND=self.args.storage,
+            SQLITE_PATH=os.path.join(self.data_dir, "bot.db"),
+            JOURNAL_DIR=os.path.join(self.data_dir, "journal"),
+            ANON_LOG_KEY="benchmark-key",
+            METRICS_PORT="",
+            SHARD_COUNT="",
+            SHARD_IDS="",
+        )
+        await self.fake.start()
+        import main  # Reads its configuration from the environment on import
+        self.main = main
+        if not self.args.rate_limits:
+            from ratelimit import RateLimiter
+            main.vent_limiter = main.button_limiter = main.command_limiter = RateLimiter()
+        await main.bot.login("benchmark-token")  # Also runs setup_hook (flusher, sweepers)
+        self.state = main.bot._connection
+
+    async def close(self):
+        await self.main.bot.close()
+        await self.fake.stop()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    async def add_server(self, members: int = 20, sticky: bool = True):
+        """A configured server: check-in, support and vent channels plus (with ``sticky``) the vent button"""
+        main = self.main
+        guild = self.fake.add_guild(self.state, self.owner, channels=3, members=members)
+        post, support, vent = guild.text_channels
+        guild_id = str(guild.id)
+        main.server_settings[guild_id] = {
+            "post_channel": post.id,
+            "support_channel": support.id,
+            "vent_channel": vent.id,
+            "ping": "@here",
+            "timezone": "UTC",
+            "time": "09:00",
+        }
+        main.settings_store.mark_dirty(guild_id)
+        if sticky:
+            await main.setup_vent_channel(vent, guild_id)
+        return guild
+
+    def member_of(self, guild) -> dict:
+        members = [member for member in guild.members if not member.bot and member.id != int(self.owner["id"])]
+        member = self.random.choice(members)
+        return user_payload(member.id, member.name)
+
+    async def settle(self, timeout: float = 60.0):
+        """Wait for background work (reactions, sticky reposts, saves) to finish"""
+        main = self.main
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            if not (main.sticky_manager.waiting or main.background_tasks or main.checkin_scheduler.inflight):
+                break
+            await asyncio.sleep(0.05)
+        await main.flusher.flush()
+
+    async def measure(self, name: str, setup: Callable[[], Awaitable[list]],
+                      operation: Callable[..., Awaitable[None]], concurrency: int = 0,
+                      rate: float = 0.0) -> Result:
+        """Run ``operation(item)`` for every item from ``setup()`` and collect the numbers.
+
+        ``concurrency`` caps operations in flight (0 = all at once); with a
+        ``rate`` they are started that many per second instead, like traffic.
+        """
+        items = await setup()
+        await self.settle()
+        requests_before = Counter(self.fake.requests)
+        limited_before = self.fake.totals()[1]
+        latencies: List[float] = []
+        semaphore = asyncio.Semaphore(concurrency) if concurrency else None
+
+        async def timed(item):
+            if semaphore is not None:
+                await semaphore.acquire()
+            start = time.perf_counter()
+            try:
+                await operation(item)
+            finally:
+                latencies.append(time.perf_counter() - start)
+                if semaphore is not None:
+                    semaphore.release()
+
+        start = time.perf_counter()
+        if rate:
+            tasks = []
+            for i, item in enumerate(items):
+                await asyncio.sleep(max(0.0, start + i / rate - time.perf_counter()))
+                tasks.append(asyncio.create_task(timed(item)))
+            await asyncio.gather(*tasks)
+        else:
+            await asyncio.gather(*(timed(item) for item in items))
+        seconds = time.perf_counter() - start
+        await self.settle()
+        return Result(name, latencies, seconds, self.fake.requests - requests_before,
+                      self.fake.totals()[1] - limited_before)
+
+
+# Scenarios
+
+async def checkin_burst(h: Harness) -> Result:
+    """Every server has its check-in at the same minute; posted through the real scheduler"""
+    main = h.main
+    fire_at = datetime.datetime.now(datetime.timezone.utc)
+    today = fire_at.strftime('%Y-%m-%d')
+
+    async def setup():
+        return [str((await h.add_server(members=0, sticky=False)).id) for _ in range(h.args.guilds)]
+
+    async def post(guild_id):
+        await main.checkin_scheduler._dispatch(fire_at, guild_id, today)
+
+    return await h.measure("checkin_burst", setup, post)
+
+
+async def vent_channel(h: Harness) -> Result:
+    """A busy vent channel: members post ``--rate`` messages a second for ``--duration`` seconds"""
+    main = h.main
+
+    async def setup():
+        guild = await h.add_server(members=50)
+        vent = guild.get_channel(int(main.server_settings[str(guild.id)]["vent_channel"]))
+        count = int(h.args.rate * h.args.duration)
+        return [h.fake.user_message(h.state, vent, h.member_of(guild), f"message {i}") for i in range(count)]
+
+    return await h.measure("vent_channel", setup, main.on_message, rate=h.args.rate)
+
+
+async def vent_submit(h: Harness) -> Result:
+    """Anonymous vent submissions (the modal's on_submit) spread over a few servers"""
+    main = h.main
+
+    async def setup():
+        guilds = [await h.add_server() for _ in range(h.args.submit_guilds)]
+        items = []
+        for i in range(h.args.submissions):
+            guild = guilds[i % len(guilds)]
+            modal = main.AnonymousVentModal()
+            interaction = h.fake.modal_interaction(
+                h.state, guild.text_channels[0], h.member_of(guild), modal.custom_id,
+                {modal.message.custom_id: f"Anonymous message number {i}. " * 8},
+            )
+            modal._refresh(interaction, interaction.data["components"], {})
+            items.append((modal, interaction))
+        return items
+
+    async def submit(item):
+        modal, interaction = item
+        await modal.on_submit(interaction)
+
+    return await h.measure("vent_submit", setup, submit, concurrency=h.args.concurrency)
+
+
+async def view_logs(h: Harness) -> Result:
+    """Moderators opening the log viewer with ``!view_logs <code>`` on a server with a long log"""
+    main = h.main
+
+    async def setup():
+        guild = await h.add_server()
+        guild_id = str(guild.id)
+        for i in range(h.args.log_entries):
+            member = h.member_of(guild)
+            main.log_anonymous_message(guild_id, f"Logged message {i}", str(guild.text_channels[2].id),
+                                       member["id"], member["username"], member["username"])
+        await main.flusher.flush()
+        channel = guild.text_channels[1]
+        return [
+            h.fake.user_message(h.state, channel, h.owner, f"!view_logs {main.generate_access_code(guild_id)}")
+            for _ in range(h.args.views)
+        ]
+
+    return await h.measure("view_logs", setup, main.on_message, concurrency=h.args.concurrency)
+
+
+SCENARIOS: Dict[str, Callable[[Harness], Awaitable[Result]]] = {
+    "checkin_burst": checkin_burst,
+    "vent_channel": vent_channel,
+    "vent_submit": vent_submit,
+    "view_logs": view_logs,
+}
+
+
+async def run(args: argparse.Namespace):
+    harness = Harness(args)
+    output = sys.stdout if args.verbose else io.StringIO()
+    with contextlib.redirect_stdout(output):
+        await harness.start()
+    print(f"Fake Discord latency {args.latency * 1000:.0f}ms (+{args.jitter * 1000:.0f}ms jitter), "
+          f"{args.rate_limit:.0%} of requests rate limited for {args.retry_after}s")
+    print(HEADER)
+    try:
+        for name in args.scenarios:
+            with contextlib.redirect_stdout(output):
+                result = await SCENARIOS[name](harness)
+            print(result.row())
+            if args.routes:
+                print("\n".join(result.route_rows()))
+    finally:
+        with contextlib.redirect_stdout(output):
+            await harness.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the bot's handlers against a fake Discord")
+    parser.add_argument("scenarios", nargs="*", metavar="scenario",
+                        help=f"Scenarios to run: {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds every REST request takes")
+    parser.add_argument("--jitter", type=float, default=0.01, help="Up to this many extra seconds per request")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Fraction of requests answered with a 429")
+    parser.add_argument("--retry-after", type=float, default=0.25, help="Retry-after seconds of injected 429s")
+    parser.add_argument("--guilds", type=int, default=1000, help="Servers sharing a check-in minute (checkin_burst)")
+    parser.add_argument("--rate", type=float, default=50, help="Messages per second (vent_channel)")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds of traffic (vent_channel)")
+    parser.add_argument("--submissions", type=int, default=500, help="Vent submissions (vent_submit)")
+    parser.add_argument("--submit-guilds", type=int, default=10, help="Servers the submissions go to (vent_submit)")
+    parser.add_argument("--views", type=int, default=200, help="!view_logs commands (view_logs)")
+    parser.add_argument("--log-entries", type=int, default=5000, help="Entries in the viewed log (view_logs)")
+    parser.add_argument("--concurrency", type=int, default=50, help="Operations in flight at once")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--storage", choices=["json", "sqlite"], default="json", help="Storage backend the bot uses")
+    parser.add_argument("--rate-limits", action="store_true", help="Keep the bot's vent and command rate limits on")
+    parser.add_argument("--routes", action="store_true", help="Break REST requests down per route")
+    parser.add_argument("--verbose", action="store_true", help="Show the bot's own output")
+    args = parser.parse_args()
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+    args.scenarios = args.scenarios or list(SCENARIOS)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
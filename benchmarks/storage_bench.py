@@ -0,0 +1,197 @@
+"""Persistence micro-benchmarks at growing data sizes.
+
+    python -m benchmarks.storage_bench                          # 1k, 100k and 1M log entries, JSON and SQLite
+    python -m benchmarks.storage_bench --sizes 1000 100000 --backends json --output baseline.json
+
+For every size and backend a data set is generated (see dataset.py) and a
+fresh Python process starts the bot's state on it by importing main.py,
+measuring:
+
+* load: time and resident memory to import main.py, i.e. bot start-up with that data
+* log page: the log viewer's page render (find + read + decrypt) on the
+  biggest server - the first (cold) one, the newest page, random deeper
+  pages, and pages filtered to one user or one week
+* save: a settings change and an anonymous log append, each written out
+  through save_data() (journal, atomic write and fsync included), plus the
+  first vent after start-up (which builds the activity counters)
+
+``--output`` keeps the numbers as JSON so a storage change can be compared
+against a baseline run.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+KEY = "benchmark-key"
+
+
+def rss_mb() -> float:
+    """Current resident memory in MB (peak memory where /proc isn't available)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def timings(samples: int, run: Callable[[int], None]) -> Dict[str, float]:
+    """p50/p99/max in milliseconds of ``run(i)`` over ``samples`` calls"""
+    durations = []
+    for i in range(samples):
+        start = time.perf_counter()
+        run(i)
+        durations.append(time.perf_counter() - start)
+    durations.sort()
+    pick = lambda pct: durations[min(len(durations) - 1, int(len(durations) * pct / 100))] * 1000
+    return {"p50": pick(50), "p99": pick(99), "max": durations[-1] * 1000}
+
+
+def probe(samples: int, seed: int) -> dict:
+    """Runs in the child process: start the bot's state from the data set and measure it"""
+    import discord, aiohttp, pytz  # noqa: F401 - loaded first so only the bot's own start-up is measured
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    import main
+    result = {"load_ms": (time.perf_counter() - start) * 1000, "rss_mb": rss_mb() - rss_before, "rss_total_mb": rss_mb()}
+    rng = random.Random(seed)
+
+    store = main.anon_logs_store
+    guild_id = max(store.guild_ids(), key=store.count)
+    total = store.count(guild_id)
+    result["biggest_guild_entries"] = total
+    newest = store.tail(guild_id, 1)[0]
+
+    async def read_pages():
+        viewer = main.LogViewerView(guild_id, 1)
+        start = time.perf_counter()
+        viewer.render()
+        result["page_cold_ms"] = (time.perf_counter() - start) * 1000
+        result["page_newest"] = timings(samples, lambda i: viewer.render())
+
+        def deep(i):
+            viewer.cursors = [None, rng.randrange(main.LOG_PAGE_SIZE, total)] if total > main.LOG_PAGE_SIZE else [None]
+            viewer.render()
+        result["page_deep"] = timings(samples, deep)
+
+        viewer.cursors = [None]
+        viewer.filters = {"user_id": int(newest["user_id"])}
+        result["page_user"] = timings(samples, lambda i: viewer.render())
+
+        until = datetime.datetime.fromisoformat(newest["timestamp"]).timestamp() - 30 * 86400
+        viewer.filters = {"since": until - 7 * 86400, "until": until}
+        result["page_week"] = timings(samples, lambda i: viewer.render())
+        viewer.stop()
+
+    asyncio.run(read_pages())
+
+    # Saves run through save_data() the way a command outside the event loop does: written right away
+    settings_guild = rng.choice(list(main.server_settings))
+    channel_id = str(main.server_settings[settings_guild]["vent_channel"])
+
+    def change_settings(i):
+        main.server_settings[settings_guild]["ping"] = ["@here", "none"][i % 2]
+        main.settings_store.mark_dirty(settings_guild)
+        main.save_data()
+    result["save_settings"] = timings(samples, change_settings)
+
+    start = time.perf_counter()
+    main.log_anonymous_message(guild_id, "First message after start-up", channel_id, newest["user_id"], "user", "user")
+    result["first_vent_ms"] = (time.perf_counter() - start) * 1000
+    result["save_log"] = timings(samples, lambda i: main.log_anonymous_message(
+        guild_id, f"Benchmark message {i}", channel_id, newest["user_id"], "user", "user"))
+
+    main.flusher.flush_now()
+    main.backend.close()
+    return result
+
+
+def run_one(entries: int, backend: str, guilds: int, samples: int, seed: int) -> dict:
+    """Generate a data set, then measure it in a fresh process"""
+    from benchmarks.dataset import DatasetGenerator, open_backend_at
+
+    work_dir = tempfile.mkdtemp(prefix="mhb-storage-")
+    data_dir = os.path.join(work_dir, "data")
+    try:
+        start = time.perf_counter()
+        target = open_backend_at(backend, data_dir)
+        try:
+            counts = DatasetGenerator(guilds, entries, seed, key=KEY.encode()).write(target)
+        finally:
+            target.close()
+        generate_seconds = time.perf_counter() - start
+
+        env = dict(os.environ, BOT_DATA_DIR=data_dir, STORAGE_BACKEND=backend, ANON_LOG_KEY=KEY,
+                   SQLITE_PATH=os.path.join(data_dir, "bot.db"), PYTHONPATH=REPO_ROOT)
+        # Run from the scratch folder so no .env or old data files next to the bot are picked up
+        child = subprocess.run(
+            [sys.executable, "-m", "benchmarks.storage_bench", "--probe", "--samples", str(samples), "--seed", str(seed)],
+            cwd=work_dir, env=env, capture_output=True, text=True,
+        )
+        if child.returncode != 0:
+            raise RuntimeError(f"Benchmark process failed:\n{child.stderr}")
+        result = json.loads(child.stdout.strip().splitlines()[-1])
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    result.update(entries=entries, backend=backend, guilds=counts["guilds"], generate_s=generate_seconds)
+    return result
+
+
+def describe(result: dict) -> str:
+    ms = lambda stats, pct: f"{stats[pct]:.1f}ms"
+    return "\n".join([
+        f"{result['entries']:,} entries · {result['backend']}",
+        f"  generate   {result['generate_s']:.1f}s ({result['guilds']} servers, biggest has {result['biggest_guild_entries']:,} entries)",
+        f"  load       {result['load_ms']:.0f}ms, +{result['rss_mb']:.1f} MB RSS ({result['rss_total_mb']:.1f} MB total)",
+        f"  log page   cold {result['page_cold_ms']:.1f}ms · newest p50 {ms(result['page_newest'], 'p50')} p99 {ms(result['page_newest'], 'p99')}"
+        f" · deep p50 {ms(result['page_deep'], 'p50')} p99 {ms(result['page_deep'], 'p99')}"
+        f" · one user p50 {ms(result['page_user'], 'p50')} · one week p50 {ms(result['page_week'], 'p50')}",
+        f"  save       settings p50 {ms(result['save_settings'], 'p50')} p99 {ms(result['save_settings'], 'p99')}"
+        f" · log append p50 {ms(result['save_log'], 'p50')} p99 {ms(result['save_log'], 'p99')}"
+        f" · first vent {result['first_vent_ms']:.0f}ms",
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure start-up, memory, saves and log reads at several data sizes")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000, 1000000],
+                        help="total anonymous log entries per run (default: %(default)s)")
+    parser.add_argument("--backends", nargs="+", choices=["json", "sqlite"], default=["json", "sqlite"])
+    parser.add_argument("--guilds", type=int, default=100, help="servers per data set (default: %(default)s)")
+    parser.add_argument("--samples", type=int, default=200, help="repetitions per timing (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    parser.add_argument("--probe", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.probe:
+        print(json.dumps(probe(args.samples, args.seed)))
+        return
+
+    results: List[dict] = []
+    for entries in args.sizes:
+        for backend in args.backends:
+            result = run_one(entries, backend, args.guilds, args.samples, args.seed)
+            results.append(result)
+            print(describe(result), flush=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
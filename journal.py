@@ -0,0 +1,278 @@
+"""Write-ahead journal for changes that haven't been flushed to the stores yet"""
+import asyncio
+import collections
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from storage import fsync_dir, json_default
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+def journal_dirs(data_dir: str) -> List[str]:
+    """The journal folder (``JOURNAL_DIR`` or ``<data dir>/journal``) and the per-shard folders inside it"""
+    root = os.getenv("JOURNAL_DIR") or os.path.join(data_dir, "journal")
+    if not os.path.isdir(root):
+        return []
+    subdirs = [os.path.join(root, name) for name in sorted(os.listdir(root))]
+    return [root] + [path for path in subdirs if os.path.isdir(path)]
+
+
+def apply_changes(doc: Any, changes: List[Tuple[list, Any]]):
+    """Apply ``[(path, value), ...]`` to a document: each sets the value at a path of keys and list indexes"""
+    for path, value in changes:
+        target = doc
+        for key in path[:-1]:
+            target = target[key]
+        target[path[-1]] = value
+
+
+class Journal:
+    """Records every change as it happens so a crash between flushes loses nothing.
+
+    Stores report changes through ``note()`` (a server's document changed),
+    ``change()`` (a few values in a document changed) and ``log_append()``
+    (a log entry was added). The records of one event loop tick are encoded
+    at the end of the tick and handed to the journal thread, which appends
+    everything that queued up meanwhile to the current segment file in
+    ``journal_dir`` with one write and one fsync (unless ``fsync`` is off),
+    so the event loop never waits for the disk.
+
+    A document is journaled whole the first time it changes in a segment;
+    after that, ``change()`` only records the values that changed (a mood
+    count, an activity counter), and replay applies them on top of that copy.
+    Replaying a segment twice therefore gives the same result.
+
+    Each flush starts a new segment with ``rotate()``; once the flush is
+    stored, ``release()`` has the thread delete the older segments since
+    everything in them is saved. On startup ``replay()`` puts whatever the
+    segments still hold back into the stores.
+
+    The folder is locked for as long as the journal is open: a second bot
+    process using it would replay and delete this one's segments.
+    """
+
+    def __init__(self, journal_dir: str, fsync: bool = True):
+        self.journal_dir = journal_dir
+        self.fsync = fsync
+        os.makedirs(journal_dir, exist_ok=True)
+        self._lock_fd = self._lock()
+        self._segment = max(self.segments(), default=0) + 1
+        self._docs: Dict[Tuple[str, str], Any] = {}  # (store name, guild ID) -> store
+        self._based: Set[Tuple[str, str]] = set()  # Documents journaled whole in the current segment
+        self._records: List[bytes] = []
+        self._scheduled = False
+        # Work for the journal thread: ("write", segment, data), ("release", segment, None) or ("stop", ...)
+        self._queue: "collections.deque[Tuple[str, int, Optional[bytes]]]" = collections.deque()
+        self._ready = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="journal", daemon=True)
+        self._thread.start()
+
+    def _lock(self) -> int:
+        fd = os.open(os.path.join(self.journal_dir, "lock"), os.O_WRONLY | os.O_CREAT, 0o600)
+        if fcntl is None:
+            return fd
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            raise RuntimeError(
+                f"{self.journal_dir} is in use by another bot process; "
+                "give each process its own SHARD_IDS (or JOURNAL_DIR)"
+            )
+        return fd
+
+    def segment_path(self, segment: int) -> str:
+        return os.path.join(self.journal_dir, f"{segment:08d}.journal")
+
+    def segments(self) -> List[int]:
+        """Segment numbers on disk, oldest first"""
+        return sorted(int(name.split(".")[0]) for name in os.listdir(self.journal_dir) if name.endswith(".journal"))
+
+    @property
+    def backlog(self) -> int:
+        """Batches handed to the journal thread and not written yet"""
+        return len(self._queue)
+
+    def attach(self, stores: List[Any]):
+        """Start journaling the changes of ``stores``"""
+        for store in stores:
+            store.journal = self
+
+    def note(self, store: Any, guild_id: str):
+        """A server's document in ``store`` changed; its new value is journaled at the end of this tick"""
+        self._docs[(store.name, str(guild_id))] = store
+        self._schedule()
+
+    def change(self, store: Any, guild_id: str, changes: List[Tuple[list, Any]]):
+        """Only the values at the given paths of a server's document changed (see ``apply_changes()``)"""
+        key = (store.name, str(guild_id))
+        if key in self._docs:
+            return  # Journaled whole at the end of this tick anyway
+        if key not in self._based:
+            self.note(store, guild_id)  # Needs a whole copy to apply the changes to on replay
+            return
+        self._records.append(self._encode({"store": key[0], "guild": key[1], "set": changes}))
+        self._schedule()
+
+    def log_append(self, store: Any, guild_id: str, line: bytes):
+        """An entry was appended to a server's log"""
+        self._records.append(self._encode({"store": store.name, "guild": str(guild_id), "line": line.decode()}))
+        self._schedule()
+
+    @staticmethod
+    def _encode(record: dict) -> bytes:
+        # Encoded right away: the values may be changed again before the tick ends
+        return json.dumps(record, separators=(",", ":"), default=json_default).encode() + b"\n"
+
+    def _schedule(self):
+        if self._scheduled:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.write_pending()  # Not running under the bot's loop (startup, scripts)
+            return
+        self._scheduled = True
+        loop.call_soon(self.write_pending)
+
+    def write_pending(self):
+        """Hand the changes collected so far to the journal thread"""
+        self._scheduled = False
+        records = self._records
+        self._records = []
+        for key, store in self._docs.items():
+            guild_id = key[1]
+            value = store.data[guild_id] if guild_id in store.data else None
+            records.append(self._encode({"store": key[0], "guild": guild_id, "doc": value}))
+            if value is None:
+                self._based.discard(key)
+            else:
+                self._based.add(key)
+        self._docs.clear()
+        if records:
+            self._submit("write", self._segment, b"".join(records))
+
+    def _submit(self, kind: str, segment: int, data: Optional[bytes] = None):
+        with self._ready:
+            self._queue.append((kind, segment, data))
+            self._ready.notify()
+
+    def _run(self):
+        """The journal thread: write whatever queued up since the last round with one fsync"""
+        fd: Optional[int] = None
+        fd_segment = 0
+        while True:
+            with self._ready:
+                while not self._queue:
+                    self._ready.wait()
+                batch = list(self._queue)
+                self._queue.clear()
+            try:
+                written = False
+                for kind, segment, data in batch:
+                    if kind == "write":
+                        if fd is not None and fd_segment != segment:
+                            if self.fsync and written:
+                                os.fsync(fd)
+                            os.close(fd)
+                            fd = None
+                            written = False
+                        if fd is None:
+                            fd = os.open(self.segment_path(segment), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+                            fd_segment = segment
+                        os.write(fd, data)
+                        written = True
+                    elif kind == "release":
+                        if fd is not None and fd_segment <= segment:
+                            os.close(fd)
+                            fd = None
+                            written = False
+                        for old in self.segments():
+                            if old <= segment:
+                                os.remove(self.segment_path(old))
+                        fsync_dir(self.journal_dir)
+                if fd is not None and self.fsync and written:
+                    os.fsync(fd)
+            except Exception as e:
+                print(f"Error writing the journal: {e}")
+            if any(kind == "stop" for kind, _, _ in batch):
+                if fd is not None:
+                    os.close(fd)
+                return
+
+    def rotate(self, carry: Optional[List[Tuple[Any, str, List[bytes]]]] = None) -> int:
+        """Start a new segment and return the number of the one that was closed.
+
+        ``carry`` lists log entries that the coming flush will not store
+        (``(store, guild ID, [line, ...])``); they are copied into the new
+        segment so releasing the old one can't lose them.
+        """
+        self.write_pending()
+        closed = self._segment
+        self._segment += 1
+        self._based.clear()
+        records = [
+            self._encode({"store": store.name, "guild": guild_id, "line": line.decode()})
+            for store, guild_id, lines in carry or ()
+            for line in lines
+        ]
+        if records:
+            self._submit("write", self._segment, b"".join(records))
+        return closed
+
+    def release(self, segment: int):
+        """Delete ``segment`` and everything older (on the journal thread); their changes have been stored"""
+        self._submit("release", segment)
+
+    def replay(self, stores: List[Any]) -> int:
+        """Put the changes of every segment back into ``stores`` and return how many were replayed.
+
+        Documents take their last journaled value plus the changes recorded
+        after it. Log entries are matched up with the end of each log first,
+        so entries that did get stored before the crash aren't added twice.
+        """
+        by_name = {store.name: store for store in stores}
+        docs: Dict[Tuple[str, str], Any] = {}
+        appends: Dict[Tuple[str, str], List[bytes]] = {}
+        for segment in self.segments():
+            with open(self.segment_path(segment), "rb") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break  # Torn write at the end of the segment
+                    if record["store"] not in by_name:
+                        continue
+                    key = (record["store"], record["guild"])
+                    if "line" in record:
+                        appends.setdefault(key, []).append(record["line"].encode())
+                    elif "set" in record:
+                        if docs.get(key) is not None:
+                            apply_changes(docs[key], record["set"])
+                    else:
+                        docs[key] = record["doc"]
+
+        for (name, guild_id), value in docs.items():
+            by_name[name].restore(guild_id, value)
+        replayed = len(docs)
+        for (name, guild_id), lines in appends.items():
+            replayed += by_name[name].restore_appends(guild_id, lines)
+        if replayed:
+            print(f"Recovered {replayed} unsaved changes from the journal")
+        return replayed
+
+    def close(self):
+        """Write everything still queued and stop the journal thread"""
+        self.write_pending()
+        if self._thread.is_alive():
+            self._submit("stop", self._segment)
+            self._thread.join()
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
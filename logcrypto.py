@@ -0,0 +1,147 @@
+"""Authenticated encryption for anonymous message logs.
+
+Only the standard library is available, so this is an encrypt-then-MAC
+construction built from well-studied primitives:
+
+* Per-server keys are derived from one master secret with HKDF-SHA256
+  (RFC 5869), so every server's logs use independent encryption and MAC keys.
+* Encryption XORs the plaintext with a SHAKE-256 keystream over
+  ``key || nonce`` (a fresh random 16-byte nonce per entry).
+* An HMAC-SHA256 tag covers the version, associated data, nonce and
+  ciphertext and is checked in constant time before anything is decrypted.
+
+The master secret comes from ``ANON_LOG_KEY``; if that isn't set a random one
+is generated once and kept in ``<data dir>/anon_logs.key``.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+from typing import Dict, Optional, Tuple
+
+VERSION = b"v1"
+NONCE_SIZE = 16
+TAG_SIZE = 32
+
+
+class DecryptionError(Exception):
+    """Raised when a sealed value was tampered with or sealed under another key"""
+
+
+def hkdf_sha256(secret: bytes, salt: bytes, info: bytes, length: int) -> bytes:
+    """HKDF-SHA256 extract-and-expand (RFC 5869)"""
+    prk = hmac.new(salt, secret, hashlib.sha256).digest()
+    output = b""
+    block = b""
+    counter = 1
+    while len(output) < length:
+        block = hmac.new(prk, block + info + bytes([counter]), hashlib.sha256).digest()
+        output += block
+        counter += 1
+    return output[:length]
+
+
+def load_master_key(data_dir: str) -> bytes:
+    """The master secret from ANON_LOG_KEY, or a generated one stored in the data folder"""
+    configured = os.getenv("ANON_LOG_KEY")
+    if configured:
+        return configured.encode()
+
+    key_path = os.path.join(data_dir, "anon_logs.key")
+    if os.path.exists(key_path):
+        with open(key_path, "r") as f:
+            return f.read().strip().encode()
+
+    os.makedirs(data_dir, exist_ok=True)
+    key = secrets.token_hex(32)
+    # Written under a per-process name (readable by the bot's user only) and linked into place
+    tmp_path = f"{key_path}.{os.getpid()}.tmp"
+    try:
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(key)
+            f.flush()
+            os.fsync(f.fileno())
+        # A link fails if another shard's process created the key first; use theirs then
+        os.link(tmp_path, key_path)
+    except FileExistsError:
+        with open(key_path, "r") as f:
+            return f.read().strip().encode()
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    print(f"⚠️ ANON_LOG_KEY is not set; generated a key in {key_path}. Back it up - logs can't be read without it.")
+    return key.encode()
+
+
+class LogCipher:
+    """Seals and opens anonymous log fields with per-server keys"""
+
+    def __init__(self, master_key: bytes):
+        self._master_key = master_key
+        self._keys: Dict[str, Tuple[bytes, bytes]] = {}
+
+    def _guild_keys(self, guild_id: str) -> Tuple[bytes, bytes]:
+        keys = self._keys.get(guild_id)
+        if keys is None:
+            material = hkdf_sha256(self._master_key, b"mentalhealthbot anon logs", f"guild:{guild_id}".encode(), 64)
+            keys = self._keys[guild_id] = (material[:32], material[32:])
+        return keys
+
+    @staticmethod
+    def _keystream(key: bytes, nonce: bytes, length: int) -> bytes:
+        return hashlib.shake_256(key + nonce).digest(length)
+
+    def seal(self, guild_id: str, data: dict, associated: str = "") -> str:
+        """Encrypt and authenticate a JSON-able dict; returns printable text"""
+        enc_key, mac_key = self._guild_keys(str(guild_id))
+        plaintext = json.dumps(data, separators=(",", ":")).encode()
+        nonce = secrets.token_bytes(NONCE_SIZE)
+        ciphertext = bytes(a ^ b for a, b in zip(plaintext, self._keystream(enc_key, nonce, len(plaintext))))
+        tag = hmac.new(mac_key, VERSION + associated.encode() + b"\0" + nonce + ciphertext, hashlib.sha256).digest()
+        return VERSION.decode() + ":" + base64.urlsafe_b64encode(nonce + ciphertext + tag).decode()
+
+    def open(self, guild_id: str, sealed: str, associated: str = "") -> dict:
+        """Verify and decrypt a value from ``seal()``; raises ``DecryptionError`` if it doesn't check out"""
+        enc_key, mac_key = self._guild_keys(str(guild_id))
+        version, _, payload = sealed.partition(":")
+        if version.encode() != VERSION:
+            raise DecryptionError(f"Unsupported sealed value version {version!r}")
+        try:
+            raw = base64.urlsafe_b64decode(payload)
+        except ValueError:
+            raise DecryptionError("Sealed value is not valid base64")
+        if len(raw) < NONCE_SIZE + TAG_SIZE:
+            raise DecryptionError("Sealed value is too short")
+        nonce, ciphertext, tag = raw[:NONCE_SIZE], raw[NONCE_SIZE:-TAG_SIZE], raw[-TAG_SIZE:]
+        expected = hmac.new(mac_key, VERSION + associated.encode() + b"\0" + nonce + ciphertext, hashlib.sha256).digest()
+        if not hmac.compare_digest(tag, expected):
+            raise DecryptionError("Authentication failed")
+        plaintext = bytes(a ^ b for a, b in zip(ciphertext, self._keystream(enc_key, nonce, len(ciphertext))))
+        return json.loads(plaintext)
+
+    def fingerprint(self, guild_id: str, text: str) -> str:
+        """Keyed hash for spotting repeated messages without revealing them"""
+        _, mac_key = self._guild_keys(str(guild_id))
+        return hmac.new(mac_key, b"fingerprint\0" + text.encode(), hashlib.sha256).hexdigest()[:16]
+
+    def reseal_legacy(self, guild_id: str, entry: dict) -> Optional[dict]:
+        """The sealed version of a log entry from before encryption, or None if it is already sealed"""
+        if "sealed" in entry:
+            return None
+        record = open_legacy(entry)
+        resealed = {key: value for key, value in entry.items() if key not in LEGACY_FIELDS}
+        resealed["message_hash"] = self.fingerprint(guild_id, record["content"])
+        resealed["sealed"] = self.seal(guild_id, record, associated=f"{entry['timestamp']}|{entry['user_id']}")
+        return resealed
+
+
+# Fields of log entries written before encryption, each only base64 encoded
+LEGACY_FIELDS = {"encoded_username": "username", "encoded_display_name": "display_name", "encoded_content": "content"}
+
+
+def open_legacy(entry: dict) -> dict:
+    """Decode a log entry from before encryption (see ``reseal_logs.py``)"""
+    return {name: base64.b64decode(entry[field]).decode() for field, name in LEGACY_FIELDS.items()}
@@ -1,16 +1,25 @@
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands
 import datetime
-import json
+import time
 import os
 import asyncio
 import random
-import secrets
-import hashlib
-import base64
+import signal
 import pytz
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Set
 from dotenv import load_dotenv
+from access_codes import AccessCodeRegistry
+from analytics import ActivityRollup, MoodAnalytics, sparkline
+from retention import RetentionManager
+from scheduler import CheckinSchedule, CheckinScheduler
+from sharding import ShardPlan
+from sticky import StickyManager
+from journal import Journal
+from logcrypto import LogCipher, load_master_key, open_legacy
+from metrics import Metrics
+from ratelimit import RateLimiter, describe_wait
+from storage import DATA_DIR, WriteBehindFlusher, open_backend
 
 load_dotenv()  # this loads the .env file so your secrets can be read
 
@@ -19,60 +28,165 @@ intents.message_content = True
 intents.guilds = True
 intents.members = True
 
-bot = commands.Bot(command_prefix='!', intents=intents, help_command=None)
-
-# Load saved settings (per server)
-if os.path.exists("settings.json"):
-    with open("settings.json", "r") as f:
-        server_settings = json.load(f)
-else:
-    server_settings = {}
-
-# Load last messages for deletion
-if os.path.exists("last_messages.json"):
-    with open("last_messages.json", "r") as f:
-        last_messages = json.load(f)
-else:
-    last_messages = {}
-
-# Load sticky messages for vent channels
-if os.path.exists("sticky_messages.json"):
-    with open("sticky_messages.json", "r") as f:
-        sticky_messages = json.load(f)
-else:
-    sticky_messages = {}
-
-# Load dismissed users
-if os.path.exists("dismissed_users.json"):
-    with open("dismissed_users.json", "r") as f:
-        dismissed_users = json.load(f)
-else:
-    dismissed_users = {}
-
-# Load anonymous logs (encrypted)
-if os.path.exists("anon_logs.json"):
-    with open("anon_logs.json", "r") as f:
-        anon_logs = json.load(f)
-else:
-    anon_logs = {}
-
-# Load access codes for log viewing
-if os.path.exists("access_codes.json"):
-    with open("access_codes.json", "r") as f:
-        access_codes = json.load(f)
-else:
-    access_codes = {}
-
-# Load moderator access tracking
-if os.path.exists("moderator_access.json"):
-    with open("moderator_access.json", "r") as f:
-        moderator_access = json.load(f)
-else:
-    moderator_access = {}
+# Handler timings, Discord REST calls per route and queue depths for !metrics (and METRICS_PORT)
+metrics = Metrics()
+
+# Shards this process runs (SHARD_COUNT / SHARD_IDS); it only loads, schedules and saves their servers
+shard_plan = ShardPlan.from_env()
+
+class MentalHealthBot(commands.AutoShardedBot):
+    """Bot that owns the background data flusher"""
+
+    _terminating: Optional[asyncio.Task] = None  # close() started by SIGTERM
+
+    async def setup_hook(self):
+        flusher.start()
+        access_code_registry.start(save_data)
+        retention_manager.start(lambda: {guild_id for guild_id, settings in server_settings.items() if settings.get('retention')})
+        # Optional Prometheus endpoint, local only unless METRICS_HOST says otherwise
+        metrics_port = os.getenv("METRICS_PORT")
+        if metrics_port:
+            try:
+                await metrics.serve(os.getenv("METRICS_HOST", "127.0.0.1"), int(metrics_port))
+            except (OSError, ValueError) as e:
+                print(f"Could not start the metrics endpoint: {e}")
+        # Hosting platforms stop the bot with SIGTERM; shut down cleanly so pending data is saved
+        try:
+            self.loop.add_signal_handler(signal.SIGTERM, self._on_sigterm)
+        except NotImplementedError:
+            pass  # Signal handlers aren't available on Windows event loops
+
+    def _on_sigterm(self):
+        if self._terminating is None:
+            self._terminating = asyncio.create_task(self.close())
+
+    async def __aexit__(self, *exc_info):
+        await super().__aexit__(*exc_info)
+        # bot.run() returns as soon as the connection is closed and would cancel a SIGTERM close()
+        # while it is still saving; wait for the final flush here instead
+        if self._terminating is not None:
+            await self._terminating
+
+    async def close(self):
+        await metrics.stop()
+        access_code_registry.stop()
+        sticky_manager.close()
+        # Posts in flight still need the connection, and their mood stats the final flush
+        await checkin_scheduler.stop()
+        await retention_manager.stop()
+        await super().close()
+        await flusher.close()
+        backend.close()
+
+bot = MentalHealthBot(
+    command_prefix='!', intents=intents, help_command=None, http_trace=metrics.http_trace(),
+    shard_count=shard_plan.shard_count, shard_ids=shard_plan.shard_ids,
+)
+
+# Per-server state, one store per kind of data (JSON files or SQLite, see STORAGE_BACKEND).
+# Settings, check-in and sticky messages are loaded at startup to schedule and route; everything
+# else is loaded per server on first use and dropped again when idle (GUILD_CACHE_SIZE servers kept).
+# Only this process's servers are touched, so shard processes can share the data folder
+backend = open_backend(owns=shard_plan.owns, import_legacy=shard_plan.primary)
+settings_store = backend.document_store("settings")
+last_messages_store = backend.document_store("last_messages")
+sticky_messages_store = backend.document_store("sticky_messages")
+dismissed_users_store = backend.lazy_document_store("dismissed_users")
+anon_logs_store = backend.log_store("anon_logs", time_field="timestamp")  # Anonymous logs (encrypted)
+log_cipher = LogCipher(load_master_key(DATA_DIR))
+access_codes_store = backend.lazy_document_store("access_codes")  # Access codes for log viewing
+moderator_access_store = backend.log_store("moderator_access", time_field="accessed_at")  # Moderator access tracking
+mood_stats_store = backend.lazy_document_store("mood_stats")  # Check-in mood counts per day
+activity_store = backend.lazy_document_store("activity")  # Rolling vent / log view counters for !stats
+
+stores = [
+    settings_store,
+    last_messages_store,
+    sticky_messages_store,
+    dismissed_users_store,
+    anon_logs_store,
+    access_codes_store,
+    moderator_access_store,
+    mood_stats_store,
+    activity_store,
+]
+
+server_settings = settings_store.data
+last_messages = last_messages_store.data
+sticky_messages = sticky_messages_store.data
+dismissed_users = dismissed_users_store.data
+
+# One-time log access codes expire after ACCESS_CODE_TTL seconds (default 1 hour)
+access_code_registry = AccessCodeRegistry(access_codes_store, ttl=float(os.getenv("ACCESS_CODE_TTL", "3600")))
+
+# Every change is journaled as it happens and replayed after a crash, so nothing
+# made between two background flushes is lost (set JOURNAL_FSYNC=0 to skip the fsyncs).
+# Each shard process keeps its own journal folder (JOURNAL_DIR picks another one)
+journal = Journal(
+    os.getenv("JOURNAL_DIR") or shard_plan.partition_path(os.path.join(DATA_DIR, "journal")),
+    fsync=os.getenv("JOURNAL_FSYNC", "1") != "0",
+)
+recovered = journal.replay(stores)
+
+# Writes changed servers to disk in the background (seconds between flushes)
+flusher = WriteBehindFlusher(stores, backend, interval=float(os.getenv("FLUSH_INTERVAL", "5")), journal=journal)
+if recovered:
+    flusher.flush_now()
+journal.attach(stores)
+
+# Old anonymous logs are purged on the writer thread according to each server's !retention policy
+retention_manager = RetentionManager(
+    anon_logs_store,
+    lambda guild_id: server_settings.get(guild_id, {}).get('retention'),
+    flusher.run,
+    interval=float(os.getenv("RETENTION_INTERVAL", "3600")),
+)
+
+# Older versions stored a vent channel's sticky as a bare message ID; convert those once
+for guild_id, sticky_info in list(sticky_messages.items()):
+    if isinstance(sticky_info, str):
+        vent_channel_id = server_settings.get(guild_id, {}).get('vent_channel')
+        if vent_channel_id is None:
+            del sticky_messages[guild_id]
+        else:
+            sticky_messages[guild_id] = {"message_id": sticky_info, "channel_id": str(vent_channel_id)}
+        sticky_messages_store.mark_dirty(guild_id)
+sticky_messages_store.flush()
 
 # Track setup sessions
 setup_sessions = {}
 
+# Channels on_message has to look at, so every other message is skipped with one lookup
+VENT_ROUTE = "vent"
+SETUP_ROUTE = "setup"
+channel_routes: Dict[int, Set[str]] = {}
+
+def add_channel_route(channel_id, role: str):
+    """Mark a channel as needing on_message handling"""
+    channel_routes.setdefault(int(channel_id), set()).add(role)
+
+def remove_channel_route(channel_id, role: str):
+    """Stop on_message handling of a channel for one role"""
+    roles = channel_routes.get(int(channel_id))
+    if roles is not None:
+        roles.discard(role)
+        if not roles:
+            del channel_routes[int(channel_id)]
+
+for sticky_info in sticky_messages.values():
+    add_channel_route(sticky_info["channel_id"], VENT_ROUTE)
+
+def end_setup_session(guild_id: str, user_id: str):
+    """Forget a user's setup session and stop watching its channel if it was the last one there"""
+    session = setup_sessions.get(guild_id, {}).pop(user_id, None)
+    if guild_id in setup_sessions and not setup_sessions[guild_id]:
+        del setup_sessions[guild_id]
+    if session is None:
+        return
+    channel_id = session['channel_id']
+    if not any(other['channel_id'] == channel_id for sessions in setup_sessions.values() for other in sessions.values()):
+        remove_channel_route(channel_id, SETUP_ROUTE)
+
 checkin_message = (
     "Hey {ping}! Please let us know how you're feeling today 💖\n\n"
     "❤️ - I'm doing amazing today!\n"
@@ -89,95 +203,153 @@ checkin_message = (
 
 emojis = ["❤️", "🧡", "💛", "💚", "💙", "💜", "🖤", "🤍"]
 
+# What each mood emoji means, in the same order (used by the mood menu layout)
+mood_descriptions = [
+    "I'm doing amazing today!",
+    "I'm feeling positive and good about life",
+    "I'm good",
+    "I could be better, could be worse but I'm okay!",
+    "I'm having a down day",
+    "I feel lost and broken",
+    "I'm in a really dark place today",
+    "I'd like someone to DM me if they could...",
+]
+
+# Check-in layouts: mood reactions on the post, or a menu on the post itself (one API call)
+CHECKIN_LAYOUTS = {
+    "reactions": "Mood reactions under the post",
+    "menu": "A mood menu on the post (no reactions)",
+}
+
+# Mood counts per server and check-in day, fed by reactions on the check-in posts
+mood_analytics = MoodAnalytics(mood_stats_store, emojis)
+for guild_id, tracked in last_messages.items():
+    if 'daily_checkin' in tracked and 'daily_checkin_date' in tracked:
+        mood_analytics.track_checkin(guild_id, int(tracked['daily_checkin']), tracked['daily_checkin_date'])
+
+@metrics.timed("save_data")
 def save_data():
-    """Save all data to files"""
-    with open("settings.json", "w") as f:
-        json.dump(server_settings, f, indent=2)
-    with open("last_messages.json", "w") as f:
-        json.dump(last_messages, f, indent=2)
-    with open("sticky_messages.json", "w") as f:
-        json.dump(sticky_messages, f, indent=2)
-    with open("dismissed_users.json", "w") as f:
-        json.dump(dismissed_users, f, indent=2)
-    with open("anon_logs.json", "w") as f:
-        json.dump(anon_logs, f, indent=2)
-    with open("access_codes.json", "w") as f:
-        json.dump(access_codes, f, indent=2)
-    with open("moderator_access.json", "w") as f:
-        json.dump(moderator_access, f, indent=2)
+    """Queue the servers whose data changed to be saved by the background flusher"""
+    if flusher.running:
+        flusher.request_flush()
+    else:
+        flusher.flush_now()
 
 def log_anonymous_message(guild_id: str, message_content: str, channel_id: str, user_id: str, username: str, display_name: str):
     """Log anonymous message with user information for moderation"""
     timestamp = datetime.datetime.now().isoformat()
     
-    # Create a hash of the message for identification
-    message_hash = hashlib.sha256(message_content.encode()).hexdigest()[:16]
-    
-    # Encode the message content
-    encoded_message = base64.b64encode(message_content.encode()).decode()
+    # Keyed hash of the message for identification (a plain hash would let short messages be guessed)
+    message_hash = log_cipher.fingerprint(guild_id, message_content)
     
-    # Encode user information for security
-    encoded_username = base64.b64encode(username.encode()).decode()
-    encoded_display_name = base64.b64encode(display_name.encode()).decode()
+    # Encrypt the message and who sent it; the timestamp and user ID stay readable for the index
+    # and are bound to the ciphertext so entries can't be swapped around
+    sealed = log_cipher.seal(guild_id, {
+        "username": username,
+        "display_name": display_name,
+        "content": message_content,
+    }, associated=f"{timestamp}|{user_id}")
     
     log_entry = {
         "timestamp": timestamp,
         "guild_id": guild_id,
         "channel_id": channel_id,
         "user_id": user_id,
-        "encoded_username": encoded_username,
-        "encoded_display_name": encoded_display_name,
         "message_hash": message_hash,
-        "encoded_content": encoded_message
+        "sealed": sealed
     }
     
-    if guild_id not in anon_logs:
-        anon_logs[guild_id] = []
-    
-    anon_logs[guild_id].append(log_entry)
+    # Count before appending so a first-time rebuild from the log doesn't see this entry twice
+    vent_activity.record(guild_id)
+    anon_logs_store.append(guild_id, log_entry)
     save_data()
 
+def open_log_entry(guild_id: str, log: dict) -> dict:
+    """Decrypt one anonymous log entry (older entries were only base64 encoded)"""
+    if 'sealed' in log:
+        return log_cipher.open(guild_id, log['sealed'], associated=f"{log['timestamp']}|{log['user_id']}")
+    return open_legacy(log)  # Sealed for good by reseal_logs.py
+
 def generate_access_code(guild_id: str) -> str:
     """Generate a one-time access code for log viewing"""
-    code = secrets.token_hex(16)
-    
-    if guild_id not in access_codes:
-        access_codes[guild_id] = {}
-    
-    access_codes[guild_id][code] = {
-        "created": datetime.datetime.now().isoformat(),
-        "used": False
-    }
+    code = access_code_registry.issue(guild_id)
     
     save_data()
     return code
 
 def use_access_code(guild_id: str, code: str, user_id: str) -> bool:
     """Use an access code and track who used it"""
-    if guild_id not in access_codes or code not in access_codes[guild_id]:
-        return False
-    
-    if access_codes[guild_id][code]["used"]:
+    if not access_code_registry.redeem(guild_id, code):
+        save_data()  # An expired code may still have been dropped
         return False
     
-    # Mark code as used
-    access_codes[guild_id][code]["used"] = True
-    access_codes[guild_id][code]["used_by"] = user_id
-    access_codes[guild_id][code]["used_at"] = datetime.datetime.now().isoformat()
-    
     # Track moderator access
-    if guild_id not in moderator_access:
-        moderator_access[guild_id] = []
-    
-    moderator_access[guild_id].append({
+    log_view_activity.record(guild_id)
+    moderator_access_store.append(guild_id, {
         "user_id": user_id,
         "accessed_at": datetime.datetime.now().isoformat(),
-        "access_code": code
+        "access_code_id": access_code_registry.code_id(code)
     })
     
     save_data()
     return True
 
+# Token buckets (burst, seconds per token) so one user - or a raid - can't use up the bot's Discord API budget.
+# Vents are limited per user, per server and per vent channel (Discord allows about 5 messages per 5 seconds there)
+vent_limiter = RateLimiter(user=(3, 60), guild=(20, 6), channel=(5, 1))
+# Opening the vent form
+button_limiter = RateLimiter(user=(5, 10))
+# Commands, checked before the permission checks so spamming them is cheap too
+command_limiter = RateLimiter(user=(5, 10), guild=(20, 3))
+# At most one "slow down" reply per user every 30 seconds for commands, or the replies become the spam
+throttle_notice_limiter = RateLimiter(user=(1, 30))
+
+THROTTLE_MESSAGES = {
+    ("vent", "user"): (
+        "💙 You've shared a lot in a short time, and that's okay. Take a breath - you can post again in {wait}.\n\n"
+        "If you're struggling right now, please reach out to someone you trust or a local helpline."
+    ),
+    ("vent", "guild"): "🌧️ Lots of people are venting right now. Please try again in {wait} - your feelings still matter. 💙",
+    ("vent", "channel"): "🌧️ The vent channel is really busy right now. Please try again in {wait} - your feelings still matter. 💙",
+    ("vent_button", "user"): "⏳ Easy there - give it {wait} before opening the vent form again.",
+    ("command", "user"): "⏳ Slow down a little - you can use my commands again in {wait}.",
+    ("command", "guild"): "⏳ This server is using my commands a lot right now. Please try again in {wait}.",
+}
+
+def throttle_message(action: str, scope: str, wait: float) -> str:
+    return THROTTLE_MESSAGES[(action, scope)].format(wait=describe_wait(wait))
+
+async def vent_button_throttled(interaction: discord.Interaction) -> bool:
+    """Turn away vent button clicks over the limit (privately); True if the click was refused"""
+    action = "vent_button"
+    scope, wait = button_limiter.hit(user=interaction.user.id)
+    if scope is None:
+        # Don't open the form if the vent itself would be refused
+        action = "vent"
+        scope, wait = vent_limiter.check(user=interaction.user.id, guild=interaction.guild.id)
+    if scope is None:
+        return False
+    metrics.throttle("vent_button", scope)
+    await interaction.response.send_message(throttle_message(action, scope, wait), ephemeral=True)
+    return True
+
+class CommandThrottled(commands.CheckFailure):
+    """A command turned away by ``command_limiter``"""
+
+    def __init__(self, scope: str, retry_after: float):
+        super().__init__(f"Command rate limit ({scope}) reached")
+        self.scope = scope
+        self.retry_after = retry_after
+
+def rate_limited():
+    """Command check applying ``command_limiter``; put it above the permission checks"""
+    async def predicate(ctx):
+        scope, wait = command_limiter.hit(user=ctx.author.id, guild=ctx.guild.id if ctx.guild else "dm")
+        if scope is not None:
+            raise CommandThrottled(scope, wait)
+        return True
+    return commands.check(predicate)
+
 class CheckinVentView(discord.ui.View):
     """View for daily check-in with anonymous vent button"""
     def __init__(self):
@@ -186,6 +358,8 @@ class CheckinVentView(discord.ui.View):
     @discord.ui.button(label='🫣 Vent Anonymously', style=discord.ButtonStyle.secondary, custom_id='checkin_vent')
     async def anonymous_vent(self, interaction: discord.Interaction, button: discord.ui.Button):
         """Handle anonymous vent button clicks from check-in"""
+        if await vent_button_throttled(interaction):
+            return
         guild_id = str(interaction.guild.id)
         
         # Check if server has vent channel configured
@@ -198,6 +372,30 @@ class CheckinVentView(discord.ui.View):
             
         await interaction.response.send_modal(AnonymousVentModal(from_checkin=True))
 
+class CheckinMoodView(CheckinVentView):
+    """Check-in view with a mood menu as well as the vent button"""
+
+    @discord.ui.select(
+        custom_id='checkin_mood',
+        placeholder='💖 How are you feeling today?',
+        row=1,
+        options=[
+            discord.SelectOption(label=description, value=str(i), emoji=emoji)
+            for i, (emoji, description) in enumerate(zip(emojis, mood_descriptions))
+        ]
+    )
+    async def mood_select(self, interaction: discord.Interaction, select: discord.ui.Select):
+        """Record a mood picked from the check-in menu"""
+        position = int(select.values[0])
+        if not mood_analytics.record_choice(interaction.message.id, interaction.user.id, position):
+            await interaction.response.send_message("⏰ This check-in has closed - keep an eye out for the next one!", ephemeral=True)
+            return
+        save_data()
+        await interaction.response.send_message(
+            f"{emojis[position]} Thanks for checking in! Remember, you're not alone. 💙",
+            ephemeral=True
+        )
+
 class TimezoneSelect(discord.ui.Select):
     """Timezone selection dropdown"""
     def __init__(self):
@@ -233,6 +431,13 @@ class TimezoneSelect(discord.ui.Select):
             
         session = setup_sessions[guild_id][user_id]
         
+        # Make sure the timezone is usable before moving on to the time step
+        try:
+            pytz.timezone(self.values[0])
+        except pytz.UnknownTimeZoneError:
+            await interaction.response.send_message("❌ That timezone isn't supported. Please pick another one.", ephemeral=True)
+            return
+        
         # Save timezone selection
         session['data']['timezone'] = self.values[0]
         session['step'] = 7
@@ -264,6 +469,8 @@ class AnonymousVentView(discord.ui.View):
     @discord.ui.button(label='🫣 Vent Anonymously', style=discord.ButtonStyle.secondary, custom_id='anonymous_vent')
     async def anonymous_vent(self, interaction: discord.Interaction, button: discord.ui.Button):
         """Handle anonymous vent button clicks"""
+        if await vent_button_throttled(interaction):
+            return
         guild_id = str(interaction.guild.id)
         
         # Check if server has vent channel configured
@@ -291,6 +498,7 @@ class AnonymousVentModal(discord.ui.Modal, title='Anonymous Vent'):
         required=True
     )
 
+    @metrics.timed("vent_submit")
     async def on_submit(self, interaction: discord.Interaction):
         guild_id = str(interaction.guild.id)
         
@@ -314,6 +522,14 @@ class AnonymousVentModal(discord.ui.Modal, title='Anonymous Vent'):
             )
             return
 
+        scope, wait = vent_limiter.hit(user=interaction.user.id, guild=guild_id, channel=vent_channel.id)
+        if scope is not None:
+            metrics.throttle("vent", scope)
+            # Hand the message back so it isn't lost
+            kept = discord.Embed(title="Your message (not posted)", description=self.message.value, color=0x2b2d31)
+            await interaction.response.send_message(throttle_message("vent", scope, wait), embed=kept, ephemeral=True)
+            return
+
         # Log the anonymous message with user info for moderation
         log_anonymous_message(
             guild_id, 
@@ -334,7 +550,9 @@ class AnonymousVentModal(discord.ui.Modal, title='Anonymous Vent'):
         embed.set_footer(text="Stay strong 💙 You're not alone")
 
         try:
-            await vent_channel.send(embed=embed)
+            vent_message = await vent_channel.send(embed=embed)
+            # The vent post pushed the button up; bring it back down once things settle
+            sticky_manager.note_activity(vent_channel, vent_message.id)
             
             # Create response with link to vent channel
             response_text = (
@@ -360,67 +578,64 @@ class SimpleVentView(discord.ui.View):
     @discord.ui.button(label='🫣 Vent Anonymously', style=discord.ButtonStyle.primary, custom_id='simple_vent')
     async def simple_vent(self, interaction: discord.Interaction, button: discord.ui.Button):
         """Handle simple vent button clicks"""
+        if await vent_button_throttled(interaction):
+            return
         await interaction.response.send_modal(AnonymousVentModal())
 
 @bot.event
 async def on_ready():
     """Bot ready event"""
-    print(f'{bot.user} has connected to Discord!')
+    print(f'{bot.user} has connected to Discord! (shards {", ".join(map(str, sorted(bot.shards)))} of {bot.shard_count})')
     
     # Add persistent views
     bot.add_view(AnonymousVentView())
     bot.add_view(SimpleVentView())
     bot.add_view(CheckinVentView())
+    bot.add_view(CheckinMoodView())
     
-    # Start daily check-in task
-    if not daily_checkin.is_running():
-        daily_checkin.start()
-
-@tasks.loop(minutes=1)
-async def daily_checkin():
-    """Check if it's time to post daily check-ins for any server"""
-    try:
-        current_time = datetime.datetime.now(pytz.UTC)
-        
+    # Start daily check-in scheduler
+    if not checkin_scheduler.running:
         for guild_id, settings in server_settings.items():
-            if 'time' not in settings or 'timezone' not in settings:
-                continue
-                
             try:
-                # Parse the configured time
-                time_parts = settings['time'].split(':')
-                hour = int(time_parts[0])
-                minute = int(time_parts[1])
-                
-                # Get timezone
-                try:
-                    tz = pytz.timezone(settings['timezone'])
-                except:
-                    tz = pytz.UTC
-                
-                # Get current time in the server's timezone
-                local_time = current_time.astimezone(tz)
-                
-                # Check if it's the right time (within the minute)
-                if local_time.hour == hour and local_time.minute == minute:
-                    
-                    # Check if we already posted today
-                    today_key = local_time.strftime('%Y-%m-%d')
-                    if guild_id not in last_messages:
-                        last_messages[guild_id] = {}
-                    
-                    if 'last_checkin_date' not in last_messages[guild_id] or last_messages[guild_id]['last_checkin_date'] != today_key:
-                        await post_daily_checkin(guild_id)
-                        last_messages[guild_id]['last_checkin_date'] = today_key
-                        save_data()
-                        
-            except Exception as e:
-                print(f"Error processing daily checkin for guild {guild_id}: {e}")
-                continue
-                
-    except Exception as e:
-        print(f"Error in daily_checkin task: {e}")
+                checkin_scheduler.schedule(guild_id, CheckinSchedule.from_settings(settings))
+            except ValueError as e:
+                print(f"Daily check-ins disabled for guild {guild_id}: {e}")
+        checkin_scheduler.start()
+
+def guild_tz(guild_id: str):
+    """The server's check-in timezone (UTC until it is set up)"""
+    schedule = checkin_scheduler.schedules.get(str(guild_id))
+    return schedule.tz if schedule else pytz.UTC
+
+def guild_today(guild_id: str) -> datetime.date:
+    """Today's date in the server's check-in timezone"""
+    return datetime.datetime.now(guild_tz(guild_id)).date()
+
+# Per-day and per-hour activity counters, kept up to date as things happen
+vent_activity = ActivityRollup(activity_store, "vents", anon_logs_store, guild_tz)
+log_view_activity = ActivityRollup(activity_store, "log_views", moderator_access_store, guild_tz)
 
+async def daily_checkin(guild_id: str, today_key: str):
+    """Post a server's scheduled check-in unless it already went out today"""
+    if guild_id not in server_settings:
+        return
+    if guild_id not in last_messages:
+        last_messages[guild_id] = {}
+    
+    if last_messages[guild_id].get('last_checkin_date') != today_key:
+        await post_daily_checkin(guild_id)
+        last_messages[guild_id]['last_checkin_date'] = today_key
+        last_messages_store.mark_dirty(guild_id)
+        save_data()
+
+# Wakes up only when the next server's check-in is due, then posts due servers in parallel
+checkin_scheduler = CheckinScheduler(
+    daily_checkin,
+    max_concurrency=int(os.getenv("CHECKIN_CONCURRENCY", "20")),
+    timeout=float(os.getenv("CHECKIN_TIMEOUT", "120")),
+)
+
+@metrics.timed("post_daily_checkin")
 async def post_daily_checkin(guild_id: str):
     """Post daily check-in message"""
     try:
@@ -438,11 +653,10 @@ async def post_daily_checkin(guild_id: str):
             print(f"Channels not found for guild {guild_id}")
             return
 
-        # 🔹 Delete the previous check-in message if it exists
+        # 🔹 Delete the previous check-in message if it exists (no need to fetch it first)
         if guild_id in last_messages and "daily_checkin" in last_messages[guild_id]:
             try:
-                old_message = await channel.fetch_message(int(last_messages[guild_id]["daily_checkin"]))
-                await old_message.delete()
+                await channel.get_partial_message(int(last_messages[guild_id]["daily_checkin"])).delete()
             except Exception as e:
                 print(f"Could not delete old check-in message in guild {guild_id}: {e}")
         
@@ -452,23 +666,27 @@ async def post_daily_checkin(guild_id: str):
             support_channel=support_channel.mention
         )
         
-        # Create view with anonymous vent button
-        view = CheckinVentView()
+        # Create view with anonymous vent button (and the mood menu in menu layout)
+        use_menu = settings.get('checkin_layout') == 'menu'
+        view = CheckinMoodView() if use_menu else CheckinVentView()
         
         # Send the message
         message = await channel.send(formatted_message, view=view)
+        checkin_date = guild_today(guild_id).strftime('%Y-%m-%d')
+        mood_analytics.track_checkin(guild_id, message.id, checkin_date)
         
-        # Add reactions
-        for emoji in emojis:
-            try:
-                await message.add_reaction(emoji)
-            except:
-                pass
+        # Add reactions in the background so the post is usable right away
+        if not use_menu:
+            task = asyncio.create_task(seed_reactions(message, emojis))
+            background_tasks.add(task)
+            task.add_done_callback(background_tasks.discard)
         
         # Save message ID for tracking
         if guild_id not in last_messages:
             last_messages[guild_id] = {}
         last_messages[guild_id]['daily_checkin'] = str(message.id)
+        last_messages[guild_id]['daily_checkin_date'] = checkin_date
+        last_messages_store.mark_dirty(guild_id)
         save_data()
         
         print(f"Posted daily check-in for guild {guild_id}")
@@ -477,6 +695,42 @@ async def post_daily_checkin(guild_id: str):
         print(f"Error posting daily check-in for guild {guild_id}: {e}")
 
 
+# Keeps fire-and-forget tasks referenced until they finish
+background_tasks = set()
+
+async def seed_reactions(message, reactions, attempts: int = 3):
+    """Add reactions to a message in order, waiting out rate limits instead of dropping them"""
+    # Reactions on one message share a rate limit bucket and show up in the order they were
+    # added, so they go one after another; discord.py queues each request on that bucket
+    for emoji in reactions:
+        for attempt in range(attempts):
+            try:
+                await message.add_reaction(emoji)
+                break
+            except discord.HTTPException as e:
+                if e.status != 429 or attempt == attempts - 1:
+                    print(f"Could not add reaction {emoji} to message {message.id}: {e}")
+                    break
+                retry_after = float(e.response.headers.get('Retry-After', 1))
+                await asyncio.sleep(retry_after)
+
+@bot.event
+async def on_raw_reaction_add(payload):
+    """Count mood reactions on check-in posts (raw, so it works without the message cache)"""
+    if payload.guild_id is None or payload.user_id == bot.user.id:
+        return
+    if mood_analytics.record_reaction(payload.message_id, str(payload.emoji), 1):
+        save_data()
+
+@bot.event
+async def on_raw_reaction_remove(payload):
+    """Take back a mood reaction that was removed from a check-in post"""
+    if payload.guild_id is None or payload.user_id == bot.user.id:
+        return
+    if mood_analytics.record_reaction(payload.message_id, str(payload.emoji), -1):
+        save_data()
+
+@metrics.timed("handle_sticky_message")
 async def handle_sticky_message(message):
     """Handle sticky message logic for vent channels"""
     guild_id = str(message.guild.id)
@@ -487,62 +741,50 @@ async def handle_sticky_message(message):
         return
     
     sticky_info = sticky_messages[guild_id]
-    
-    # Handle both old format (string) and new format (dict)
-    if isinstance(sticky_info, str):
-        # Old format - just message ID, need to get channel from settings
-        if guild_id not in server_settings or 'vent_channel' not in server_settings[guild_id]:
-            return
-        expected_channel_id = str(server_settings[guild_id]['vent_channel'])
-        message_id = sticky_info
-    else:
-        # New format - dict with message_id and channel_id
-        expected_channel_id = sticky_info["channel_id"]
-        message_id = sticky_info["message_id"]
+    message_id = sticky_info["message_id"]
     
     # Check if this message is in the vent channel
-    if expected_channel_id != channel_id:
+    if sticky_info["channel_id"] != channel_id:
         return
     
     # Check if this message is the sticky message itself (don't restick if bot just posted it)
     if str(message.id) == message_id:
         return
     
+    # Repost once the channel quiets down instead of on every message
+    sticky_manager.note_activity(message.channel, message.id)
+
+async def repost_sticky_message(channel, last_message_id: int):
+    """Move the vent button below the newest message in a vent channel"""
+    guild_id = str(channel.guild.id)
+    sticky_info = sticky_messages.get(guild_id)
+    if sticky_info is None:
+        return
+    message_id = sticky_info["message_id"]
+    
+    # Already at the bottom
+    if str(last_message_id) == message_id:
+        return
+    
+    # Delete the old sticky without fetching it first
     try:
-        # Get the channel and find the sticky message
-        channel = message.guild.get_channel(int(channel_id))
-        if not channel:
-            return
-        
-        # Try to get the current sticky message
-        try:
-            current_sticky = await channel.fetch_message(int(message_id))
-        except discord.NotFound:
-            # Sticky message was deleted, create a new one
-            await create_new_sticky_message(channel, guild_id)
-            return
-        
-        # Check if the sticky message is still the last message in the channel
-        # Get recent messages to see if sticky is still at the bottom
-        recent_messages = [msg async for msg in channel.history(limit=10)]
-        
-        if not recent_messages:
-            return
-        
-        # If sticky message is not the most recent message, repost it
-        last_message = recent_messages[0]
-        if str(last_message.id) != message_id:
-            # Delete the old sticky and create a new one
-            try:
-                await current_sticky.delete()
-            except discord.NotFound:
-                pass  # Already deleted
-            
-            # Create new sticky message
-            await create_new_sticky_message(channel, guild_id)
+        await channel.get_partial_message(int(message_id)).delete()
+    except discord.NotFound:
+        pass  # Already deleted
     
-    except Exception as e:
-        print(f"Error handling sticky message: {e}")
+    await create_new_sticky_message(channel, guild_id)
+
+# Debounces sticky reposts per vent channel
+sticky_manager = StickyManager(repost_sticky_message)
+
+# Work waiting in the bot's queues, shown by !metrics
+metrics.gauge("checkins_queued", lambda: checkin_scheduler.queued)
+metrics.gauge("checkins_posting", lambda: checkin_scheduler.inflight)
+metrics.gauge("sticky_reposts_waiting", lambda: sticky_manager.waiting)
+metrics.gauge("unsaved_servers", lambda: sum(len(store.dirty) for store in stores))
+metrics.gauge("journal_backlog", lambda: journal.backlog)
+metrics.gauge("background_tasks", lambda: len(background_tasks))
+metrics.gauge("rate_limit_buckets", lambda: sum(map(len, (vent_limiter, button_limiter, command_limiter, throttle_notice_limiter))))
 
 async def create_new_sticky_message(channel, guild_id):
     """Create a new sticky message in the vent channel"""
@@ -554,9 +796,11 @@ async def create_new_sticky_message(channel, guild_id):
         "message_id": str(message.id),
         "channel_id": str(channel.id)
     }
+    sticky_messages_store.mark_dirty(guild_id)
     save_data()
 
 @bot.event
+@metrics.timed("on_message")
 async def on_message(message):
     """Handle incoming messages for setup wizard and sticky messages"""
     if message.author.bot:
@@ -566,24 +810,26 @@ async def on_message(message):
     if message.guild is None:
         return
     
-    # Handle sticky message logic for vent channels
-    await handle_sticky_message(message)
-    
-    guild_id = str(message.guild.id)
-    user_id = str(message.author.id)
-    
-    # Check if user is in setup session
-    if guild_id in setup_sessions and user_id in setup_sessions[guild_id]:
-        session = setup_sessions[guild_id][user_id]
+    roles = channel_routes.get(message.channel.id)
+    if roles:
+        # Handle sticky message logic for vent channels
+        if VENT_ROUTE in roles:
+            await handle_sticky_message(message)
         
-        # Delete the user's message
-        try:
-            await message.delete()
-        except:
-            pass
+        guild_id = str(message.guild.id)
+        user_id = str(message.author.id)
         
-        await handle_setup_response(message, session)
-        return
+        # Check if user is in a setup session in this channel
+        session = setup_sessions.get(guild_id, {}).get(user_id) if SETUP_ROUTE in roles else None
+        if session and session['channel_id'] == message.channel.id:
+            # Delete the user's message
+            try:
+                await message.delete()
+            except:
+                pass
+            
+            await handle_setup_response(message, session)
+            return
     
     # Process commands
     await bot.process_commands(message)
@@ -609,6 +855,12 @@ async def parse_channel(guild, content):
 
 async def setup_vent_channel(vent_channel, guild_id):
     """Setup sticky vent message in vent channel"""
+    # Stop tracking the old vent channel if setup moved it
+    old_sticky = sticky_messages.get(str(guild_id))
+    if old_sticky and old_sticky["channel_id"] != str(vent_channel.id):
+        sticky_manager.forget(int(old_sticky["channel_id"]))
+        remove_channel_route(old_sticky["channel_id"], VENT_ROUTE)
+    
     view = SimpleVentView()
     message = await vent_channel.send(view=view)
     
@@ -617,6 +869,8 @@ async def setup_vent_channel(vent_channel, guild_id):
         "message_id": str(message.id),
         "channel_id": str(vent_channel.id)
     }
+    sticky_messages_store.mark_dirty(guild_id)
+    add_channel_route(vent_channel.id, VENT_ROUTE)
     save_data()
 
 async def handle_setup_response(message, session):
@@ -730,13 +984,9 @@ async def handle_setup_response(message, session):
             
         elif step == 7:  # Time selection
             try:
-                time_parts = content.split(':')
-                if len(time_parts) != 2:
-                    raise ValueError
-                hour, minute = int(time_parts[0]), int(time_parts[1])
-                if not (0 <= hour <= 23 and 0 <= minute <= 59):
-                    raise ValueError
-                time_str = f"{hour:02d}:{minute:02d}"
+                # Timezone was already checked in step 6, so this only fails on a bad time
+                schedule = CheckinSchedule(content, session['data']['timezone'])
+                time_str = schedule.time
             except ValueError:
                 embed = discord.Embed(
                     title="❌ Invalid Time",
@@ -750,7 +1000,9 @@ async def handle_setup_response(message, session):
             # Timezone already set in step 6
             
             server_settings[str(guild.id)] = session['data']
+            settings_store.mark_dirty(guild.id)
             save_data()
+            checkin_scheduler.schedule(str(guild.id), schedule)
             
             post_ch = guild.get_channel(int(session['data']['post_channel']))
             support_ch = guild.get_channel(int(session['data']['support_channel']))
@@ -764,7 +1016,6 @@ async def handle_setup_response(message, session):
             # Get timezone display name for completion message
             timezone_display = session['data']['timezone']
             try:
-                tz = pytz.timezone(session['data']['timezone'])
                 # Try to get a more user-friendly name
                 timezone_options = {
                     "UTC": "UTC (Universal Time)",
@@ -815,11 +1066,7 @@ async def handle_setup_response(message, session):
             
             await setup_vent_channel(vent_ch, str(guild.id))
             
-            guild_id_str = str(guild.id)
-            user_id_str = str(user.id)
-            del setup_sessions[guild_id_str][user_id_str]
-            if not setup_sessions[guild_id_str]:
-                del setup_sessions[guild_id_str]
+            end_setup_session(str(guild.id), str(user.id))
             
     except Exception as e:
         print(f"Error in setup wizard step {step}: {e}")
@@ -830,12 +1077,7 @@ async def handle_setup_response(message, session):
         )
         await channel.send(embed=embed, delete_after=10)
         
-        guild_id = str(guild.id)
-        user_id = str(user.id)
-        if guild_id in setup_sessions and user_id in setup_sessions[guild_id]:
-            del setup_sessions[guild_id][user_id]
-            if not setup_sessions[guild_id]:
-                del setup_sessions[guild_id]
+        end_setup_session(str(guild.id), str(user.id))
 
 @bot.command(name='help')
 async def help_command(ctx):
@@ -895,6 +1137,8 @@ async def commands_list(ctx):
         value=(
             "`!setup` - Configure the bot for your server (channels, times, etc.)\n"
             "`!settings` - View your current server settings\n"
+            "`!checkin_style` - Use mood reactions or a mood menu on check-ins\n"
+            "`!retention` - Choose how long anonymous logs are kept\n"
             "`!force` - Test daily check-in immediately"
         ),
         inline=False
@@ -905,7 +1149,9 @@ async def commands_list(ctx):
         value=(
             "`!generate_code` - Create access code to view anonymous logs\n"
             "`!view_logs <code>` - View anonymous message logs with access code\n"
-            "`!stats` - See usage statistics for your server"
+            "`!stats` - See usage statistics for your server\n"
+            "`!mood` - See daily and weekly mood check-in results\n"
+            "`!metrics` - See response times, Discord API calls and queue sizes"
         ),
         inline=False
     )
@@ -934,6 +1180,7 @@ async def commands_list(ctx):
     await ctx.send(embed=embed)
 
 @bot.command(name='setup')
+@rate_limited()
 async def setup_command(ctx):
     """Start the setup wizard"""
     if not ctx.author.guild_permissions.administrator:
@@ -966,10 +1213,13 @@ async def setup_command(ctx):
     setup_sessions[guild_id][user_id] = {
         'step': 2,
         'message': setup_message,
+        'channel_id': ctx.channel.id,
         'data': {}
     }
+    add_channel_route(ctx.channel.id, SETUP_ROUTE)
 
 @bot.command(name='force')
+@rate_limited()
 @commands.has_permissions(manage_guild=True)
 async def force_checkin(ctx):
     """Force a daily check-in post immediately"""
@@ -986,7 +1236,81 @@ async def force_checkin(ctx):
         await ctx.send(f"❌ **Error posting daily check-in:** {str(e)}")
         print(f"Force checkin error for guild {guild_id}: {e}")
 
+@bot.command(name='checkin_style')
+@rate_limited()
+@commands.has_permissions(manage_guild=True)
+async def checkin_style_command(ctx, layout: str = None):
+    """Choose between mood reactions and a mood menu on daily check-ins"""
+    guild_id = str(ctx.guild.id)
+    
+    if guild_id not in server_settings:
+        await ctx.send("❌ **Server not configured!**\n\nPlease run `!setup` first to configure the bot.")
+        return
+    
+    current = server_settings[guild_id].get('checkin_layout', 'reactions')
+    if layout is None or layout.lower() not in CHECKIN_LAYOUTS:
+        options = "\n".join(f"`!checkin_style {name}` - {description}" for name, description in CHECKIN_LAYOUTS.items())
+        await ctx.send(f"📋 Current check-in style: **{current}**\n\n{options}")
+        return
+    
+    server_settings[guild_id]['checkin_layout'] = layout.lower()
+    settings_store.mark_dirty(guild_id)
+    save_data()
+    await ctx.send(f"✅ Daily check-ins will now use **{layout.lower()}** - {CHECKIN_LAYOUTS[layout.lower()]}")
+
+def describe_retention(policy: Optional[dict]) -> str:
+    """Human readable summary of a retention policy"""
+    policy = policy or {}
+    rules = []
+    if policy.get('max_age_days') is not None:
+        rules.append(f"for {policy['max_age_days']} days")
+    if policy.get('max_count') is not None:
+        rules.append(f"the newest {policy['max_count']} messages")
+    return "Kept " + " and at most ".join(rules) if rules else "Kept forever"
+
+@bot.command(name='retention')
+@rate_limited()
+@commands.has_permissions(manage_guild=True)
+async def retention_command(ctx, rule: str = None, value: str = None):
+    """View or change how long anonymous logs are kept"""
+    guild_id = str(ctx.guild.id)
+    
+    if guild_id not in server_settings:
+        await ctx.send("❌ **Server not configured!**\n\nPlease run `!setup` first to configure the bot.")
+        return
+    
+    policy = dict(server_settings[guild_id].get('retention') or {})
+    fields = {'days': 'max_age_days', 'count': 'max_count'}
+    if rule is None or rule.lower() not in fields or value is None:
+        status = " (purging now)" if retention_manager.active == guild_id else ""
+        await ctx.send(
+            f"🗂️ Anonymous logs: **{describe_retention(policy)}**{status} - {anon_logs_store.count(guild_id)} stored\n\n"
+            f"`!retention days <number|off>` - Delete messages older than this many days\n"
+            f"`!retention count <number|off>` - Keep only this many of the newest messages"
+        )
+        return
+    
+    if value.lower() == 'off':
+        policy.pop(fields[rule.lower()], None)
+    else:
+        try:
+            number = int(value)
+        except ValueError:
+            number = 0
+        if number < 1:
+            await ctx.send("❌ Please give a whole number of at least 1, or `off`.")
+            return
+        policy[fields[rule.lower()]] = number
+    
+    server_settings[guild_id]['retention'] = policy
+    settings_store.mark_dirty(guild_id)
+    save_data()
+    # Apply the new policy right away instead of at the next hourly check
+    retention_manager.request(guild_id)
+    await ctx.send(f"✅ Anonymous logs are now **{describe_retention(policy)}**. Older messages are removed in the background.")
+
 @bot.command(name='settings')
+@rate_limited()
 @commands.has_permissions(manage_guild=True)
 async def view_settings(ctx):
     """View current server settings"""
@@ -1032,9 +1356,27 @@ async def view_settings(ctx):
         inline=True
     )
     
+    schedule = checkin_scheduler.schedules.get(guild_id)
+    next_checkin = checkin_scheduler.next_fire_time(guild_id)
+    if schedule and next_checkin:
+        checkin_time = f"{schedule.time} {schedule.timezone}\nNext: <t:{int(next_checkin.timestamp())}:R>"
+    else:
+        checkin_time = f"{settings.get('time', '?')} {settings.get('timezone', '?')}\n❌ Invalid time or timezone - run `!setup` again"
     embed.add_field(
         name="⏰ Check-in Time",
-        value=f"{settings['time']} {settings['timezone']}",
+        value=checkin_time,
+        inline=True
+    )
+    
+    embed.add_field(
+        name="💖 Check-in Style",
+        value=settings.get('checkin_layout', 'reactions'),
+        inline=True
+    )
+    
+    embed.add_field(
+        name="🗂️ Log Retention",
+        value=describe_retention(settings.get('retention')),
         inline=True
     )
     
@@ -1047,6 +1389,7 @@ async def view_settings(ctx):
     await ctx.send(embed=embed)
 
 @bot.command(name='generate_code')
+@rate_limited()
 @commands.has_permissions(manage_guild=True)
 async def generate_code_command(ctx):
     """Generate an access code for viewing logs"""
@@ -1057,12 +1400,144 @@ async def generate_code_command(ctx):
         f"🔐 **Access Code Generated**\n\n"
         f"Your one-time access code: `{code}`\n\n"
         f"Use `!view_logs {code}` to view anonymous message logs.\n"
-        f"⚠️ This code can only be used once and will expire after use."
+        f"⚠️ This code can only be used once and expires in {round(access_code_registry.ttl / 60)} minutes."
     )
     
     await ctx.send("✅ Access code sent to your DMs!")
 
+LOG_PAGE_SIZE = 10
+
+def parse_filter_date(text: str, tz) -> Optional[float]:
+    """Unix timestamp for the start of a YYYY-MM-DD day in the server's timezone (None when blank)"""
+    text = text.strip()
+    if not text:
+        return None
+    day = datetime.datetime.strptime(text, '%Y-%m-%d')
+    return tz.localize(day).timestamp()
+
+class LogFilterModal(discord.ui.Modal, title='Filter Logs'):
+    """Modal for narrowing the log viewer down by date range and user"""
+
+    def __init__(self, viewer: "LogViewerView"):
+        super().__init__()
+        self.viewer = viewer
+        self.date_from.default = viewer.filter_text.get('from')
+        self.date_to.default = viewer.filter_text.get('to')
+        self.user.default = viewer.filter_text.get('user')
+
+    date_from = discord.ui.TextInput(label='From date (YYYY-MM-DD)', placeholder='2024-01-31', required=False, max_length=10)
+    date_to = discord.ui.TextInput(label='To date, inclusive (YYYY-MM-DD)', placeholder='2024-02-29', required=False, max_length=10)
+    user = discord.ui.TextInput(label='User ID', placeholder='123456789012345678', required=False, max_length=20)
+
+    async def on_submit(self, interaction: discord.Interaction):
+        tz = guild_tz(self.viewer.guild_id)
+        try:
+            since = parse_filter_date(self.date_from.value, tz)
+            until = parse_filter_date(self.date_to.value, tz)
+            user_id = int(self.user.value) if self.user.value.strip() else None
+        except ValueError:
+            await interaction.response.send_message("❌ Dates must look like `2024-01-31` and the user ID must be a number.", ephemeral=True)
+            return
+        if until is not None:
+            until += 24 * 60 * 60  # Include the whole "to" day
+        if user_id is not None:
+            # Looking a user up needs the log indexed by user; that pass runs on the writer thread
+            await anon_logs_store.index_users(self.viewer.guild_id, flusher.run)
+
+        self.viewer.filters = {'since': since, 'until': until, 'user_id': user_id}
+        self.viewer.filter_text = {'from': self.date_from.value, 'to': self.date_to.value, 'user': self.user.value}
+        self.viewer.cursors = [None]
+        await interaction.response.edit_message(embed=self.viewer.render(), view=self.viewer)
+
+class LogViewerView(discord.ui.View):
+    """Pages through a server's anonymous logs, newest first.
+
+    Each page is looked up in the log's index and rendered (and decrypted)
+    only when it is shown. ``cursors`` holds the position each visited page
+    starts before, so going back needs no lookups.
+    """
+    def __init__(self, guild_id: str, moderator_id: int):
+        super().__init__(timeout=600)
+        self.guild_id = guild_id
+        self.moderator_id = moderator_id
+        self.filters: Dict[str, Any] = {}
+        self.filter_text: Dict[str, str] = {}
+        self.cursors = [None]
+        self.has_older = False
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return interaction.user.id == self.moderator_id
+
+    def render(self) -> discord.Embed:
+        """Build the embed for the current page"""
+        # One extra position tells us whether there is an older page
+        positions = anon_logs_store.find(self.guild_id, before=self.cursors[-1], limit=LOG_PAGE_SIZE + 1, **self.filters)
+        self.has_older = len(positions) > LOG_PAGE_SIZE
+        total_logs = anon_logs_store.count(self.guild_id)
+
+        description = f"Showing {total_logs} anonymous messages"
+        active = [f"{label}: {self.filter_text[key]}" for key, label in (('from', 'From'), ('to', 'To'), ('user', 'User')) if self.filter_text.get(key, '').strip()]
+        if active:
+            description += f"\n🔍 {' • '.join(active)}"
+        embed = discord.Embed(
+            title="📋 Anonymous Message Logs",
+            description=description,
+            color=0xff9900
+        )
+
+        for seq, log in anon_logs_store.read_positions(self.guild_id, positions[:LOG_PAGE_SIZE]):
+            try:
+                record = open_log_entry(self.guild_id, log)
+                decoded_content = record['content']
+                decoded_username = record['username']
+                
+                embed.add_field(
+                    name=f"Message {seq + 1} - {log['timestamp'][:16]}",
+                    value=f"**User:** {decoded_username} (ID: {log['user_id']})\n**Content:** {decoded_content[:100]}{'...' if len(decoded_content) > 100 else ''}",
+                    inline=False
+                )
+            except Exception as e:
+                embed.add_field(
+                    name=f"Message {seq + 1} - {log['timestamp'][:16]}",
+                    value="❌ Error decoding message",
+                    inline=False
+                )
+
+        if not positions:
+            embed.add_field(name="No messages", value="Nothing matches these filters.", inline=False)
+        embed.set_footer(text=f"Page {len(self.cursors)}")
+
+        self.newer_button.disabled = len(self.cursors) == 1
+        self.older_button.disabled = not self.has_older
+        self.clear_button.disabled = not self.filters
+        return embed
+
+    @discord.ui.button(label='◀ Newer', style=discord.ButtonStyle.secondary)
+    async def newer_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if len(self.cursors) > 1:
+            self.cursors.pop()
+        await interaction.response.edit_message(embed=self.render(), view=self)
+
+    @discord.ui.button(label='Older ▶', style=discord.ButtonStyle.secondary)
+    async def older_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        positions = anon_logs_store.find(self.guild_id, before=self.cursors[-1], limit=LOG_PAGE_SIZE, **self.filters)
+        if len(positions) == LOG_PAGE_SIZE:
+            self.cursors.append(positions[-1])
+        await interaction.response.edit_message(embed=self.render(), view=self)
+
+    @discord.ui.button(label='🔍 Filter', style=discord.ButtonStyle.primary)
+    async def filter_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await interaction.response.send_modal(LogFilterModal(self))
+
+    @discord.ui.button(label='Clear filters', style=discord.ButtonStyle.danger)
+    async def clear_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.filters = {}
+        self.filter_text = {}
+        self.cursors = [None]
+        await interaction.response.edit_message(embed=self.render(), view=self)
+
 @bot.command(name='view_logs')
+@rate_limited()
 @commands.has_permissions(manage_guild=True)
 async def view_logs_command(ctx, code: str = None):
     """View anonymous message logs with access code"""
@@ -1074,46 +1549,20 @@ async def view_logs_command(ctx, code: str = None):
     user_id = str(ctx.author.id)
     
     if not use_access_code(guild_id, code, user_id):
-        await ctx.send("❌ Invalid or already used access code.")
+        await ctx.send("❌ Invalid, expired or already used access code.")
         return
     
-    if guild_id not in anon_logs or not anon_logs[guild_id]:
+    if not anon_logs_store.count(guild_id):
         await ctx.send("📝 No anonymous messages logged for this server.")
         return
     
-    logs = anon_logs[guild_id]
-    
-    # Create embed with recent logs
-    embed = discord.Embed(
-        title="📋 Anonymous Message Logs",
-        description=f"Showing {len(logs)} anonymous messages",
-        color=0xff9900
-    )
-    
-    for i, log in enumerate(logs[-10:]):  # Show last 10 logs
-        try:
-            decoded_content = base64.b64decode(log['encoded_content']).decode()
-            decoded_username = base64.b64decode(log['encoded_username']).decode()
-            
-            embed.add_field(
-                name=f"Message {i+1} - {log['timestamp'][:16]}",
-                value=f"**User:** {decoded_username} (ID: {log['user_id']})\n**Content:** {decoded_content[:100]}{'...' if len(decoded_content) > 100 else ''}",
-                inline=False
-            )
-        except Exception as e:
-            embed.add_field(
-                name=f"Message {i+1} - {log['timestamp'][:16]}",
-                value="❌ Error decoding message",
-                inline=False
-            )
-    
-    if len(logs) > 10:
-        embed.set_footer(text=f"Showing last 10 of {len(logs)} total messages")
-    
-    await ctx.author.send(embed=embed)
+    # Pages are looked up and decrypted as the moderator clicks through them
+    viewer = LogViewerView(guild_id, ctx.author.id)
+    await ctx.author.send(embed=viewer.render(), view=viewer)
     await ctx.send("📨 Log details sent to your DMs!")
 
 @bot.command(name='stats')
+@rate_limited()
 @commands.has_permissions(manage_guild=True)
 async def stats_command(ctx):
     """Show bot usage statistics"""
@@ -1125,7 +1574,7 @@ async def stats_command(ctx):
     )
     
     # Anonymous messages count
-    anon_count = len(anon_logs.get(guild_id, []))
+    anon_count = anon_logs_store.count(guild_id)
     embed.add_field(
         name="🫣 Anonymous Messages",
         value=str(anon_count),
@@ -1133,7 +1582,7 @@ async def stats_command(ctx):
     )
     
     # Access codes generated
-    access_count = len(access_codes.get(guild_id, {}))
+    access_count = access_code_registry.issued(guild_id)
     embed.add_field(
         name="🔐 Access Codes Generated",
         value=str(access_count),
@@ -1141,7 +1590,7 @@ async def stats_command(ctx):
     )
     
     # Moderator accesses
-    mod_access_count = len(moderator_access.get(guild_id, []))
+    mod_access_count = moderator_access_store.count(guild_id)
     embed.add_field(
         name="👮 Log Accesses",
         value=str(mod_access_count),
@@ -1164,21 +1613,142 @@ async def stats_command(ctx):
         inline=True
     )
     
+    # Recent activity from the rolling counters
+    embed.add_field(
+        name="📈 Vents (7 / 30 / 90 days)",
+        value=f"{vent_activity.window(guild_id, 7)} / {vent_activity.window(guild_id, 30)} / {vent_activity.window(guild_id, 90)}",
+        inline=True
+    )
+    
+    embed.add_field(
+        name="👀 Log Views (30 days)",
+        value=str(log_view_activity.window(guild_id, 30)),
+        inline=True
+    )
+    
+    embed.add_field(
+        name="📆 Vents Per Day (last 30 days)",
+        value=f"`{sparkline(vent_activity.daily(guild_id, 30))}`",
+        inline=False
+    )
+    
+    hours = vent_activity.hours(guild_id)
+    if any(hours):
+        busiest_hour = max(range(24), key=hours.__getitem__)
+        embed.add_field(
+            name="🕐 Vents By Hour",
+            value=f"`{sparkline(list(hours))}`\n`00    06    12    18   23`\nBusiest hour: **{busiest_hour:02d}:00** ({guild_tz(guild_id)})",
+            inline=False
+        )
+    
+    await ctx.send(embed=embed)
+
+@bot.command(name='mood')
+@rate_limited()
+@commands.has_permissions(manage_guild=True)
+async def mood_command(ctx):
+    """Show how the server has been feeling in daily check-ins"""
+    guild_id = str(ctx.guild.id)
+    today = guild_today(guild_id)
+    
+    embed = discord.Embed(
+        title="💖 Community Mood",
+        description="How everyone has been feeling, based on check-in reactions",
+        color=0xff69b4
+    )
+    
+    embed.add_field(
+        name=f"📅 Today ({today.strftime('%Y-%m-%d')})",
+        value=mood_analytics.format_distribution(mood_analytics.totals(guild_id, mood_analytics.last_days(today, 1))),
+        inline=False
+    )
+    
+    embed.add_field(
+        name="🗓️ Last 7 Days",
+        value=mood_analytics.format_distribution(mood_analytics.totals(guild_id, mood_analytics.last_days(today, 7))),
+        inline=False
+    )
+    
+    embed.set_footer(text="Counts are anonymous totals - nobody's individual answer is shown")
     await ctx.send(embed=embed)
 
 @bot.command(name='ping')
 async def ping_command(ctx):
     """Check bot responsiveness"""
-    latency = round(bot.latency * 1000)
-    await ctx.send(f"🏓 Pong! Latency: {latency}ms")
+    shard = bot.get_shard(ctx.guild.shard_id) if ctx.guild else None
+    latency = round((shard.latency if shard else bot.latency) * 1000)
+    await ctx.send(f"🏓 Pong! Latency: {latency}ms" + (f" (shard {shard.id})" if shard else ""))
+
+def format_duration(seconds: float) -> str:
+    return f"{seconds * 1000:.0f}ms" if seconds < 10 else f"{seconds:.1f}s"
+
+@bot.command(name='metrics')
+@rate_limited()
+@commands.has_permissions(manage_guild=True)
+async def metrics_command(ctx):
+    """Show where the bot spends its time"""
+    uptime = datetime.timedelta(seconds=int(time.time() - metrics.started))
+    embed = discord.Embed(
+        title="⏱️ Bot Metrics",
+        description=f"Since the bot started {uptime} ago",
+        color=0x7289da
+    )
+    
+    handlers = [
+        f"`{name}` {histogram.count} · p50 {format_duration(histogram.percentile(50))} · "
+        f"p99 {format_duration(histogram.percentile(99))} · max {format_duration(histogram.max)}"
+        for name, histogram in sorted(metrics.histograms.items())
+    ]
+    embed.add_field(
+        name="⚙️ Handlers (calls · recent p50 / p99 · max)",
+        value="\n".join(handlers) or "Nothing handled yet",
+        inline=False
+    )
+    
+    routes = [
+        f"`{method} {route}` {count}" + (f" ({limited}× 429)" if limited else "")
+        for method, route, count, limited in metrics.top_routes(8)
+    ]
+    throttled_total = sum(metrics.rate_limited.values())
+    embed.add_field(
+        name=f"🌐 Discord API ({sum(metrics.rest_requests.values())} requests, {throttled_total} rate limited, {metrics.rest_errors} failed)",
+        value="\n".join(routes) or "No requests yet",
+        inline=False
+    )
+    
+    throttled = [f"`{action}` ({scope}) {count}" for (action, scope), count in sorted(metrics.throttled.items())]
+    embed.add_field(
+        name=f"🚦 Throttled by our own limits ({sum(metrics.throttled.values())})",
+        value="\n".join(throttled) or "Nothing throttled yet",
+        inline=False
+    )
+    
+    queues = [f"`{name}` {value}" for name, value in metrics.gauge_values().items()]
+    embed.add_field(name="📥 Queues", value="\n".join(queues), inline=True)
+    
+    embed.add_field(
+        name="💓 Timing",
+        value=(
+            f"Gateway latency: {round(bot.latency * 1000)}ms\n"
+            f"Shards: {', '.join(map(str, sorted(bot.shards)))} of {bot.shard_count}\n"
+            f"Check-in start lag p99: {format_duration(checkin_scheduler.lag.percentile(99))}"
+        ),
+        inline=True
+    )
+    
+    await ctx.send(embed=embed)
 
 # Error handlers
 @setup_command.error
 @force_checkin.error
 @view_settings.error
+@checkin_style_command.error
+@retention_command.error
 @generate_code_command.error
 @view_logs_command.error
 @stats_command.error
+@mood_command.error
+@metrics_command.error
 async def permission_error(ctx, error):
     if isinstance(error, commands.MissingPermissions):
         await ctx.send("❌ You need **Manage Server** permissions to use this command.")
@@ -1188,6 +1758,10 @@ async def on_command_error(ctx, error):
     """Handle command errors"""
     if isinstance(error, commands.CommandNotFound):
         return  # Ignore unknown commands
+    elif isinstance(error, CommandThrottled):
+        metrics.throttle("command", error.scope)
+        if throttle_notice_limiter.hit(user=ctx.author.id)[0] is None:
+            await ctx.send(throttle_message("command", error.scope, error.retry_after), delete_after=10)
     elif isinstance(error, commands.MissingPermissions):
         await ctx.send("❌ You don't have permission to use this command.")
     else:
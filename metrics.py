@@ -0,0 +1,204 @@
+"""Latency and throughput metrics for the bot's hot paths"""
+import asyncio
+import bisect
+import functools
+import re
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+import aiohttp
+from aiohttp import web
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Snowflakes, reaction emojis and webhook / interaction tokens would make every request its own route
+_API_PREFIX = re.compile(r"^/api/v\d+")
+_SNOWFLAKE = re.compile(r"/\d{15,21}(?=/|$)")
+_EMOJI = re.compile(r"(/reactions)/[^/]+")
+_TOKEN = re.compile(r"(/(?:webhooks|interactions)/\{id\})/[^/]+")
+
+
+def route_of(path: str) -> str:
+    """Discord REST path with the IDs taken out, e.g. ``/channels/{id}/messages``"""
+    path = _API_PREFIX.sub("", path)
+    path = _SNOWFLAKE.sub("/{id}", path)
+    path = _EMOJI.sub(r"\1/{emoji}", path)
+    return _TOKEN.sub(r"\1/{token}", path)
+
+
+class Histogram:
+    """Durations in fixed buckets (for Prometheus) plus the most recent samples (for percentiles)"""
+
+    def __init__(self, window: int = 1000):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+    def percentile(self, pct: float) -> float:
+        """Percentile over the most recent samples (0 when there are none)"""
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class Metrics:
+    """Timings of the bot's handlers, Discord REST calls and queue depths.
+
+    ``timed(name)`` wraps a handler (sync or async) into a histogram of its
+    run time, ``http_trace()`` is handed to discord.py to count every REST
+    request per route (and the 429s), and ``gauge(name, fn)`` registers a
+    queue whose depth is read when metrics are shown; ``throttle()`` counts
+    actions our own rate limits turned away. Everything stays in
+    memory; ``render()`` gives the Prometheus text format that ``serve()``
+    exposes over HTTP.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.histograms: Dict[str, Histogram] = {}
+        self.rest_requests: Dict[Tuple[str, str], int] = {}  # (method, route) -> requests
+        self.rate_limited: Dict[Tuple[str, str], int] = {}  # (method, route) -> 429 responses
+        self.rest_errors = 0
+        self.throttled: Dict[Tuple[str, str], int] = {}  # (action, scope) -> requests turned away
+        self.gauges: Dict[str, Callable[[], float]] = {}
+        self._runner: Optional[web.AppRunner] = None
+
+    def observe(self, name: str, seconds: float):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.observe(seconds)
+
+    def timed(self, name: str):
+        """Decorator recording how long each call of a function takes, errors included"""
+        def decorate(func):
+            if asyncio.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def wrapper(*args, **kwargs):
+                    start = time.perf_counter()
+                    try:
+                        return await func(*args, **kwargs)
+                    finally:
+                        self.observe(name, time.perf_counter() - start)
+            else:
+                @functools.wraps(func)
+                def wrapper(*args, **kwargs):
+                    start = time.perf_counter()
+                    try:
+                        return func(*args, **kwargs)
+                    finally:
+                        self.observe(name, time.perf_counter() - start)
+            return wrapper
+        return decorate
+
+    def throttle(self, action: str, scope: str):
+        """Count an action refused by the bot's own rate limits (``scope``: user, guild, channel)"""
+        self.throttled[(action, scope)] = self.throttled.get((action, scope), 0) + 1
+
+    def gauge(self, name: str, read: Callable[[], float]):
+        """Report ``read()`` as the current depth of a queue"""
+        self.gauges[name] = read
+
+    def gauge_values(self) -> Dict[str, float]:
+        values = {}
+        for name, read in self.gauges.items():
+            try:
+                values[name] = read()
+            except Exception as e:
+                print(f"Error reading metric {name}: {e}")
+        return values
+
+    def http_trace(self) -> aiohttp.TraceConfig:
+        """Trace config for discord.py's HTTP session (``http_trace=``)"""
+        trace = aiohttp.TraceConfig()
+
+        async def on_request_start(session, context, params):
+            context.start = time.perf_counter()
+
+        async def on_request_end(session, context, params):
+            key = (params.method, route_of(params.url.path))
+            self.rest_requests[key] = self.rest_requests.get(key, 0) + 1
+            if params.response.status == 429:
+                self.rate_limited[key] = self.rate_limited.get(key, 0) + 1
+            self.observe("rest_request", time.perf_counter() - context.start)
+
+        async def on_request_exception(session, context, params):
+            self.rest_errors += 1
+
+        trace.on_request_start.append(on_request_start)
+        trace.on_request_end.append(on_request_end)
+        trace.on_request_exception.append(on_request_exception)
+        return trace
+
+    def top_routes(self, limit: int = 10) -> List[Tuple[str, str, int, int]]:
+        """Busiest REST routes as ``(method, route, requests, 429s)``"""
+        busiest = sorted(self.rest_requests.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [(method, route, count, self.rate_limited.get((method, route), 0)) for (method, route), count in busiest]
+
+    def render(self) -> str:
+        """Everything in the Prometheus text exposition format"""
+        lines = [
+            "# TYPE mentalhealthbot_uptime_seconds gauge",
+            f"mentalhealthbot_uptime_seconds {time.time() - self.started:.3f}",
+            "# TYPE mentalhealthbot_handler_seconds histogram",
+        ]
+        for name, histogram in sorted(self.histograms.items()):
+            label = f'handler="{_escape(name)}"'
+            cumulative = 0
+            for bound, count in zip(BUCKETS, histogram.counts):
+                cumulative += count
+                lines.append(f'mentalhealthbot_handler_seconds_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f'mentalhealthbot_handler_seconds_bucket{{{label},le="+Inf"}} {histogram.count}')
+            lines.append(f"mentalhealthbot_handler_seconds_sum{{{label}}} {histogram.sum:.6f}")
+            lines.append(f"mentalhealthbot_handler_seconds_count{{{label}}} {histogram.count}")
+
+        lines.append("# TYPE mentalhealthbot_rest_requests_total counter")
+        for (method, route), count in sorted(self.rest_requests.items()):
+            lines.append(f'mentalhealthbot_rest_requests_total{{method="{method}",route="{_escape(route)}"}} {count}')
+        lines.append("# TYPE mentalhealthbot_rest_rate_limited_total counter")
+        for (method, route), count in sorted(self.rate_limited.items()):
+            lines.append(f'mentalhealthbot_rest_rate_limited_total{{method="{method}",route="{_escape(route)}"}} {count}')
+        lines.append("# TYPE mentalhealthbot_rest_errors_total counter")
+        lines.append(f"mentalhealthbot_rest_errors_total {self.rest_errors}")
+
+        lines.append("# TYPE mentalhealthbot_throttled_total counter")
+        for (action, scope), count in sorted(self.throttled.items()):
+            lines.append(f'mentalhealthbot_throttled_total{{action="{_escape(action)}",scope="{scope}"}} {count}')
+
+        lines.append("# TYPE mentalhealthbot_queue_depth gauge")
+        for name, value in sorted(self.gauge_values().items()):
+            lines.append(f'mentalhealthbot_queue_depth{{queue="{_escape(name)}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    async def serve(self, host: str, port: int):
+        """Serve ``render()`` at ``http://host:port/metrics``"""
+        async def handle(request):
+            return web.Response(text=self.render(), content_type="text/plain", charset="utf-8")
+
+        app = web.Application()
+        app.router.add_get("/metrics", handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        print(f"Serving metrics on http://{host}:{port}/metrics")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,80 @@
+"""One-shot copy of the bot's JSON data files into an SQLite database.
+
+Usage: python migrate_to_sqlite.py [--data-dir data] [--legacy-dir .] [--db data/bot.db]
+
+Stop the bot first. Changes a crash left in the journal (``data/journal/``
+and the per-shard folders in it) are saved to the JSON files first, as the
+bot itself would do on its next start. Data from older versions that kept
+each store in one file (``settings.json``, ``anon_logs.json`` etc. in
+``--legacy-dir``) is copied over as well without touching those files; where
+a server has data in both places, the data folder wins. Afterwards start the
+bot with STORAGE_BACKEND=sqlite (and SQLITE_PATH if you picked a different
+database path).
+"""
+import argparse
+import os
+
+from journal import Journal, journal_dirs
+from storage import DATA_DIR, JsonBackend, SqliteBackend, WriteBehindFlusher, read_legacy_file
+
+DOCUMENT_STORES = ["settings", "last_messages", "sticky_messages", "dismissed_users", "access_codes", "mood_stats", "activity"]
+LOG_STORES = {"anon_logs": "timestamp", "moderator_access": "accessed_at"}
+
+
+def migrate(data_dir: str, db_path: str, legacy_dir: str = "."):
+    # legacy_dir=None: the backend would rename old single-file data after importing it
+    source = JsonBackend(data_dir, legacy_dir=None)
+    documents = {name: source.document_store(name) for name in DOCUMENT_STORES}
+    logs = {name: source.log_store(name, time_field) for name, time_field in LOG_STORES.items()}
+    stores = list(documents.values()) + list(logs.values())
+    for path in journal_dirs(data_dir):
+        journal = Journal(path)
+        try:
+            if journal.replay(stores):
+                WriteBehindFlusher(stores, source, journal=journal).flush_now()
+        finally:
+            journal.close()
+
+    # Old single-file data is only read; a server that also has data in the data folder keeps that
+    legacy = {name: read_legacy_file(os.path.join(legacy_dir, f"{name}.json")) for name in DOCUMENT_STORES + list(LOG_STORES)}
+    for name, servers in legacy.items():
+        if servers:
+            print(f"Reading {len(servers)} servers from {os.path.join(legacy_dir, name)}.json")
+    for name, store in documents.items():
+        for guild_id, value in legacy[name].items():
+            store.data.setdefault(guild_id, value)
+
+    target = SqliteBackend(db_path)
+    try:
+        for name, store in documents.items():
+            store.dirty.update(store.data.keys())
+            target.write_documents(name, store.snapshot())
+            print(f"{name}: {len(store.data)} servers")
+
+        for name, time_field in LOG_STORES.items():
+            source_log = logs[name]
+            target_log = target.log_store(name, time_field)
+            total = 0
+            guild_ids = source_log.guild_ids()
+            for guild_id in guild_ids:
+                target_log.rewrite(guild_id, source_log.iter_entries(guild_id))
+                total += target_log.count(guild_id)
+            for guild_id, entries in legacy[name].items():
+                if guild_id not in guild_ids:
+                    target_log.rewrite(guild_id, entries)
+                    total += target_log.count(guild_id)
+            print(f"{name}: {total} entries")
+    finally:
+        target.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Copy the bot's JSON data into SQLite")
+    parser.add_argument("--data-dir", default=DATA_DIR, help="folder holding the JSON data (default: %(default)s)")
+    parser.add_argument("--db", default=os.getenv("SQLITE_PATH", os.path.join(DATA_DIR, "bot.db")),
+                        help="SQLite database to create or update (default: %(default)s)")
+    parser.add_argument("--legacy-dir", default=".",
+                        help="folder holding single-file data from older versions (default: %(default)s)")
+    args = parser.parse_args()
+    migrate(args.data_dir, args.db, args.legacy_dir)
+    print(f"✅ Migration complete: {args.db}")
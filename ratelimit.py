@@ -0,0 +1,91 @@
+"""Token-bucket rate limits for vents, buttons and admin commands"""
+import collections
+import time
+from typing import Dict, Optional, Tuple
+
+
+class TokenBucket:
+    """Up to ``burst`` actions at once per key, refilled at one every ``per`` seconds.
+
+    A bucket is stored as the single time at which it will be full again
+    (``tokens = burst - (full_at - now) / per``), so a check is a dict
+    lookup and a little arithmetic. A bucket that has refilled is the same
+    as no bucket at all, so idle keys are dropped: buckets are kept in the
+    order they were last used and full ones are evicted from the front as
+    new hits come in.
+    """
+
+    def __init__(self, burst: int, per: float):
+        self.burst = burst
+        self.per = per
+        self._slack = (burst - 1) * per  # How far ahead full_at may be and still have a token left
+        self._full_at: "collections.OrderedDict[str, float]" = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._full_at)
+
+    def retry_after(self, key: str, now: float) -> float:
+        """Seconds until ``key`` has a token again (0 if it has one now)"""
+        full_at = self._full_at.get(key)
+        if full_at is None:
+            return 0.0
+        return max(0.0, full_at - now - self._slack)
+
+    def take(self, key: str, now: float):
+        """Use one of ``key``'s tokens (check ``retry_after()`` first)"""
+        self._full_at[key] = max(self._full_at.get(key, now), now) + self.per
+        self._full_at.move_to_end(key)
+        self._evict(now)
+
+    def _evict(self, now: float):
+        # The front was used longest ago; stop at the first bucket that is still refilling
+        while self._full_at:
+            key, full_at = next(iter(self._full_at.items()))
+            if full_at > now:
+                break
+            del self._full_at[key]
+
+
+class RateLimiter:
+    """Several token buckets (e.g. per user, per server, per channel) checked together.
+
+    ``limits`` maps a scope name to ``(burst, per)``. ``hit(user=..., guild=...)``
+    only lets an action through if every scope named has a token, and then
+    takes one from each. Scopes without a limit are ignored, so
+    ``RateLimiter()`` lets everything through.
+    """
+
+    def __init__(self, **limits: Tuple[int, float]):
+        self.buckets: Dict[str, TokenBucket] = {scope: TokenBucket(burst, per) for scope, (burst, per) in limits.items()}
+
+    def __len__(self) -> int:
+        return sum(len(bucket) for bucket in self.buckets.values())
+
+    def check(self, **keys) -> Tuple[Optional[str], float]:
+        """The scope that is out of tokens and how long until it isn't, or ``(None, 0)``; takes nothing"""
+        now = time.monotonic()
+        for scope, key in keys.items():
+            bucket = self.buckets.get(scope)
+            wait = bucket.retry_after(str(key), now) if bucket is not None else 0.0
+            if wait > 0:
+                return scope, wait
+        return None, 0.0
+
+    def hit(self, **keys) -> Tuple[Optional[str], float]:
+        """Like ``check()``, but takes a token from every scope when the action is allowed"""
+        scope, wait = self.check(**keys)
+        if scope is None:
+            now = time.monotonic()
+            for name, key in keys.items():
+                if name in self.buckets:
+                    self.buckets[name].take(str(key), now)
+        return scope, wait
+
+
+def describe_wait(seconds: float) -> str:
+    """``"a few seconds"``, ``"about 40 seconds"``, ``"about 3 minutes"``"""
+    if seconds < 5:
+        return "a few seconds"
+    if seconds < 90:
+        return f"about {int(seconds + 0.5)} seconds"
+    return f"about {int(seconds / 60 + 0.5)} minutes"
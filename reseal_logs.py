@@ -0,0 +1,52 @@
+"""One-time sealing of anonymous log entries written before logs were encrypted.
+
+Usage: python reseal_logs.py
+
+Older versions only base64 encoded the username, display name and message
+of each entry. The bot still reads those entries, but on disk they are as
+good as plaintext. Stop the bot (every shard process) and run this once
+with the same settings (BOT_DATA_DIR, STORAGE_BACKEND, SQLITE_PATH and
+ANON_LOG_KEY, from the environment or .env): every log holding such
+entries is rewritten a chunk at a time with them sealed like new ones.
+Logs without any are left alone.
+"""
+import os
+
+from dotenv import load_dotenv
+
+from journal import Journal, journal_dirs
+from logcrypto import LogCipher, load_master_key
+from storage import DATA_DIR, open_backend
+
+load_dotenv()  # Same settings as main.py
+
+
+def reseal(data_dir: str = DATA_DIR) -> int:
+    for path in journal_dirs(data_dir):
+        journal = Journal(path)  # Also fails if a bot process still has it open
+        unsaved = journal.segments()
+        journal.close()
+        if unsaved:
+            raise SystemExit(f"{path} holds unsaved changes from a crash; start the bot once to save them, "
+                             "stop it, then run this again")
+
+    backend = open_backend(import_legacy=False)
+    cipher = LogCipher(load_master_key(data_dir))
+    log_store = backend.log_store("anon_logs", time_field="timestamp")
+    total = 0
+    try:
+        for guild_id in log_store.guild_ids():
+            if all("sealed" in entry for entry in log_store.iter_entries(guild_id)):
+                continue
+            resealed = log_store.update_entries(guild_id, lambda entry: cipher.reseal_legacy(guild_id, entry))
+            print(f"Guild {guild_id}: sealed {resealed} entries")
+            total += resealed
+    finally:
+        backend.close()
+    return total
+
+
+if __name__ == "__main__":
+    if not os.getenv("ANON_LOG_KEY") and not os.path.exists(os.path.join(DATA_DIR, "anon_logs.key")):
+        raise SystemExit("No ANON_LOG_KEY and no generated key in the data folder; run with the bot's settings")
+    print(f"✅ Sealed {reseal()} old log entries")
@@ -0,0 +1,131 @@
+"""Retention policies for the anonymous message logs"""
+import asyncio
+from typing import Awaitable, Callable, Optional, Set
+
+# Seconds in a day, for ``max_age_days`` policies
+DAY = 24 * 60 * 60
+
+# How soon a purge that had to wait for a save in flight is tried again
+RETRY_DELAY = 1.0
+
+
+class RetentionManager:
+    """Drops a server's oldest log entries once they fall outside its policy.
+
+    A policy is ``{"max_age_days": int or None, "max_count": int or None}``,
+    looked up with ``policy_for(guild_id)``. Every ``interval`` seconds (or
+    right after ``request()``) the servers with a policy are checked and the
+    entries to drop are purged from the front of the log a chunk at a time on
+    the storage writer thread (``run_in_writer``), so neither the event loop
+    nor other servers' saves wait for a big purge. A purge cut short by a
+    restart is resumed first thing on the next start.
+    """
+
+    def __init__(self, log_store, policy_for: Callable[[str], Optional[dict]],
+                 run_in_writer: Callable[..., Awaitable], interval: float = 3600.0):
+        self.log_store = log_store
+        self.policy_for = policy_for
+        self.run_in_writer = run_in_writer
+        self.interval = interval
+        self.purged_total = 0
+        self._requested: Set[str] = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+        self.active: Optional[str] = None  # Server being purged right now
+
+    def start(self, guild_ids: Callable[[], Set[str]]):
+        """Start checking the servers returned by ``guild_ids()``"""
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run(guild_ids))
+
+    def request(self, guild_id: str):
+        """Check a server soon, e.g. after its policy changed"""
+        self._requested.add(str(guild_id))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def stop(self):
+        """Stop after the chunk in progress so nothing is left half-written"""
+        self._stopping = True
+        if self._task is None:
+            return
+        if self._wakeup is not None:
+            self._wakeup.set()
+        try:
+            await self._task
+        except Exception as e:
+            print(f"Error stopping retention job: {e}")
+        self._task = None
+
+    async def _run(self, guild_ids: Callable[[], Set[str]]):
+        for guild_id in self.log_store.interrupted_purges():
+            await self._purge_safely(guild_id, 0)
+        pending = set(guild_ids())
+        while not self._stopping:
+            pending |= self._requested
+            self._requested.clear()
+            for guild_id in sorted(pending):
+                if self._stopping:
+                    return
+                await self._purge_safely(guild_id, self.target(guild_id))
+            pending = set()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pending = set(guild_ids())
+            self._wakeup.clear()
+
+    def target(self, guild_id: str) -> int:
+        """How many entries a server's policy says should go"""
+        policy = self.policy_for(guild_id)
+        if not policy:
+            return 0
+        max_age = policy.get("max_age_days")
+        return self.log_store.purge_target(
+            guild_id,
+            max_age=max_age * DAY if max_age is not None else None,
+            max_count=policy.get("max_count"),
+        )
+
+    async def _purge_safely(self, guild_id: str, drop: int):
+        try:
+            await self.purge(guild_id, drop)
+        except Exception as e:
+            print(f"Error applying retention policy to guild {guild_id}: {e}")
+
+    async def purge(self, guild_id: str, drop: int) -> int:
+        """Drop a server's oldest ``drop`` entries (or finish an interrupted purge); returns how many went"""
+        resuming = guild_id in self.log_store.interrupted_purges()
+        if drop <= 0 and not resuming:
+            return 0
+        state = self.log_store.start_purge(guild_id, drop)
+        if state is None:
+            # A save is in flight; try again shortly
+            self._requested.add(guild_id)
+            if self._wakeup is not None:
+                asyncio.get_running_loop().call_later(RETRY_DELAY, self._wakeup.set)
+            return 0
+
+        self.active = guild_id
+        finished = False
+        try:
+            while True:
+                done = await self.run_in_writer(self.log_store.purge_step, guild_id, state)
+                self.log_store.purge_step_done(guild_id, state)
+                if done:
+                    break
+                if self._stopping:
+                    return 0
+            self.log_store.finish_purge(guild_id, state)
+            finished = True
+        finally:
+            self.active = None
+            if not finished:
+                self.log_store.cancel_purge(guild_id)
+
+        self.purged_total += state["drop"]
+        print(f"Purged {state['drop']} old {self.log_store.name} entries for guild {guild_id}")
+        return state["drop"]
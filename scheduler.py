@@ -0,0 +1,220 @@
+"""Scheduling of the daily check-in posts"""
+import asyncio
+import datetime
+import heapq
+import itertools
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import pytz
+
+
+class CheckinSchedule:
+    """A server's daily check-in time, parsed and validated once.
+
+    Built when settings are saved (or loaded at startup) so the scheduler and
+    ``!settings`` never re-parse the time or look the timezone up again.
+    Raises ``ValueError`` for a malformed time or an unknown timezone.
+    """
+
+    __slots__ = ('time', 'timezone', 'hour', 'minute', 'tz')
+
+    def __init__(self, time: str, timezone: str):
+        parts = time.split(':')
+        if len(parts) != 2:
+            raise ValueError(f"Check-in time {time!r} is not in HH:MM format")
+        hour, minute = int(parts[0]), int(parts[1])
+        if not (0 <= hour <= 23 and 0 <= minute <= 59):
+            raise ValueError(f"Check-in time {time!r} is out of range")
+        try:
+            self.tz = pytz.timezone(timezone)
+        except pytz.UnknownTimeZoneError:
+            raise ValueError(f"Unknown timezone {timezone!r}")
+        self.hour = hour
+        self.minute = minute
+        self.time = f"{hour:02d}:{minute:02d}"
+        self.timezone = timezone
+
+    @classmethod
+    def from_settings(cls, settings: dict) -> "CheckinSchedule":
+        if 'time' not in settings or 'timezone' not in settings:
+            raise ValueError("Check-in time or timezone is not set")
+        return cls(settings['time'], settings['timezone'])
+
+    def next_occurrence(self, after: datetime.datetime) -> Tuple[datetime.datetime, str]:
+        """Return the next check-in after ``after`` as a UTC datetime plus its local date key.
+
+        Works in the server's own timezone so the post stays at the configured
+        wall clock time across daylight saving changes.
+        """
+        local_now = after.astimezone(self.tz)
+        for days_ahead in range(3):
+            day = local_now.date() + datetime.timedelta(days=days_ahead)
+            # normalize() moves times that fall in a spring-forward gap to the next valid minute
+            local_fire = self.tz.normalize(self.tz.localize(
+                datetime.datetime.combine(day, datetime.time(self.hour, self.minute))
+            ))
+            fire_at = local_fire.astimezone(pytz.UTC)
+            if fire_at > after:
+                return fire_at, day.strftime('%Y-%m-%d')
+        raise ValueError(f"Could not find the next check-in time for {self.time} {self.timezone}")
+
+
+class LagStats:
+    """How late check-ins start compared to their scheduled time, in seconds"""
+
+    def __init__(self, window: int = 1000):
+        self.count = 0
+        self.max = 0.0
+        self.recent = deque(maxlen=window)
+
+    def record(self, lag: float):
+        self.count += 1
+        self.max = max(self.max, lag)
+        self.recent.append(lag)
+
+    def percentile(self, pct: float) -> float:
+        """Percentile over the most recent samples (0 when there are none)"""
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class CheckinScheduler:
+    """Keeps each server's next check-in in a priority queue and sleeps until the earliest one.
+
+    ``schedule()`` stores a server's ``CheckinSchedule`` (the cached copy the
+    rest of the bot reads from ``schedules``) and computes its next fire time;
+    older heap entries
+    for that server are skipped lazily using a per-server version number. When
+    an entry fires, the server is rescheduled for the following day and
+    ``callback(guild_id, local_date)`` runs in its own task.
+
+    Servers that share a check-in minute are posted in parallel, at most
+    ``max_concurrency`` at a time (discord.py queues requests per rate limit
+    bucket underneath), and each post is cut off after ``timeout`` seconds so
+    one stuck server can't hold a slot forever.
+    """
+
+    def __init__(self, callback: Callable[[str, str], Awaitable[None]],
+                 max_concurrency: int = 20, timeout: float = 120.0):
+        self.callback = callback
+        self.timeout = timeout
+        self.lag = LagStats()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._inflight: Set[asyncio.Task] = set()
+        self.schedules: Dict[str, CheckinSchedule] = {}
+        self._heap: List[Tuple[datetime.datetime, int, str, CheckinSchedule, str]] = []
+        self._versions: Dict[str, int] = {}  # Live heap entry version per server
+        self._next_fire: Dict[str, datetime.datetime] = {}
+        self._counter = itertools.count()
+        self._changed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._versions)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def queued(self) -> int:
+        """Heap entries, including stale ones not skipped yet"""
+        return len(self._heap)
+
+    @property
+    def inflight(self) -> int:
+        """Check-ins being posted (or waiting for a slot) right now"""
+        return len(self._inflight)
+
+    def schedule(self, guild_id: str, schedule: CheckinSchedule, after: Optional[datetime.datetime] = None):
+        """Queue a server's next check-in, replacing any earlier schedule for it"""
+        guild_id = str(guild_id)
+        fire_at, local_date = schedule.next_occurrence(after or datetime.datetime.now(pytz.UTC))
+
+        version = next(self._counter)
+        self.schedules[guild_id] = schedule
+        self._versions[guild_id] = version
+        self._next_fire[guild_id] = fire_at
+        heapq.heappush(self._heap, (fire_at, version, guild_id, schedule, local_date))
+        self._changed.set()
+
+    def unschedule(self, guild_id: str):
+        """Stop posting check-ins for a server"""
+        # Forgetting the live version makes the queued entries stale
+        self.schedules.pop(str(guild_id), None)
+        self._next_fire.pop(str(guild_id), None)
+        if self._versions.pop(str(guild_id), None) is not None:
+            self._changed.set()
+
+    def next_fire_time(self, guild_id: str) -> Optional[datetime.datetime]:
+        """When a server's next check-in is due, if it has one"""
+        return self._next_fire.get(str(guild_id))
+
+    def start(self):
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, grace: float = 10.0):
+        """Stop scheduling and give check-ins being posted ``grace`` seconds to finish"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if not self._inflight:
+            return
+        _, pending = await asyncio.wait(list(self._inflight), timeout=grace)
+        for task in pending:
+            task.cancel()
+        if pending:
+            print(f"Cancelled {len(pending)} check-in post(s) still running at shutdown")
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def _pop_due(self, now: datetime.datetime) -> List[Tuple[datetime.datetime, str, CheckinSchedule, str]]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            fire_at, version, guild_id, schedule, local_date = heapq.heappop(self._heap)
+            if self._versions.get(guild_id) != version:
+                continue  # Superseded by a newer schedule()
+            due.append((fire_at, guild_id, schedule, local_date))
+        return due
+
+    async def _run(self):
+        while True:
+            # Drop stale entries so we don't wake up for them
+            while self._heap and self._versions.get(self._heap[0][2]) != self._heap[0][1]:
+                heapq.heappop(self._heap)
+
+            self._changed.clear()
+            if self._heap:
+                delay = (self._heap[0][0] - datetime.datetime.now(pytz.UTC)).total_seconds()
+                if delay > 0:
+                    try:
+                        await asyncio.wait_for(self._changed.wait(), timeout=delay)
+                        continue  # Something was (re)scheduled; look at the queue again
+                    except asyncio.TimeoutError:
+                        pass
+            else:
+                await self._changed.wait()
+                continue
+
+            for fire_at, guild_id, schedule, local_date in self._pop_due(datetime.datetime.now(pytz.UTC)):
+                # Reschedule first so a slow or failing post can't drop the server from the queue
+                self.schedule(guild_id, schedule, after=fire_at)
+                task = asyncio.create_task(self._dispatch(fire_at, guild_id, local_date))
+                self._inflight.add(task)
+                task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, fire_at: datetime.datetime, guild_id: str, local_date: str):
+        async with self._semaphore:
+            lag = (datetime.datetime.now(pytz.UTC) - fire_at).total_seconds()
+            self.lag.record(lag)
+            if lag > 60:
+                print(f"Daily checkin for guild {guild_id} started {lag:.0f}s late")
+            try:
+                await asyncio.wait_for(self.callback(guild_id, local_date), timeout=self.timeout)
+            except asyncio.TimeoutError:
+                print(f"Daily checkin for guild {guild_id} timed out after {self.timeout:.0f}s")
+            except Exception as e:
+                print(f"Error processing daily checkin for guild {guild_id}: {e}")
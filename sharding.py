@@ -0,0 +1,82 @@
+"""Which servers this process looks after when the bot runs as several shards"""
+import os
+from typing import List, Optional
+
+
+def parse_shard_ids(text: str) -> List[int]:
+    """``"0,1,4-7"`` -> ``[0, 1, 4, 5, 6, 7]``"""
+    ids = set()
+    for part in text.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            first, last = part.split("-", 1)
+            ids.update(range(int(first), int(last) + 1))
+        else:
+            ids.add(int(part))
+    return sorted(ids)
+
+
+class ShardPlan:
+    """The shards this process runs out of ``shard_count``.
+
+    Discord sends a server's events to shard ``(guild_id >> 22) % shard_count``,
+    so that shard's process is the only one that ever changes the server's
+    data: each process loads, schedules and saves just the servers it owns.
+    Without ``shard_ids`` the process runs every shard itself (with no
+    ``shard_count`` either, discord.py asks Discord how many to use) and
+    owns every server, the same as an unsharded bot.
+    """
+
+    def __init__(self, shard_count: Optional[int] = None, shard_ids: Optional[List[int]] = None):
+        if shard_ids is not None and shard_count is None:
+            raise ValueError("SHARD_IDS needs SHARD_COUNT to be set as well")
+        if shard_count is not None and shard_count < 1:
+            raise ValueError(f"SHARD_COUNT must be at least 1, not {shard_count}")
+        if shard_ids is not None:
+            if not shard_ids:
+                raise ValueError("SHARD_IDS is empty")
+            outside = [shard_id for shard_id in shard_ids if not 0 <= shard_id < shard_count]
+            if outside:
+                raise ValueError(f"Shard IDs {outside} are outside 0-{shard_count - 1}")
+            shard_ids = sorted(set(shard_ids))
+        self.shard_count = shard_count
+        self.shard_ids = shard_ids
+        self._owned = frozenset(shard_ids) if self.partitioned else None
+
+    @classmethod
+    def from_env(cls) -> "ShardPlan":
+        """Read ``SHARD_COUNT`` and ``SHARD_IDS`` (e.g. ``0,1`` or ``0-3``) from the environment"""
+        count = os.getenv("SHARD_COUNT")
+        ids = os.getenv("SHARD_IDS")
+        return cls(int(count) if count else None, parse_shard_ids(ids) if ids else None)
+
+    @property
+    def partitioned(self) -> bool:
+        """Whether other processes run some of the shards"""
+        return self.shard_ids is not None and len(self.shard_ids) < self.shard_count
+
+    @property
+    def primary(self) -> bool:
+        """Whether this process runs shard 0, which does the one-time data imports"""
+        return not self.partitioned or 0 in self._owned
+
+    def shard_of(self, guild_id) -> int:
+        return (int(guild_id) >> 22) % (self.shard_count or 1)
+
+    def owns(self, guild_id) -> bool:
+        """Whether this process handles (and alone stores) the server"""
+        return self._owned is None or self.shard_of(guild_id) in self._owned
+
+    @property
+    def name(self) -> str:
+        """``shard-0``, ``shards-2-3`` - used for this process's own files"""
+        if not self.partitioned:
+            return "all"
+        prefix = "shard" if len(self.shard_ids) == 1 else "shards"
+        return f"{prefix}-{'-'.join(map(str, self.shard_ids))}"
+
+    def partition_path(self, path: str) -> str:
+        """A per-process folder inside ``path`` when sharded across processes, else ``path`` itself"""
+        return os.path.join(path, self.name) if self.partitioned else path
@@ -0,0 +1,76 @@
+"""Debounced reposting of the sticky vent button in vent channels"""
+import asyncio
+from typing import Awaitable, Callable, Dict, Optional
+
+import discord
+
+
+class StickyManager:
+    """Keeps the vent button at the bottom of vent channels.
+
+    The newest message ID per channel is tracked from gateway events, so no
+    history has to be fetched. Activity only (re)starts a timer: the sticky is
+    reposted once the channel has been quiet for ``delay`` seconds, or at the
+    latest ``max_delay`` seconds after the burst started, so a busy channel costs
+    one delete + send per burst instead of per message.
+    """
+
+    def __init__(self, repost: Callable[[discord.abc.Messageable, int], Awaitable[None]],
+                 delay: float = 5.0, max_delay: float = 20.0):
+        self.repost = repost
+        self.delay = delay
+        self.max_delay = max_delay
+        self.last_message: Dict[int, int] = {}
+        self._deadlines: Dict[int, float] = {}
+        self._burst_started: Dict[int, float] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._reposting = 0
+
+    def note_activity(self, channel: discord.abc.Messageable, message_id: int):
+        """Record a new message in a vent channel and schedule a repost"""
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        channel_id = channel.id
+        self.last_message[channel_id] = message_id
+
+        started = self._burst_started.setdefault(channel_id, now)
+        self._deadlines[channel_id] = min(now + self.delay, started + self.max_delay)
+        if channel_id not in self._tasks:
+            self._tasks[channel_id] = asyncio.create_task(self._wait_and_repost(channel))
+
+    @property
+    def waiting(self) -> int:
+        """Channels with a repost waiting or in progress"""
+        return len(self._tasks) + self._reposting
+
+    async def _wait_and_repost(self, channel: discord.abc.Messageable):
+        channel_id = channel.id
+        loop = asyncio.get_running_loop()
+        try:
+            # The deadline moves forward while messages keep arriving
+            while (remaining := self._deadlines[channel_id] - loop.time()) > 0:
+                await asyncio.sleep(remaining)
+        finally:
+            del self._tasks[channel_id]
+            self._deadlines.pop(channel_id, None)
+            self._burst_started.pop(channel_id, None)
+
+        self._reposting += 1
+        try:
+            await self.repost(channel, self.last_message[channel_id])
+        except Exception as e:
+            print(f"Error reposting sticky message in channel {channel_id}: {e}")
+        finally:
+            self._reposting -= 1
+
+    def close(self):
+        """Cancel every waiting repost"""
+        for task in list(self._tasks.values()):
+            task.cancel()
+
+    def forget(self, channel_id: int):
+        """Drop all state for a channel that is no longer a vent channel"""
+        task: Optional[asyncio.Task] = self._tasks.get(channel_id)
+        if task is not None:
+            task.cancel()
+        self.last_message.pop(channel_id, None)
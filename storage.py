@@ -0,0 +1,1489 @@
+"""Persistence layer for the bot's per-server state.
+
+State lives in two kinds of stores:
+
+* ``GuildStore`` - a dict of per-server documents (settings, sticky messages,
+  access codes, ...) that is kept in memory and saved per server when changed.
+* Log stores - append-only per-server logs (anonymous messages, moderator
+  access) that are read by position and never loaded whole.
+
+Where the data actually goes is decided by a backend: ``JsonBackend`` (plain
+files under ``data/``, the default) or ``SqliteBackend`` (a single WAL-mode
+database). Pick one with the ``STORAGE_BACKEND`` environment variable.
+
+A backend can be limited to the servers one process owns (``owns``) when
+the bot is sharded across processes: other servers are never loaded, listed
+or written, so the processes can share the data folder or database.
+"""
+import array
+import asyncio
+import bisect
+import contextlib
+import collections
+import datetime
+import json
+import os
+import sqlite3
+import struct
+import threading
+import time
+from collections.abc import MutableMapping
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+DATA_DIR = os.getenv("BOT_DATA_DIR", "data")
+# Servers per lazily loaded store (and open logs per log store) kept in memory
+CACHE_SIZE = int(os.getenv("GUILD_CACHE_SIZE", "1000"))
+
+
+def json_default(value: Any) -> Any:
+    """Let stores hold compact ``array.array`` counters and still save as JSON lists"""
+    if isinstance(value, array.array):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def fsync_dir(path: str):
+    """Make renames and new files in a directory durable"""
+    if os.name == "nt":
+        return  # Directories can't be opened on Windows
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_file_atomic(path: str, data: bytes):
+    """Write ``data`` to a temporary file, fsync it and rename it over ``path``"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def encode_entry(entry: dict) -> bytes:
+    return (json.dumps(entry, separators=(",", ":")) + "\n").encode()
+
+
+def owns_every_guild(guild_id: str) -> bool:
+    return True
+
+
+def read_legacy_file(path: str) -> Dict[str, Any]:
+    """Server ID -> data from an old single-file store (``settings.json`` etc.), or {} if there is none"""
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+class GuildStore:
+    """A dict of per-server data saved one server at a time.
+
+    Every top-level key is a guild ID. Callers mutate ``data`` directly and
+    then call ``mark_dirty(guild_id)``; ``flush()`` only rewrites the servers
+    that actually changed.
+    """
+
+    def __init__(self, name: str, backend: "JsonBackend"):
+        self.name = name
+        self.backend = backend
+        self.dirty: Set[str] = set()
+        self.journal = None  # Set by Journal.attach()
+        self.data: Dict[str, Any] = backend.load_documents(name)
+
+    def mark_dirty(self, guild_id: str, changes: Optional[List[Tuple[list, Any]]] = None):
+        """Record that a server's data changed and needs saving.
+
+        ``changes`` (``[(path, new value), ...]``) can say exactly which
+        values changed, so the journal doesn't have to copy the whole document.
+        """
+        self.dirty.add(str(guild_id))
+        if self.journal is None:
+            return
+        if changes is None:
+            self.journal.note(self, guild_id)
+        else:
+            self.journal.change(self, guild_id, changes)
+
+    def restore(self, guild_id: str, value: Any):
+        """Put back a server's document recovered from the journal (None means it was removed)"""
+        if value is None:
+            self.data.pop(guild_id, None)
+        else:
+            self.data[guild_id] = value
+        self.dirty.add(guild_id)
+
+    def snapshot(self, guild_ids: Optional[Iterable[str]] = None) -> Dict[str, Optional[str]]:
+        """Serialize the dirty servers and clear their dirty flags.
+
+        Returns a mapping of guild ID to JSON text, or ``None`` when the server
+        was removed and its data should be deleted.
+        """
+        pending = self.dirty if guild_ids is None else self.dirty.intersection(guild_ids)
+        snapshot = {}
+        for guild_id in list(pending):
+            if guild_id in self.data:
+                snapshot[guild_id] = json.dumps(self.data[guild_id], indent=2, default=json_default)
+            else:
+                snapshot[guild_id] = None
+            self.dirty.discard(guild_id)
+        return snapshot
+
+    def write_snapshot(self, snapshot: Dict[str, Optional[str]]):
+        """Write a snapshot to storage (safe to call from a worker thread)"""
+        if snapshot:
+            self.backend.write_documents(self.name, snapshot)
+
+    def snapshot_written(self, snapshot: Dict[str, Optional[str]]):
+        """Called on the event loop once a snapshot is safely stored"""
+
+    def snapshot_failed(self, snapshot: Dict[str, Optional[str]]):
+        """Called on the event loop when writing a snapshot failed"""
+        # Keep the changes queued so the next flush retries them
+        self.dirty.update(snapshot.keys())
+
+    def flush(self, guild_ids: Optional[Iterable[str]] = None) -> int:
+        """Write the dirty servers right now and return how many were written"""
+        snapshot = self.snapshot(guild_ids)
+        self.write_snapshot(snapshot)
+        return len(snapshot)
+
+
+_ABSENT = object()
+
+
+class GuildCache(MutableMapping):
+    """``data`` of a ``LazyGuildStore``: per-server documents loaded on first access.
+
+    Loaded documents (and "not stored" answers) are kept in LRU order and the
+    least recently used clean ones are dropped once there are more than
+    ``capacity``; changed servers stay until they have been saved. Iterating
+    lists every stored server but only loads the ones actually read.
+    """
+
+    def __init__(self, store: "LazyGuildStore", capacity: int):
+        self.store = store
+        self.capacity = capacity
+        self._loaded: "collections.OrderedDict[str, Any]" = collections.OrderedDict()
+
+    def _lookup(self, guild_id: str) -> Any:
+        guild_id = str(guild_id)
+        value = self._loaded.get(guild_id, _ABSENT)
+        if guild_id in self._loaded:
+            self._loaded.move_to_end(guild_id)
+            return value
+        value = self.store.backend.load_document(self.store.name, guild_id)
+        if value is None:
+            value = _ABSENT
+        # Cached before ``on_load`` runs so it can read (and mark dirty) the document
+        self._loaded[guild_id] = value
+        if value is not _ABSENT and self.store.on_load is not None:
+            self.store.on_load(guild_id, value)
+        self._evict()
+        return value
+
+    def _evict(self):
+        """Drop the least recently used clean documents while over capacity"""
+        excess = len(self._loaded) - self.capacity
+        if excess <= 0:
+            return
+        # Never the newest one: the caller is about to use (and maybe change) it
+        newest = next(reversed(self._loaded))
+        victims = []
+        for guild_id in self._loaded:
+            if len(victims) == excess or guild_id == newest:
+                break
+            if guild_id not in self.store.dirty and guild_id not in self.store.saving:
+                victims.append(guild_id)
+        for guild_id in victims:
+            del self._loaded[guild_id]
+
+    def peek(self, guild_id: str) -> Any:
+        """A server's document if it is in memory, without loading it"""
+        value = self._loaded.get(str(guild_id), _ABSENT)
+        return None if value is _ABSENT else value
+
+    def loaded(self) -> List[str]:
+        """Servers whose documents are in memory"""
+        return [guild_id for guild_id, value in self._loaded.items() if value is not _ABSENT]
+
+    def __getitem__(self, guild_id: str) -> Any:
+        value = self._lookup(guild_id)
+        if value is _ABSENT:
+            raise KeyError(guild_id)
+        return value
+
+    def __setitem__(self, guild_id: str, value: Any):
+        self._loaded[str(guild_id)] = value
+        self._loaded.move_to_end(str(guild_id))
+        self._evict()
+
+    def __delitem__(self, guild_id: str):
+        if self._lookup(guild_id) is _ABSENT:
+            raise KeyError(guild_id)
+        # Remember it is gone so the next save deletes it instead of loading it again
+        self._loaded[str(guild_id)] = _ABSENT
+
+    def __contains__(self, guild_id: object) -> bool:
+        return self._lookup(str(guild_id)) is not _ABSENT
+
+    def __iter__(self) -> Iterator[str]:
+        stored = set(self.store.backend.document_ids(self.store.name))
+        for guild_id, value in list(self._loaded.items()):
+            if value is _ABSENT:
+                stored.discard(guild_id)
+            else:
+                stored.add(guild_id)
+        return iter(sorted(stored))
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+
+class LazyGuildStore(GuildStore):
+    """A ``GuildStore`` that only keeps recently used servers in memory.
+
+    For data that grows with history (access codes, mood counts, activity
+    counters) so startup doesn't read every server's files and memory follows
+    the servers that are active. ``on_load(guild_id, document)`` runs when a
+    server's document is read from storage, e.g. to upgrade an old format.
+    """
+
+    def __init__(self, name: str, backend: "JsonBackend", capacity: int = CACHE_SIZE,
+                 on_load: Optional[Callable[[str, Any], None]] = None):
+        self.name = name
+        self.backend = backend
+        self.dirty: Set[str] = set()
+        self.saving: Set[str] = set()  # Handed to the writer; kept in memory in case the write fails
+        self.journal = None
+        self.on_load = on_load
+        backend.migrate_legacy(name)
+        self.data: GuildCache = GuildCache(self, capacity)
+
+    def restore(self, guild_id: str, value: Any):
+        # Straight to storage, so it is loaded (and ``on_load`` runs) like any other document
+        text = None if value is None else json.dumps(value, indent=2)
+        self.backend.write_documents(self.name, {guild_id: text})
+        self.data._loaded.pop(guild_id, None)
+
+    def snapshot(self, guild_ids: Optional[Iterable[str]] = None) -> Dict[str, Optional[str]]:
+        snapshot = super().snapshot(guild_ids)
+        self.saving.update(snapshot)
+        return snapshot
+
+    def snapshot_written(self, snapshot: Dict[str, Optional[str]]):
+        self.saving.difference_update(snapshot)
+        # Servers that were kept only because they had unsaved changes can go now
+        self.data._evict()
+
+    def snapshot_failed(self, snapshot: Dict[str, Optional[str]]):
+        self.saving.difference_update(snapshot)
+        super().snapshot_failed(snapshot)
+
+    def flush(self, guild_ids: Optional[Iterable[str]] = None) -> int:
+        snapshot = self.snapshot(guild_ids)
+        try:
+            self.write_snapshot(snapshot)
+        except Exception:
+            self.snapshot_failed(snapshot)
+            raise
+        self.snapshot_written(snapshot)
+        return len(snapshot)
+
+
+class GuildLog:
+    """In-memory state of one server's log: its length and unsaved appends"""
+
+    def __init__(self, durable_count: int, base: int = 0):
+        self.durable_count = durable_count  # Entries confirmed in storage
+        self.base = base  # Storage sequence number of position 0 (moves up as old entries are purged)
+        # Entries appended but not yet stored, oldest first: (encoded line, index data)
+        self.pending: List[Tuple[bytes, Any]] = []
+        self.handed_off = 0  # How many pending entries the flusher is currently writing
+
+    def __len__(self) -> int:
+        return self.durable_count + len(self.pending)
+
+
+class BaseLogStore:
+    """Append-only per-server logs; subclasses decide where entries are kept.
+
+    Appends are buffered in memory and written by the flusher, reads are by
+    position (oldest entry is 0) and only touch the requested slice.
+
+    Stored entries are never changed in place, so a log only holds dead data
+    once old entries are dropped. Compaction is therefore the purge run for a
+    server's retention policy (``start_purge()``), which rewrites the log
+    without them; a log without a policy keeps its full history by design.
+    """
+
+    def __init__(self, name: str, time_field: str, user_field: str = "user_id"):
+        self.name = name
+        self.time_field = time_field
+        self.user_field = user_field
+        self.logs: "collections.OrderedDict[str, GuildLog]" = collections.OrderedDict()
+        self.capacity = CACHE_SIZE
+        self.dirty: Set[str] = set()
+        self.purging: Set[str] = set()  # Servers whose appends are held back while a purge rewrites the log
+        self.journal = None  # Set by Journal.attach()
+
+    def _open(self, guild_id: str) -> GuildLog:
+        raise NotImplementedError
+
+    def _count_unopened(self, guild_id: str) -> int:
+        return len(self.get(guild_id))
+
+    def _prepare(self, log: GuildLog, entry: dict, line: bytes) -> Any:
+        """Build the index data stored alongside a newly appended entry"""
+        raise NotImplementedError
+
+    def _read_durable(self, guild_id: str, log: GuildLog, start: int, stop: int) -> List[dict]:
+        raise NotImplementedError
+
+    def write_snapshot(self, snapshot: Dict[str, Tuple[int, List[Tuple[bytes, Any]]]]):
+        raise NotImplementedError
+
+    def rewrite(self, guild_id: str, entries: Iterable[dict]):
+        """Replace a server's log with ``entries``"""
+        raise NotImplementedError
+
+    def update_entries(self, guild_id: str, convert: Callable[[dict], Optional[dict]]) -> int:
+        """Replace every stored entry ``convert`` returns a new version of; returns how many changed.
+
+        Streams through the log a chunk at a time. Only for when nothing else
+        writes to the log, e.g. a script run while the bot is stopped.
+        """
+        raise NotImplementedError
+
+    def _find(self, guild_id: str, log: GuildLog, before: int, limit: int,
+              since: Optional[float], until: Optional[float], user_id: Optional[int]) -> List[int]:
+        raise NotImplementedError
+
+    def _count_before(self, guild_id: str, log: GuildLog, timestamp: float) -> int:
+        """How many stored entries are older than ``timestamp``"""
+        raise NotImplementedError
+
+    def interrupted_purges(self) -> List[str]:
+        """Servers with a purge that a restart cut short"""
+        return []
+
+    def start_purge(self, guild_id: str, drop: int) -> Optional[dict]:
+        """Get ready to drop the oldest ``drop`` entries (or resume an interrupted purge).
+
+        Returns the state to pass to ``purge_step()``, or None if the server
+        is busy and the purge should be tried later.
+        """
+        raise NotImplementedError
+
+    def purge_step(self, guild_id: str, state: dict) -> bool:
+        """Do one chunk of a purge and return True once it is complete (runs on the writer thread)"""
+        raise NotImplementedError
+
+    def purge_step_done(self, guild_id: str, state: dict):
+        """Catch up with a finished ``purge_step()`` (on the event loop)"""
+
+    def finish_purge(self, guild_id: str, state: dict):
+        """Switch over to the purged log once the last step is done"""
+        self.purging.discard(str(guild_id))
+
+    def cancel_purge(self, guild_id: str):
+        """Stop holding a server's appends back; ``start_purge()`` picks the purge up again later"""
+        self.purging.discard(str(guild_id))
+
+    def index_fields(self, entry: dict) -> Tuple[float, int]:
+        """Unix timestamp and user ID used to index an entry"""
+        timestamp = 0.0
+        try:
+            timestamp = datetime.datetime.fromisoformat(entry[self.time_field]).timestamp()
+        except (KeyError, TypeError, ValueError):
+            pass
+        try:
+            user_id = int(entry.get(self.user_field, 0))
+        except (TypeError, ValueError):
+            user_id = 0
+        return timestamp, user_id
+
+    def get(self, guild_id: str) -> GuildLog:
+        guild_id = str(guild_id)
+        log = self.logs.get(guild_id)
+        if log is None:
+            log = self._open(guild_id)
+            self.logs[guild_id] = log
+            self._evict()
+        else:
+            self.logs.move_to_end(guild_id)
+        return log
+
+    def _evict(self):
+        """Close the least recently used logs that have nothing waiting to be written"""
+        excess = len(self.logs) - self.capacity
+        if excess <= 0:
+            return
+        # Never the newest one: the caller is about to use it
+        newest = next(reversed(self.logs))
+        victims = []
+        for guild_id, log in self.logs.items():
+            if len(victims) == excess or guild_id == newest:
+                break
+            if not log.pending and guild_id not in self.purging:
+                victims.append(guild_id)
+        for guild_id in victims:
+            del self.logs[guild_id]
+
+    def append(self, guild_id: str, entry: dict):
+        """Add an entry to the end of a server's log; it is stored on the next flush"""
+        log = self.get(guild_id)
+        line = encode_entry(entry)
+        log.pending.append((line, self._prepare(log, entry, line)))
+        self.dirty.add(str(guild_id))
+        if self.journal is not None:
+            self.journal.log_append(self, guild_id, line)
+
+    def restore_appends(self, guild_id: str, lines: List[bytes]) -> int:
+        """Re-append journaled entries that never reached storage; returns how many were missing.
+
+        The log may already end with the first few of them (stored just
+        before the crash), so the longest such overlap is skipped.
+        """
+        entries = [json.loads(line) for line in lines]
+        stored = self.tail(guild_id, len(entries))
+        overlap = 0
+        for size in range(min(len(stored), len(entries)), 0, -1):
+            if stored[-size:] == entries[:size]:
+                overlap = size
+                break
+        for entry in entries[overlap:]:
+            self.append(guild_id, entry)
+        return len(entries) - overlap
+
+    def count(self, guild_id: str) -> int:
+        """Number of entries in a server's log"""
+        guild_id = str(guild_id)
+        if guild_id in self.logs:
+            return len(self.logs[guild_id])
+        return self._count_unopened(guild_id)
+
+    def read(self, guild_id: str, start: int, stop: int) -> List[dict]:
+        """Return entries ``start`` to ``stop`` (exclusive), oldest first"""
+        log = self.get(guild_id)
+        start = max(0, start)
+        stop = min(len(log), stop)
+        if start >= stop:
+            return []
+
+        entries = []
+        durable = log.durable_count
+        if start < durable:
+            entries.extend(self._read_durable(str(guild_id), log, start, min(stop, durable)))
+        for seq in range(max(start, durable), stop):
+            entries.append(json.loads(log.pending[seq - durable][0]))
+        return entries
+
+    def iter_timestamps(self, guild_id: str) -> Iterable[float]:
+        """Every entry's indexed unix timestamp in order, without parsing the entries"""
+        raise NotImplementedError
+
+    def tail(self, guild_id: str, n: int) -> List[dict]:
+        """Return the newest ``n`` entries, oldest first"""
+        total = self.count(guild_id)
+        return self.read(guild_id, total - n, total)
+
+    def find(self, guild_id: str, before: Optional[int] = None, limit: int = 10,
+             since: Optional[float] = None, until: Optional[float] = None,
+             user_id: Optional[int] = None) -> List[int]:
+        """Positions of the newest ``limit`` matching entries before position ``before``, newest first.
+
+        ``since`` and ``until`` are unix timestamps (from inclusive, until
+        exclusive); ``user_id`` matches the indexed user. Answered from the
+        index, so the cost depends on ``limit`` rather than the log's size.
+        """
+        log = self.get(guild_id)
+        if before is None or before > len(log):
+            before = len(log)
+        if limit <= 0 or before <= 0:
+            return []
+        return self._find(str(guild_id), log, before, limit, since, until, user_id)
+
+    async def index_users(self, guild_id: str, run: Callable[..., Awaitable[Any]]):
+        """Get a server's log ready for ``find(user_id=...)``, doing any slow part through ``run`` (the writer thread)"""
+
+    def read_positions(self, guild_id: str, positions: Iterable[int]) -> List[Tuple[int, dict]]:
+        """Read the entries at the given positions as ``(position, entry)`` pairs"""
+        return [(seq, entry) for seq in positions for entry in self.read(guild_id, seq, seq + 1)]
+
+    def held_back(self) -> List[Tuple[str, List[bytes]]]:
+        """Unsaved entries that flushes skip for now (servers being purged)"""
+        return [
+            (guild_id, [line for line, _ in self.logs[guild_id].pending])
+            for guild_id in self.purging
+            if guild_id in self.logs and self.logs[guild_id].pending
+        ]
+
+    def purge_target(self, guild_id: str, max_age: Optional[float] = None, max_count: Optional[int] = None) -> int:
+        """How many of the oldest stored entries a retention policy would drop.
+
+        ``max_age`` is in seconds; entries not yet stored are never counted.
+        """
+        log = self.get(guild_id)
+        drop = 0
+        if max_age is not None:
+            drop = self._count_before(str(guild_id), log, time.time() - max_age)
+        if max_count is not None:
+            drop = max(drop, len(log) - max_count)
+        return min(max(drop, 0), log.durable_count)
+
+    def iter_entries(self, guild_id: str, chunk_size: int = 500):
+        """Stream every entry of a server's log in order, a chunk at a time"""
+        total = self.count(guild_id)
+        for start in range(0, total, chunk_size):
+            yield from self.read(guild_id, start, start + chunk_size)
+
+    def snapshot(self, guild_ids: Optional[Iterable[str]] = None) -> Dict[str, Tuple[int, List[Tuple[bytes, Any]]]]:
+        """Hand the entries appended since the last flush to the writer.
+
+        Returns guild ID -> (number of entries, [(encoded line, index data), ...]).
+        """
+        pending = self.dirty if guild_ids is None else self.dirty.intersection(guild_ids)
+        snapshot = {}
+        for guild_id in list(pending):
+            if guild_id in self.purging:
+                continue  # Stays dirty until the purged log is swapped in
+            log = self.logs[guild_id]
+            items = log.pending[log.handed_off:]
+            if items:
+                snapshot[guild_id] = (len(items), items)
+                log.handed_off += len(items)
+            self.dirty.discard(guild_id)
+        return snapshot
+
+    def snapshot_written(self, snapshot: Dict[str, Tuple[int, List[Tuple[bytes, Any]]]]):
+        for guild_id, (written, _) in snapshot.items():
+            log = self.logs.get(guild_id)
+            if log is None:
+                continue
+            del log.pending[:written]
+            log.handed_off -= written
+            log.durable_count += written
+        self._evict()
+
+    def snapshot_failed(self, snapshot: Dict[str, Tuple[int, List[Tuple[bytes, Any]]]]):
+        for guild_id in snapshot:
+            log = self.logs.get(guild_id)
+            if log is not None:
+                log.handed_off = 0
+                self.dirty.add(guild_id)
+
+    def flush(self, guild_ids: Optional[Iterable[str]] = None) -> int:
+        """Store pending entries right now and return how many logs were written"""
+        snapshot = self.snapshot(guild_ids)
+        try:
+            self.write_snapshot(snapshot)
+        except Exception:
+            self.snapshot_failed(snapshot)
+            raise
+        self.snapshot_written(snapshot)
+        return len(snapshot)
+
+
+# Index record per log entry: byte offset in the .jsonl file, unix timestamp, user ID
+INDEX_RECORD = struct.Struct("<QdQ")
+
+# How much a single purge step copies (JSON logs) or deletes (SQLite) before yielding to other writes
+PURGE_CHUNK_BYTES = 4 * 1024 * 1024
+PURGE_CHUNK_ROWS = 5000
+
+
+class FileGuildLog(GuildLog):
+    """A server's log file plus its binary index, kept in memory"""
+
+    def __init__(self, log_path: str, index_path: str):
+        self.log_path = log_path
+        self.index_path = index_path
+        self.index = bytearray()
+        if os.path.exists(index_path):
+            with open(index_path, "rb") as f:
+                self.index = bytearray(f.read())
+        self.size = os.path.getsize(log_path) if os.path.exists(log_path) else 0
+        self.by_user: Optional[Dict[int, array.array]] = None  # User ID -> positions, built by index_users() or on first use
+        # While a purge runs: the log file the index above describes, kept open so reads still
+        # find it after the purged file is swapped in on the writer thread
+        self.purge_source: Optional[int] = None
+        super().__init__(len(self.index) // INDEX_RECORD.size)
+
+    def close_purge_source(self):
+        if self.purge_source is not None:
+            os.close(self.purge_source)
+            self.purge_source = None
+
+    def record(self, seq: int) -> Tuple[int, float, int]:
+        return INDEX_RECORD.unpack_from(self.index, seq * INDEX_RECORD.size)
+
+    def build_user_index(self) -> Tuple[int, Dict[int, array.array]]:
+        """User ID -> positions from one pass over the index, and how many entries that covers (thread-safe)"""
+        index = bytes(self.index)
+        by_user: Dict[int, array.array] = {}
+        for seq, (_, _, user) in enumerate(INDEX_RECORD.iter_unpack(index)):
+            by_user.setdefault(user, array.array('Q')).append(seq)
+        return len(index) // INDEX_RECORD.size, by_user
+
+    def user_positions(self, user_id: int) -> array.array:
+        """Positions of a user's entries in order, from an in-memory index built in one pass"""
+        if self.by_user is None:
+            self.by_user = self.build_user_index()[1]
+        return self.by_user.get(user_id, array.array('Q'))
+
+    def bisect_time(self, timestamp: float, lo: int, hi: int) -> int:
+        """First position in ``lo:hi`` whose timestamp is at least ``timestamp``"""
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.record(mid)[1] < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+
+class LogStore(BaseLogStore):
+    """Append-only, line-delimited JSON logs with one file per server.
+
+    Each server gets ``<guild_id>.jsonl`` holding one entry per line and a
+    ``<guild_id>.idx`` file of fixed-size index records, so appends are O(1)
+    and reading the newest entries only seeks to the end of the file. Logs are
+    opened lazily on first use, so startup never loads the history into memory.
+    """
+
+    def __init__(self, name: str, time_field: str, user_field: str = "user_id",
+                 data_dir: str = DATA_DIR, legacy_path: Optional[str] = None,
+                 owns: Callable[[str], bool] = owns_every_guild):
+        super().__init__(name, time_field, user_field)
+        self.log_dir = os.path.join(data_dir, name)
+        self.legacy_path = legacy_path if legacy_path is not None else f"{name}.json"
+        self.owns = owns
+        self.migrate()
+        self.recover()
+
+    def log_path(self, guild_id: str) -> str:
+        return os.path.join(self.log_dir, f"{guild_id}.jsonl")
+
+    def index_path(self, guild_id: str) -> str:
+        return os.path.join(self.log_dir, f"{guild_id}.idx")
+
+    def guild_ids(self) -> List[str]:
+        """Every (owned) server that has a log file"""
+        ids = set(self.logs)
+        if os.path.isdir(self.log_dir):
+            ids.update(name[:-6] for name in os.listdir(self.log_dir) if name.endswith(".jsonl") and self.owns(name[:-6]))
+        return sorted(ids)
+
+    def migrate(self):
+        """Convert the older whole-list JSON formats into append-only logs"""
+        legacy: Dict[str, List[dict]] = {}
+        if self.legacy_path and os.path.exists(self.legacy_path):
+            legacy.update(read_legacy_file(self.legacy_path))
+            os.replace(self.legacy_path, self.legacy_path + ".migrated")
+
+        shard_files = []
+        if os.path.isdir(self.log_dir):
+            shard_files = [name for name in os.listdir(self.log_dir) if name.endswith(".json") and self.owns(name[:-5])]
+        for filename in shard_files:
+            path = os.path.join(self.log_dir, filename)
+            with open(path, "r") as f:
+                legacy[filename[:-5]] = json.load(f)
+            os.replace(path, path + ".migrated")
+
+        if not legacy:
+            return
+        os.makedirs(self.log_dir, exist_ok=True)
+        for guild_id, entries in legacy.items():
+            self.rewrite(guild_id, entries)
+        print(f"Migrated {len(legacy)} {self.name} logs into {self.log_dir}/")
+
+    def _open(self, guild_id: str) -> GuildLog:
+        log = FileGuildLog(self.log_path(guild_id), self.index_path(guild_id))
+        if str(guild_id) not in self.purging and not os.path.exists(self.purge_marker_path(guild_id)):
+            self._repair(log)
+        return log
+
+    def _repair(self, log: FileGuildLog):
+        """Make a log and its index agree again after a crash while appending.
+
+        Index records pointing past the end of the log are dropped, complete
+        lines the index doesn't know about yet are indexed, and a half-written
+        last line is cut off (it is still in the journal).
+        """
+        records = len(log.index) // INDEX_RECORD.size
+        while records and log.record(records - 1)[0] >= log.size:
+            records -= 1
+        start = log.record(records - 1)[0] if records else 0
+        with open(log.log_path, "rb") if log.size else contextlib.nullcontext() as f:
+            tail = b""
+            if f is not None:
+                f.seek(start)
+                tail = f.read(log.size - start)
+
+        # Walk the lines from the last indexed one; the first of them is already indexed
+        offset = start
+        end = start
+        added = bytearray()
+        for i, line in enumerate(tail.splitlines(keepends=True)):
+            if not line.endswith(b"\n"):
+                break
+            if i > 0 or not records:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                added += INDEX_RECORD.pack(offset, *self.index_fields(entry))
+            offset += len(line)
+            end = offset
+        if records and end == start:
+            records -= 1  # The last indexed line itself was only partly written
+
+        if records * INDEX_RECORD.size != len(log.index) or added:
+            del log.index[records * INDEX_RECORD.size:]
+            log.index += added
+            write_file_atomic(log.index_path, bytes(log.index))
+            log.durable_count = len(log.index) // INDEX_RECORD.size
+            print(f"Repaired index {log.index_path} ({log.durable_count} entries)")
+        if end != log.size:
+            with open(log.log_path, "r+b") as f:
+                f.truncate(end)
+            print(f"Cut {log.size - end} half-written bytes from the end of {log.log_path}")
+            log.size = end
+
+    def _count_unopened(self, guild_id: str) -> int:
+        # Answer from the index size without loading it
+        index_path = self.index_path(guild_id)
+        if not os.path.exists(index_path):
+            # A log whose index was lost is re-indexed when opened
+            return len(self.get(guild_id)) if os.path.exists(self.log_path(guild_id)) else 0
+        return os.path.getsize(index_path) // INDEX_RECORD.size
+
+    def _prepare(self, log: FileGuildLog, entry: dict, line: bytes) -> bytes:
+        timestamp, user_id = self.index_fields(entry)
+        record = INDEX_RECORD.pack(log.size, timestamp, user_id)
+        if log.by_user is not None:
+            log.by_user.setdefault(user_id, array.array('Q')).append(len(log.index) // INDEX_RECORD.size)
+        log.index += record
+        log.size += len(line)
+        return record
+
+    def iter_timestamps(self, guild_id: str) -> Iterable[float]:
+        for _, timestamp, _ in INDEX_RECORD.iter_unpack(bytes(self.get(guild_id).index)):
+            yield timestamp
+
+    def _find(self, guild_id: str, log: FileGuildLog, before: int, limit: int,
+              since: Optional[float], until: Optional[float], user_id: Optional[int]) -> List[int]:
+        # Entries are appended in time order, so a date range is a run of positions found by bisection
+        start = 0 if since is None else log.bisect_time(since, 0, before)
+        if until is not None:
+            before = log.bisect_time(until, start, before)
+        if user_id is None:
+            return list(range(before - 1, max(start, before - limit) - 1, -1))
+        positions = log.user_positions(user_id)
+        hi = bisect.bisect_left(positions, before)
+        lo = max(bisect.bisect_left(positions, start), hi - limit)
+        return positions[lo:hi].tolist()[::-1]
+
+    def _count_before(self, guild_id: str, log: FileGuildLog, timestamp: float) -> int:
+        return log.bisect_time(timestamp, 0, log.durable_count)
+
+    async def index_users(self, guild_id: str, run: Callable[..., Awaitable[Any]]):
+        # The pass over the whole index runs through ``run``; entries appended meanwhile are added after
+        log = self.get(guild_id)
+        if log.by_user is not None:
+            return
+        covered, by_user = await run(log.build_user_index)
+        if log.by_user is not None or self.logs.get(str(guild_id)) is not log:
+            return  # Built meanwhile, or reopened after a purge moved every position
+        for seq in range(covered, len(log.index) // INDEX_RECORD.size):
+            by_user.setdefault(log.record(seq)[2], array.array('Q')).append(seq)
+        log.by_user = by_user
+
+    def purge_marker_path(self, guild_id: str) -> str:
+        return os.path.join(self.log_dir, f"{guild_id}.purge.json")
+
+    def interrupted_purges(self) -> List[str]:
+        if not os.path.isdir(self.log_dir):
+            return []
+        guild_ids = [name[:-len(".purge.json")] for name in os.listdir(self.log_dir) if name.endswith(".purge.json")]
+        return [guild_id for guild_id in guild_ids if self.owns(guild_id)]
+
+    def start_purge(self, guild_id: str, drop: int) -> Optional[dict]:
+        """Start copying the kept entries to a new log, or pick up a purge interrupted by a restart.
+
+        A marker file records the purge so it survives restarts: while it
+        says ``copy`` the new file is simply extended from where it stopped,
+        once it says ``swap`` the new files are complete and only need moving
+        into place.
+        """
+        guild_id = str(guild_id)
+        log = self.get(guild_id)
+        if log.handed_off:
+            return None  # Wait for the write in flight
+        marker_path = self.purge_marker_path(guild_id)
+        if os.path.exists(marker_path):
+            with open(marker_path, "r") as f:
+                state = json.load(f)
+        else:
+            drop = min(drop, log.durable_count)
+            durable_size = log.size - sum(len(line) for line, _ in log.pending)
+            start = log.record(drop)[0] if drop < log.durable_count else durable_size
+            state = {"drop": drop, "start": start, "phase": "copy"}
+            open(self.log_path(guild_id) + ".purge", "wb").close()
+            with open(marker_path, "w") as f:
+                json.dump(state, f)
+        if log.purge_source is None and os.path.exists(log.log_path):
+            log.purge_source = os.open(log.log_path, os.O_RDONLY)
+        self.purging.add(guild_id)
+        return state
+
+    def purge_step(self, guild_id: str, state: dict) -> bool:
+        """Copy the next chunk of kept entries into the new log; swap it in after the last one"""
+        log_path = self.log_path(guild_id)
+        index_path = self.index_path(guild_id)
+        marker_path = self.purge_marker_path(guild_id)
+        if state["phase"] == "copy":
+            with open(log_path, "rb") as src, open(log_path + ".purge", "ab") as dst:
+                src.seek(state["start"] + dst.tell())
+                chunk = src.read(PURGE_CHUNK_BYTES)
+                dst.write(chunk)
+            if chunk:
+                return False
+
+            # Everything is copied: move the kept index records to their new offsets
+            with open(index_path, "rb") as src, open(index_path + ".purge", "wb") as dst:
+                src.seek(state["drop"] * INDEX_RECORD.size)
+                while block := src.read(INDEX_RECORD.size * 65536):
+                    dst.write(b"".join(
+                        INDEX_RECORD.pack(offset - state["start"], timestamp, user_id)
+                        for offset, timestamp, user_id in INDEX_RECORD.iter_unpack(block)
+                    ))
+                dst.flush()
+                os.fsync(dst.fileno())
+            with open(log_path + ".purge", "ab") as f:
+                os.fsync(f.fileno())
+            # From here on the purge can only be finished, never redone
+            state["phase"] = "swap"
+            write_file_atomic(marker_path, json.dumps(state).encode())
+
+        self._swap_purged(guild_id)
+        return True
+
+    def _swap_purged(self, guild_id: str):
+        """Move a finished purge's files into place (safe to repeat after a crash)"""
+        for path in (self.index_path(guild_id), self.log_path(guild_id)):
+            if os.path.exists(path + ".purge"):
+                os.replace(path + ".purge", path)
+        os.remove(self.purge_marker_path(guild_id))
+        fsync_dir(self.log_dir)
+
+    def recover(self):
+        """Finish purges that crashed while swapping files, then make every log agree with its index"""
+        for guild_id in self.interrupted_purges():
+            with open(self.purge_marker_path(guild_id), "r") as f:
+                phase = json.load(f).get("phase")
+            if phase == "swap":
+                self._swap_purged(guild_id)
+
+    def finish_purge(self, guild_id: str, state: dict):
+        # Reopen from the new files and re-index the entries appended meanwhile against them
+        guild_id = str(guild_id)
+        old = self.logs.pop(guild_id, None)
+        self.purging.discard(guild_id)
+        if old is not None:
+            old.close_purge_source()
+        if old is not None and old.pending:
+            log = self.get(guild_id)
+            for line, _ in old.pending:
+                log.pending.append((line, self._prepare(log, json.loads(line), line)))
+            self.dirty.add(guild_id)
+
+    def cancel_purge(self, guild_id: str):
+        super().cancel_purge(guild_id)
+        log = self.logs.get(str(guild_id))
+        if log is not None:
+            log.close_purge_source()
+
+    def _read_durable(self, guild_id: str, log: FileGuildLog, start: int, stop: int) -> List[dict]:
+        begin = log.record(start)[0]
+        end = log.record(stop)[0] if stop < len(log) else log.size
+        if log.purge_source is not None:
+            chunk = os.pread(log.purge_source, end - begin, begin)
+        else:
+            with open(log.log_path, "rb") as f:
+                f.seek(begin)
+                chunk = f.read(end - begin)
+        return [json.loads(line) for line in chunk.splitlines() if line]
+
+    def write_snapshot(self, snapshot: Dict[str, Tuple[int, List[Tuple[bytes, bytes]]]]):
+        """Append a snapshot to the log files (safe to call from a worker thread)"""
+        if not snapshot:
+            return
+        os.makedirs(self.log_dir, exist_ok=True)
+        for guild_id, (_, items) in snapshot.items():
+            # Lines first, then the index, so a crash in between only leaves lines that _repair() cuts off
+            with open(self.log_path(guild_id), "ab") as f:
+                f.write(b"".join(line for line, _ in items))
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self.index_path(guild_id), "ab") as f:
+                f.write(b"".join(record for _, record in items))
+                f.flush()
+                os.fsync(f.fileno())
+
+    def update_entries(self, guild_id: str, convert: Callable[[dict], Optional[dict]]) -> int:
+        # The new file is written beside the old one, which is read until it is swapped out
+        changed = 0
+
+        def entries():
+            nonlocal changed
+            for entry in self.iter_entries(guild_id):
+                replacement = convert(entry)
+                if replacement is not None:
+                    changed += 1
+                yield entry if replacement is None else replacement
+
+        self.rewrite(guild_id, entries())
+        return changed
+
+    def rewrite(self, guild_id: str, entries: Iterable[dict]):
+        """Replace a server's log with ``entries``, rebuilding its index.
+
+        Used for migration; the new files are written beside
+        the old ones and swapped in so a crash never leaves a half-written log.
+        """
+        guild_id = str(guild_id)
+        os.makedirs(self.log_dir, exist_ok=True)
+        log_path = self.log_path(guild_id)
+        index_path = self.index_path(guild_id)
+        offset = 0
+        with open(log_path + ".tmp", "wb") as log_file, open(index_path + ".tmp", "wb") as index_file:
+            for entry in entries:
+                line = encode_entry(entry)
+                index_file.write(INDEX_RECORD.pack(offset, *self.index_fields(entry)))
+                log_file.write(line)
+                offset += len(line)
+            for f in (log_file, index_file):
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(log_path + ".tmp", log_path)
+        os.replace(index_path + ".tmp", index_path)
+        fsync_dir(self.log_dir)
+        self.logs.pop(guild_id, None)
+        self.dirty.discard(guild_id)
+
+
+class SqliteLogStore(BaseLogStore):
+    """Append-only per-server logs kept in the SQLite ``logs`` table.
+
+    Entries are numbered per server from 0 (``seq``), so reading a slice is a
+    primary-key range query; timestamp and user ID columns are indexed.
+    Only the process that owns a server writes its log, so appended entries
+    are numbered when they are added and stored under those numbers.
+    """
+
+    def __init__(self, name: str, time_field: str, backend: "SqliteBackend", user_field: str = "user_id"):
+        super().__init__(name, time_field, user_field)
+        self.backend = backend
+
+    def guild_ids(self) -> List[str]:
+        """Every server that has log entries"""
+        with self.backend.reading() as conn:
+            rows = conn.execute(
+                "SELECT DISTINCT guild_id FROM logs WHERE store = ?", (self.name,)
+            ).fetchall()
+        return sorted(set(self.logs) | {row[0] for row in rows if self.backend.owns(row[0])})
+
+    def _open(self, guild_id: str) -> GuildLog:
+        with self.backend.reading() as conn:
+            row = conn.execute(
+                "SELECT COUNT(*), MIN(seq) FROM logs WHERE store = ? AND guild_id = ?", (self.name, guild_id)
+            ).fetchone()
+        return GuildLog(row[0], row[1] or 0)
+
+    def _prepare(self, log: GuildLog, entry: dict, line: bytes) -> Tuple[int, float, int]:
+        return (log.base + len(log), *self.index_fields(entry))
+
+    def iter_timestamps(self, guild_id: str) -> Iterable[float]:
+        log = self.get(guild_id)
+        with self.backend.reading() as conn:
+            rows = conn.execute(
+                "SELECT timestamp FROM logs WHERE store = ? AND guild_id = ? AND seq >= ? AND seq < ? ORDER BY seq",
+                (self.name, str(guild_id), log.base, log.base + log.durable_count),
+            ).fetchall()
+        for row in rows:
+            yield row[0]
+        for _, (_, timestamp, _) in list(log.pending):
+            yield timestamp
+
+    def _find(self, guild_id: str, log: GuildLog, before: int, limit: int,
+              since: Optional[float], until: Optional[float], user_id: Optional[int]) -> List[int]:
+        def matches(timestamp: float, user: int) -> bool:
+            return ((since is None or timestamp >= since) and (until is None or timestamp < until)
+                    and (user_id is None or user == user_id))
+
+        # Unsaved entries are the newest, so look at them first
+        positions = [
+            seq - log.base for _, (seq, timestamp, user) in reversed(log.pending)
+            if seq - log.base < before and matches(timestamp, user)
+        ][:limit]
+        if len(positions) == limit:
+            return positions
+
+        clauses = "store = ? AND guild_id = ? AND seq < ?"
+        params: List[Any] = [self.name, guild_id, log.base + min(before, log.durable_count)]
+        if since is not None:
+            clauses += " AND timestamp >= ?"
+            params.append(since)
+        if until is not None:
+            clauses += " AND timestamp < ?"
+            params.append(until)
+        if user_id is not None:
+            clauses += " AND user_id = ?"
+            params.append(user_id)
+        params.append(limit - len(positions))
+        with self.backend.reading() as conn:
+            rows = conn.execute(
+                f"SELECT seq FROM logs WHERE {clauses} ORDER BY seq DESC LIMIT ?", params
+            ).fetchall()
+        return positions + [row[0] - log.base for row in rows]
+
+    def _count_before(self, guild_id: str, log: GuildLog, timestamp: float) -> int:
+        with self.backend.reading() as conn:
+            row = conn.execute(
+                "SELECT COUNT(*) FROM logs WHERE store = ? AND guild_id = ? AND timestamp < ? AND seq < ?",
+                (self.name, guild_id, timestamp, log.base + log.durable_count),
+            ).fetchone()
+        return row[0]
+
+    def start_purge(self, guild_id: str, drop: int) -> Optional[dict]:
+        # Appends carry their own sequence numbers, so nothing has to be held back. Every chunk
+        # is committed on its own and the policy is simply applied again after a restart.
+        log = self.get(guild_id)
+        return {"drop": drop, "until": log.base + min(drop, log.durable_count), "next": log.base}
+
+    def purge_step(self, guild_id: str, state: dict) -> bool:
+        """Delete the next chunk of purged rows in its own short transaction"""
+        stop = max(state["next"], min(state["until"], state["next"] + PURGE_CHUNK_ROWS))
+        with self.backend.transaction() as conn:
+            conn.execute(
+                "DELETE FROM logs WHERE store = ? AND guild_id = ? AND seq >= ? AND seq < ?",
+                (self.name, str(guild_id), state["next"], stop),
+            )
+        state["next"] = stop
+        return stop >= state["until"]
+
+    def purge_step_done(self, guild_id: str, state: dict):
+        log = self.logs.get(str(guild_id))
+        if log is not None and state["next"] > log.base:
+            log.durable_count -= state["next"] - log.base
+            log.base = state["next"]
+
+    def _read_durable(self, guild_id: str, log: GuildLog, start: int, stop: int) -> List[dict]:
+        with self.backend.reading() as conn:
+            rows = conn.execute(
+                "SELECT entry FROM logs WHERE store = ? AND guild_id = ? AND seq >= ? AND seq < ? ORDER BY seq",
+                (self.name, guild_id, log.base + start, log.base + stop),
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def write_snapshot(self, snapshot: Dict[str, Tuple[int, List[Tuple[bytes, Tuple[int, float, int]]]]]):
+        """Insert a snapshot's entries (safe to call from a worker thread)"""
+        if not snapshot:
+            return
+        rows = [
+            (self.name, guild_id, seq, timestamp, user_id, line.decode().rstrip("\n"))
+            for guild_id, (_, items) in snapshot.items()
+            for line, (seq, timestamp, user_id) in items
+        ]
+        with self.backend.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO logs (store, guild_id, seq, timestamp, user_id, entry) VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def update_entries(self, guild_id: str, convert: Callable[[dict], Optional[dict]]) -> int:
+        # Updated in place, one short transaction per chunk
+        guild_id = str(guild_id)
+        log = self.get(guild_id)
+        changed = 0
+        for start in range(0, log.durable_count, PURGE_CHUNK_ROWS):
+            rows = []
+            for seq, entry in enumerate(self.read(guild_id, start, start + PURGE_CHUNK_ROWS), log.base + start):
+                replacement = convert(entry)
+                if replacement is not None:
+                    line = encode_entry(replacement).decode().rstrip("\n")
+                    rows.append((line, *self.index_fields(replacement), self.name, guild_id, seq))
+            if rows:
+                with self.backend.transaction() as conn:
+                    conn.executemany(
+                        "UPDATE logs SET entry = ?, timestamp = ?, user_id = ? WHERE store = ? AND guild_id = ? AND seq = ?",
+                        rows,
+                    )
+                changed += len(rows)
+        return changed
+
+    def rewrite(self, guild_id: str, entries: Iterable[dict]):
+        """Replace a server's log with ``entries`` in one transaction"""
+        guild_id = str(guild_id)
+        rows = (
+            (self.name, guild_id, seq, *self.index_fields(entry), encode_entry(entry).decode().rstrip("\n"))
+            for seq, entry in enumerate(entries)
+        )
+        with self.backend.transaction() as conn:
+            conn.execute("DELETE FROM logs WHERE store = ? AND guild_id = ?", (self.name, guild_id))
+            conn.executemany(
+                "INSERT INTO logs (store, guild_id, seq, timestamp, user_id, entry) VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        self.logs.pop(guild_id, None)
+        self.dirty.discard(guild_id)
+
+
+class JsonBackend:
+    """Plain files under ``data_dir``: one JSON file per server per store.
+
+    Single-file data from older versions (``settings.json`` etc. in
+    ``legacy_dir``) is imported the first time each store is opened; a
+    ``legacy_dir`` of None skips that.
+    """
+
+    def __init__(self, data_dir: str = DATA_DIR, legacy_dir: Optional[str] = ".",
+                 owns: Callable[[str], bool] = owns_every_guild):
+        self.data_dir = data_dir
+        self.legacy_dir = legacy_dir
+        self.owns = owns
+
+    def shard_path(self, name: str, guild_id: str) -> str:
+        return os.path.join(self.data_dir, name, f"{guild_id}.json")
+
+    def migrate_legacy(self, name: str):
+        """Split the old single-file format into server shards (existing shards win)"""
+        # Old installs kept everything for this store in one big file
+        if self.legacy_dir is None:
+            return
+        legacy_path = os.path.join(self.legacy_dir, f"{name}.json")
+        if not os.path.exists(legacy_path):
+            return
+        legacy = read_legacy_file(legacy_path)
+        self.write_documents(name, {
+            guild_id: json.dumps(value, indent=2)
+            for guild_id, value in legacy.items()
+            if not os.path.exists(self.shard_path(name, guild_id))
+        })
+        os.replace(legacy_path, legacy_path + ".migrated")
+        print(f"Migrated {legacy_path} into {os.path.join(self.data_dir, name)}/")
+
+    def document_ids(self, name: str) -> List[str]:
+        shard_dir = os.path.join(self.data_dir, name)
+        if not os.path.isdir(shard_dir):
+            return []
+        return [filename[:-5] for filename in os.listdir(shard_dir) if filename.endswith(".json") and self.owns(filename[:-5])]
+
+    def load_document(self, name: str, guild_id: str) -> Optional[Any]:
+        """One server's document, or None if it has none"""
+        path = self.shard_path(name, guild_id)
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            # Written in place by an older version and cut off by a crash; the journal may still have it
+            os.replace(path, path + ".corrupt")
+            print(f"⚠️ {path} was damaged and has been moved to {path}.corrupt")
+            return None
+
+    def load_documents(self, name: str) -> Dict[str, Any]:
+        """Load every server shard, importing the old single-file format once"""
+        self.migrate_legacy(name)
+        documents = {guild_id: self.load_document(name, guild_id) for guild_id in self.document_ids(name)}
+        return {guild_id: value for guild_id, value in documents.items() if value is not None}
+
+    def write_documents(self, name: str, snapshot: Dict[str, Optional[str]]):
+        shard_dir = os.path.join(self.data_dir, name)
+        os.makedirs(shard_dir, exist_ok=True)
+        for guild_id, text in snapshot.items():
+            path = self.shard_path(name, guild_id)
+            if text is None:
+                if os.path.exists(path):
+                    os.remove(path)
+                continue
+            # Write next to the real file and swap it in so a crash never leaves half a file
+            write_file_atomic(path, text.encode())
+        if snapshot:
+            fsync_dir(shard_dir)
+
+    def document_store(self, name: str) -> GuildStore:
+        return GuildStore(name, self)
+
+    def lazy_document_store(self, name: str, on_load: Optional[Callable[[str, Any], None]] = None) -> LazyGuildStore:
+        return LazyGuildStore(name, self, on_load=on_load)
+
+    def log_store(self, name: str, time_field: str, user_field: str = "user_id") -> LogStore:
+        legacy_path = os.path.join(self.legacy_dir, f"{name}.json") if self.legacy_dir is not None else ""
+        return LogStore(name, time_field, user_field, data_dir=self.data_dir, legacy_path=legacy_path, owns=self.owns)
+
+    def transaction(self):
+        """Files are written one by one; there is nothing to group"""
+        return contextlib.nullcontext()
+
+    def close(self):
+        pass
+
+
+class SqliteBackend:
+    """Every store in one SQLite database running in WAL mode.
+
+    Writes go through one connection, used by the flusher's worker thread
+    under ``lock``; reads (mostly from the event loop) use a second, read-only
+    connection under ``read_lock``. WAL lets that one read the last committed
+    state while a write is in progress or waiting for another process, so a
+    slow or blocked write never holds up the event loop. Each flush runs as a
+    single transaction, so related changes - like a used access code and the
+    moderator access entry it created - are stored together or not at all.
+
+    Several shard processes can use the same database: each only writes the
+    servers it owns, and writes take SQLite's write lock up front (waiting up
+    to ``busy_timeout`` seconds for another process's transaction).
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS documents (
+            store TEXT NOT NULL,
+            guild_id TEXT NOT NULL,
+            value TEXT NOT NULL,
+            PRIMARY KEY (store, guild_id)
+        );
+        CREATE TABLE IF NOT EXISTS logs (
+            store TEXT NOT NULL,
+            guild_id TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            timestamp REAL NOT NULL,
+            user_id INTEGER NOT NULL,
+            entry TEXT NOT NULL,
+            PRIMARY KEY (store, guild_id, seq)
+        );
+        CREATE INDEX IF NOT EXISTS logs_by_time ON logs (store, guild_id, timestamp);
+        CREATE INDEX IF NOT EXISTS logs_by_user ON logs (store, guild_id, user_id, seq);
+    """
+
+    def __init__(self, path: str, owns: Callable[[str], bool] = owns_every_guild, busy_timeout: float = 30.0):
+        self.path = path
+        self.owns = owns
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=busy_timeout)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+        self.lock = threading.RLock()
+        self._depth = 0
+        self.read_conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=busy_timeout)
+        self.read_conn.execute("PRAGMA query_only=ON")
+        self.read_lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def reading(self):
+        """The read-only connection; it only sees committed writes"""
+        with self.read_lock:
+            yield self.read_conn
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Run the enclosed writes as one transaction (nested calls join the outer one)"""
+        with self.lock:
+            if self._depth == 0:
+                self.conn.execute("BEGIN IMMEDIATE")
+            self._depth += 1
+            try:
+                yield self.conn
+            except BaseException:
+                self._depth -= 1
+                if self._depth == 0:
+                    self.conn.execute("ROLLBACK")
+                raise
+            self._depth -= 1
+            if self._depth == 0:
+                self.conn.execute("COMMIT")
+
+    def migrate_legacy(self, name: str):
+        """JSON data is copied over with migrate_to_sqlite.py instead"""
+
+    def document_ids(self, name: str) -> List[str]:
+        with self.reading() as conn:
+            rows = conn.execute("SELECT guild_id FROM documents WHERE store = ?", (name,)).fetchall()
+        return [row[0] for row in rows if self.owns(row[0])]
+
+    def load_document(self, name: str, guild_id: str) -> Optional[Any]:
+        with self.reading() as conn:
+            row = conn.execute(
+                "SELECT value FROM documents WHERE store = ? AND guild_id = ?", (name, guild_id)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def load_documents(self, name: str) -> Dict[str, Any]:
+        with self.reading() as conn:
+            rows = conn.execute("SELECT guild_id, value FROM documents WHERE store = ?", (name,)).fetchall()
+        return {guild_id: json.loads(value) for guild_id, value in rows if self.owns(guild_id)}
+
+    def write_documents(self, name: str, snapshot: Dict[str, Optional[str]]):
+        with self.transaction() as conn:
+            for guild_id, text in snapshot.items():
+                if text is None:
+                    conn.execute("DELETE FROM documents WHERE store = ? AND guild_id = ?", (name, guild_id))
+                else:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO documents (store, guild_id, value) VALUES (?, ?, ?)",
+                        (name, guild_id, text),
+                    )
+
+    def document_store(self, name: str) -> GuildStore:
+        return GuildStore(name, self)
+
+    def lazy_document_store(self, name: str, on_load: Optional[Callable[[str, Any], None]] = None) -> LazyGuildStore:
+        return LazyGuildStore(name, self, on_load=on_load)
+
+    def log_store(self, name: str, time_field: str, user_field: str = "user_id") -> SqliteLogStore:
+        return SqliteLogStore(name, time_field, self, user_field)
+
+    def close(self):
+        with self.reading():
+            self.read_conn.close()
+        with self.lock:
+            self.conn.close()
+
+
+def open_backend(owns: Callable[[str], bool] = owns_every_guild, import_legacy: bool = True):
+    """Create the storage backend chosen by the ``STORAGE_BACKEND`` environment variable.
+
+    ``owns`` limits it to this process's servers; ``import_legacy`` is turned
+    off in all but one process so old single-file data is imported only once.
+    """
+    kind = os.getenv("STORAGE_BACKEND", "json").lower()
+    if kind == "sqlite":
+        return SqliteBackend(os.getenv("SQLITE_PATH", os.path.join(DATA_DIR, "bot.db")), owns=owns,
+                             busy_timeout=float(os.getenv("SQLITE_BUSY_TIMEOUT", "30")))
+    if kind != "json":
+        raise ValueError(f"Unknown STORAGE_BACKEND {kind!r} (expected 'json' or 'sqlite')")
+    return JsonBackend(DATA_DIR, legacy_dir="." if import_legacy else None, owns=owns)
+
+
+class WriteBehindFlusher:
+    """Saves dirty stores from a background task instead of inside event handlers.
+
+    ``request_flush()`` is cheap and can be called after every mutation; bursts
+    of requests inside ``interval`` seconds are coalesced into one write, and the
+    I/O runs on a single worker thread so the event loop never blocks on disk.
+    """
+
+    def __init__(self, stores: List[Any], backend: Any, interval: float = 5.0, journal: Any = None):
+        self.stores = stores
+        self.backend = backend
+        self.interval = interval
+        self.journal = journal
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="store-flush")
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Start the background flush task on the running event loop"""
+        if self.running:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    def request_flush(self):
+        """Ask for the dirty stores to be written soon"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            # Let more changes pile up so a burst costs one write per server
+            await asyncio.sleep(self.interval)
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Error flushing data to disk: {e}")
+
+    def _rotate_journal(self) -> Optional[int]:
+        """Start a new journal segment for changes made after this flush's snapshots"""
+        if self.journal is None:
+            return None
+        carry = [
+            (store, guild_id, lines)
+            for store in self.stores if hasattr(store, "held_back")
+            for guild_id, lines in store.held_back()
+        ]
+        return self.journal.rotate(carry)
+
+    async def flush(self):
+        """Snapshot every dirty store and write it on the worker thread"""
+        segment = self._rotate_journal()
+        snapshots = [(store, store.snapshot()) for store in self.stores]
+        snapshots = [(store, snapshot) for store, snapshot in snapshots if snapshot]
+        if snapshots:
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(self._executor, self._write_all, snapshots)
+            except Exception:
+                for store, snapshot in snapshots:
+                    store.snapshot_failed(snapshot)
+                raise
+            for store, snapshot in snapshots:
+                store.snapshot_written(snapshot)
+        # Everything journaled before the snapshots is stored now
+        if segment is not None:
+            self.journal.release(segment)
+
+    def flush_now(self):
+        """Write every dirty store right away on the calling thread (when the loop isn't running)"""
+        segment = self._rotate_journal()
+        snapshots = [(store, store.snapshot()) for store in self.stores]
+        snapshots = [(store, snapshot) for store, snapshot in snapshots if snapshot]
+        try:
+            self._write_all(snapshots)
+        except Exception:
+            for store, snapshot in snapshots:
+                store.snapshot_failed(snapshot)
+            raise
+        for store, snapshot in snapshots:
+            store.snapshot_written(snapshot)
+        if segment is not None:
+            self.journal.release(segment)
+
+    async def run(self, func: Callable, *args) -> Any:
+        """Run ``func`` on the writer thread, in turn with the flushes"""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _write_all(self, snapshots):
+        with self.backend.transaction():
+            for store, snapshot in snapshots:
+                store.write_snapshot(snapshot)
+
+    async def close(self):
+        """Stop the background task and write anything still pending"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        self._executor.shutdown(wait=True)
+        if self.journal is not None:
+            self.journal.close()